@@ -0,0 +1,182 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+import yaml
+from metrics import get_batch_portfolio_stats
+from pipeline import (PortfolioConfig, load_returns, load_weights)
+from sweep import expand_grid
+from walk_forward import get_rebalance_dates
+
+
+def get_rebalance_days(index, frequency):
+    """
+    Boolean numpy.ndarray, True on the days a 'frequency' calendar rebalance
+    is due: every day for 'daily', the first trading day of each period for
+    'monthly', 'quarterly' or 'annually', and never for None.
+    """
+    due = np.zeros(len(index), dtype=bool)
+    if frequency == 'daily':
+        due[:] = True
+    elif frequency:
+        due[get_rebalance_dates(index, frequency, 0)] = True
+    return due
+
+
+def get_ticker_costs(tickers, costs):
+    """
+    Cost of trading each ticker, as a fraction of the value traded, from
+    'costs' in basis points: one number for every ticker, or a dict of
+    ticker -> basis points with an optional 'default' for the others.
+    """
+    if isinstance(costs, dict):
+        return np.array([costs.get(ticker, costs.get('default', 0)) for ticker in tickers]) / 1e4
+    return np.full(len(tickers), costs or 0) / 1e4
+
+
+def run_backtest(daily_simple_returns, target_weights, scenarios):
+    """
+    Simulates holding the target weights as the holdings drift with the
+    returns, rebalancing back to target at the close of a day when its
+    calendar rebalance is due or any weight has drifted more than the band
+    from its target, and paying each ticker's cost on the value traded.
+    Every scenario is simulated together, one day at a time.
+
+    Inputs:
+    - 'daily_simple_returns' DataFrame, T days x tickers
+    - 'target_weights': Series of ticker -> weight, or a DataFrame with one
+        row of ticker weights per scenario
+    - 'scenarios': list of dicts, each with any of
+        - 'band': largest allowed absolute gap between a weight and its
+            target (e.g. 0.05, or 0 to rebalance on any drift), None for no
+            band
+        - 'frequency': 'daily', 'monthly', 'quarterly', 'annually' or None
+        - 'costs': basis points, see get_ticker_costs()
+        - 'name': default is the scenario's position
+
+    Outputs:
+    - dict of DataFrames, T days x scenarios: 'simple_returns' (after
+        costs), 'gross_simple_returns' (before costs), 'turnover' (sum of
+        the absolute changes in weight, so 2 for selling everything and
+        buying something else) and 'costs' (fraction of the value paid)
+    """
+    tickers = list(target_weights.columns if isinstance(target_weights, pd.DataFrame)
+                   else target_weights.index)
+    names = [scenario.get('name', i) for i, scenario in enumerate(scenarios)]
+    targets = np.broadcast_to(np.asarray(target_weights, dtype=float),
+                              (len(scenarios), len(tickers)))
+    bands = np.array([np.inf if scenario.get('band') is None else scenario['band']
+                      for scenario in scenarios])
+    costs = np.array([get_ticker_costs(tickers, scenario.get('costs'))
+                      for scenario in scenarios])
+    due = np.column_stack([get_rebalance_days(daily_simple_returns.index,
+                                              scenario.get('frequency'))
+                           for scenario in scenarios])
+    R = daily_simple_returns[tickers].to_numpy()
+
+    n_days = len(R)
+    gross = np.empty((n_days, len(scenarios)))
+    turnover = np.zeros((n_days, len(scenarios)))
+    paid = np.zeros((n_days, len(scenarios)))
+    weights = targets.copy()
+    for t in range(n_days):
+        holdings = weights * (1 + R[t])
+        value = holdings.sum(axis=1)
+        gross[t] = value - 1
+        weights = holdings / value[:, np.newaxis]
+        rebalance = due[t] | (np.abs(weights - targets).max(axis=1) > bands)
+        if rebalance.any():
+            trades = np.abs(targets[rebalance] - weights[rebalance])
+            turnover[t, rebalance] = trades.sum(axis=1)
+            paid[t, rebalance] = (trades * costs[rebalance]).sum(axis=1)
+            weights[rebalance] = targets[rebalance]
+    net = (1 + gross) * (1 - paid) - 1
+    index = daily_simple_returns.index
+    return {'simple_returns': pd.DataFrame(net, index=index, columns=names),
+            'gross_simple_returns': pd.DataFrame(gross, index=index, columns=names),
+            'turnover': pd.DataFrame(turnover, index=index, columns=names),
+            'costs': pd.DataFrame(paid, index=index, columns=names)}
+
+
+def get_backtest_stats(backtest, benchmark_simple_returns=None):
+    """
+    Inputs:
+    - 'backtest': dict from run_backtest()
+    - 'benchmark_simple_returns' DataFrame, or None for no benchmark row
+
+    Outputs:
+    - DataFrame with a row per scenario and one for the 'benchmark', with
+        the 'annual_return', 'max_drawdown' and 'return_risk_ratio' of
+        get_portfolio_stats(), plus the 'annual_turnover', the number of
+        'rebalances' and the 'cost_drag' (annual return lost to costs)
+    """
+    simple_returns = backtest['simple_returns']
+    stats = get_batch_portfolio_stats(simple_returns)
+    gross_stats = get_batch_portfolio_stats(backtest['gross_simple_returns'])
+    num_years = float((simple_returns.index[-1] - simple_returns.index[0]).days) / 365
+    stats['annual_turnover'] = backtest['turnover'].sum() / num_years
+    stats['rebalances'] = (backtest['turnover'] > 0).sum()
+    stats['cost_drag'] = gross_stats['annual_return'] - stats['annual_return']
+    if benchmark_simple_returns is None:
+        return stats
+    # compare against the benchmark over the same period
+    benchmark = benchmark_simple_returns.loc[benchmark_simple_returns.index >= simple_returns.index[0]]
+    benchmark_stats = get_batch_portfolio_stats(
+        benchmark.rename(columns={benchmark.columns[0]: 'benchmark'}))
+    return pd.concat([stats, benchmark_stats], sort=False)
+
+
+def run_backtests(config, scenarios, daily_log_returns=None, benchmark_simple_returns=None,
+                  final_ticker_weights=None):
+    """
+    Backtests the portfolio's final ticker weights under each of the
+    'scenarios' (see run_backtest()), by default from the returns and weights
+    saved by the pipeline, and saves the stats in RESULTS_PATH as
+    <PORTFOLIO_NAME>-backtest-performance_stats.csv.
+
+    The targets are always the final ticker weights estimated from the full
+    history, even when REBALANCE_FREQUENCY is set: the walk-forward weights
+    aren't backtested here.
+    """
+    if daily_log_returns is None:
+        daily_log_returns, benchmark_simple_returns = load_returns(config)
+    if final_ticker_weights is None:
+        final_ticker_weights, _ = load_weights(config)
+    target_weights = final_ticker_weights.set_index('ticker')['weight']
+    daily_simple_returns = np.expm1(daily_log_returns[list(target_weights.index)].dropna())
+    backtest = run_backtest(daily_simple_returns, target_weights, scenarios)
+    backtest_stats = get_backtest_stats(backtest, benchmark_simple_returns)
+    if not os.path.exists(config.results_path):
+        os.makedirs(config.results_path)
+    backtest_stats.to_csv(config.results_path+config.portfolio_name
+                          + 'backtest-performance_stats.csv')
+    return backtest_stats
+
+
+def main(backtest_path):
+    """
+    Runs the backtests in a .yaml file with a GRID of scenario settings to
+    combine and/or a list of SCENARIOS, e.g.
+
+        GRID:
+          band: [null, 0.02, 0.05]
+          frequency: [null, "quarterly"]
+          costs: [5, 20]
+        SCENARIOS:
+          - {name: "monthly", frequency: "monthly", costs: {default: 5, EEM: 30}}
+    """
+    config = PortfolioConfig.from_yaml('portfolio-settings.yaml')
+    with open(backtest_path) as f:
+        backtests = yaml.safe_load(f)
+    scenarios = list(backtests.get('SCENARIOS') or [])
+    if backtests.get('GRID'):
+        for scenario in expand_grid(backtests['GRID']):
+            scenario.setdefault('name', ', '.join(f'{key}={value}'
+                                                  for key, value in scenario.items()))
+            scenarios.append(scenario)
+    print(run_backtests(config, scenarios))
+
+
+if __name__ == '__main__':
+    print("Starting " + os.path.realpath(__file__))
+    main(sys.argv[1])
@@ -0,0 +1,146 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+from covariance import RollingCovariance
+from instrumentation import timed
+from pipeline import PortfolioConfig
+from utils import (calc_risk_parity_weights, read_and_validate_csv_time_series,
+                   validate_time_series)
+from weights import get_final_ticker_weights
+
+
+@timed('bars.read')
+def _read_partition(file, tickers):
+    if file.endswith('.parquet'):
+        return validate_time_series(pd.read_parquet(file, columns=tickers), file)
+    return read_and_validate_csv_time_series(file)[tickers]
+
+
+def iter_price_chunks(path, tickers, chunksize=100000):
+    """
+    Inputs:
+    - 'path': either a directory of time partitions, e.g. one .csv or .parquet
+        file of bars per day or month, whose names sort in time order, or one
+        large .csv file. Either way each file has a timestamp index and a
+        close price column per ticker.
+    - 'tickers': the columns to read
+    - 'chunksize': rows per chunk when reading a single .csv file
+
+    Outputs:
+    - yields DataFrames of prices, one partition (or chunk) at a time, so
+        only one is ever in memory
+    """
+    if os.path.isdir(path):
+        files = sorted(os.path.join(path, name) for name in os.listdir(path)
+                       if name.endswith(('.csv', '.parquet')))
+        chunks = (_read_partition(file, tickers) for file in files)
+    else:
+        index_column = pd.read_csv(path, nrows=0).columns[0]
+        reader = pd.read_csv(path, index_col=0, chunksize=chunksize,
+                             usecols=lambda column: column in tickers or column == index_column)
+        chunks = (validate_time_series(chunk, path)[tickers] for chunk in reader)
+    last = None
+    for chunk in chunks:
+        if len(chunk) == 0:
+            continue
+        if last is not None and chunk.index[0] <= last:
+            raise Exception(f'\nDirty Data!\n\n\
+            The bars in\n\n\
+            {path}\n\n\
+            are not in time order, or a timestamp appears in more than one partition\n')
+        last = chunk.index[-1]
+        yield chunk
+
+
+def iter_return_chunks(path, tickers, chunksize=100000):
+    """
+    Yields DataFrames of the log returns of each chunk of iter_price_chunks().
+    Like the 'intersection' MISSING_DATA_POLICY, a ticker's return is from its
+    own previous bar, which may be in an earlier chunk, and only the bars
+    every ticker has a price on are kept.
+    """
+    previous = np.full(len(tickers), np.nan)  # last price of each ticker so far
+    for prices in iter_price_chunks(path, tickers, chunksize):
+        values = prices.to_numpy(dtype=float)
+        filled = pd.DataFrame(np.vstack([previous, values])).ffill().to_numpy()
+        previous = filled[-1]
+        returns = np.log(values / filled[:-1])
+        complete = ~np.isnan(returns).any(axis=1)
+        yield pd.DataFrame(returns[complete], index=prices.index[complete], columns=tickers)
+
+
+def get_streaming_covariance(path, tickers, chunksize=100000):
+    """
+    Covariance matrix (numpy.ndarray) of the log returns of 'tickers', from
+    co-moment sums accumulated one chunk at a time, so the memory used is
+    bounded by the chunk size whatever the length of the history. Also
+    returns the number of bars it's estimated from.
+    """
+    moments = RollingCovariance(len(tickers))
+    for returns in iter_return_chunks(path, tickers, chunksize):
+        moments.add(returns.to_numpy())
+    return moments.covariance(), moments.count
+
+
+def get_streaming_weights(path, config, chunksize=100000):
+    """
+    Inputs:
+    - 'path' and 'chunksize': the bars, see iter_price_chunks()
+    - 'config': PortfolioConfig, using its 'environments'
+
+    Outputs:
+    - 'weights_within_environment' and 'weights_between_environments'
+        DataFrames, the same as get_weights_within_environment() and
+        get_weights_between_environments() in weights.py would give for all
+        the bars' returns in one DataFrame (with the sample covariance)
+
+    The bars are streamed twice: once for the covariance of all the tickers,
+    whose environment sub-blocks give the within-environment weights, then
+    again for the covariance of the environments' returns.
+    """
+    environments = config.environments
+    tickers = config.tickers
+    columns = {ticker: i for i, ticker in enumerate(tickers)}
+    cov, _ = get_streaming_covariance(path, tickers, chunksize)
+    frames = []
+    within = np.zeros((len(tickers), len(environments)))
+    for j, environment in enumerate(environments):
+        idx = [columns[ticker] for ticker in environments[environment]]
+        weights, risk_contributions = calc_risk_parity_weights(cov[np.ix_(idx, idx)])
+        within[idx, j] = weights
+        frames.append(pd.DataFrame({'environment': environment,
+                                    'ticker': list(environments[environment]),
+                                    'weight': list(weights),
+                                    'risk_contribution': list(risk_contributions)}))
+    weights_within_environment = pd.concat(frames, sort=False)
+
+    moments = RollingCovariance(len(environments))
+    for returns in iter_return_chunks(path, tickers, chunksize):
+        moments.add(np.log1p(np.expm1(returns.to_numpy()) @ within))
+    weights, risk_contributions = calc_risk_parity_weights(moments.covariance())
+    weights_between_environments = pd.DataFrame({'environment': list(environments.keys()),
+                                                'weight': list(weights),
+                                                'risk_contribution': list(risk_contributions)})
+    return weights_within_environment, weights_between_environments
+
+
+def main(path):
+    """
+    Calculates the final ticker weights from the bars at 'path' and saves them
+    in RESULTS_PATH as <PORTFOLIO_NAME>-intraday-final-ticker-weights.csv,
+    alongside the final ticker weights that
+    calculate-all-weather-ticker-weights.py saves for daily prices.
+    """
+    config = PortfolioConfig.from_yaml('portfolio-settings.yaml')
+    final_ticker_weights = get_final_ticker_weights(*get_streaming_weights(path, config))
+    if not os.path.exists(config.results_path):
+        os.makedirs(config.results_path)
+    final_ticker_weights.to_csv(config.results_path+config.portfolio_name
+                                + 'intraday-final-ticker-weights.csv')
+    print(final_ticker_weights)
+
+
+if __name__ == '__main__':
+    print("Starting " + os.path.realpath(__file__))
+    main(sys.argv[1])
@@ -0,0 +1,212 @@
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from covariance import CovarianceCache
+from performance import (get_daily_portfolio_returns, get_portfolio_stats)
+from storage import CsvStore
+from time_series import get_log_returns_series
+from utils import (calc_risk_parity_weights, read_and_validate_csv_time_series)
+
+ENVIRONMENT_NAMES = ['RISING_GROWTH', 'FALLING_GROWTH', 'RISING_INFLATION', 'FALLING_INFLATION']
+
+# (n_tickers, n_days, overlap) of each benchmarked panel
+SIZES = [(12, 2520, 0.25), (100, 2520, 0.25), (500, 2520, 0.25), (500, 5040, 0.5)]
+QUICK_SIZES = [(12, 504, 0.25), (40, 504, 0.25)]
+
+
+def simulate_returns_panel(n_tickers, n_days, overlap=0.25, seed=0):
+    """
+    Inputs:
+    - 'n_tickers' and 'n_days': size of the panel
+    - 'overlap': fraction of the tickers that are also in a second
+        environment, like VTI and TLT in portfolio-settings.yaml
+    - 'seed': for the random numbers
+
+    Outputs:
+    - 'daily_log_returns' DataFrame of correlated log returns, one column per
+        ticker (T0000, T0001, ...) and one row per business day
+    - 'environments' dict of the 4 environments and their tickers
+    """
+    rng = np.random.default_rng(seed)
+    tickers = [f'T{i:04d}' for i in range(n_tickers)]
+    # a few common factors, so the covariance matrix isn't diagonal
+    loadings = rng.normal(scale=0.005, size=(n_tickers, 3))
+    factors = rng.normal(size=(n_days, 3))
+    noise = rng.normal(size=(n_days, n_tickers)) * rng.uniform(0.002, 0.02, size=n_tickers)
+    returns = 0.0002 + factors @ loadings.T + noise
+    index = pd.bdate_range('2000-01-03', periods=n_days, name='date')
+    environments = {name: [] for name in ENVIRONMENT_NAMES}
+    n_shared = int(round(overlap * n_tickers))
+    for i, ticker in enumerate(tickers):
+        environments[ENVIRONMENT_NAMES[i % 4]].append(ticker)
+        if i < n_shared:
+            environments[ENVIRONMENT_NAMES[(i + 1) % 4]].append(ticker)
+    return pd.DataFrame(returns, index=index, columns=tickers), environments
+
+
+def simulate_price_store(store, daily_log_returns):
+    """Saves each ticker's adjusted close prices, as download_daily_adjusted_price() would."""
+    prices = 100 * np.exp(daily_log_returns.cumsum())
+    for ticker in prices:
+        store.write(ticker, prices[ticker].rename('adjusted_close').to_frame())
+
+
+def time_function(function, repeat=5):
+    """Returns the best and median wall time (seconds) of 'repeat' calls of function()."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times), float(np.median(times))
+
+
+def get_benchmarks(daily_log_returns, environments, path):
+    """
+    Returns a dict of benchmark name -> function to time, on the given panel.
+    'path' is a directory for the files read by the load benchmarks.
+    """
+    tickers = list(daily_log_returns.columns)
+    largest = max(environments.values(), key=len)
+    cov = daily_log_returns[largest].cov().to_numpy()
+    store = CsvStore(path)
+    simulate_price_store(store, daily_log_returns)
+    daily_log_returns.to_csv(path + 'daily-log-returns.csv')
+    first_date = daily_log_returns.index[0].strftime('%Y-%m-%d')
+    final_ticker_weights = pd.DataFrame({'ticker': tickers,
+                                         'weight': np.ones(len(tickers)) / len(tickers)})
+    benchmark_simple_returns = pd.DataFrame(
+        {'benchmark': np.expm1(daily_log_returns[tickers[:2]].to_numpy()) @ [.4, .6]},
+        index=daily_log_returns.index)
+
+    def covariance():
+        cache = CovarianceCache(daily_log_returns)
+        for environment in environments:
+            cache.get(environments[environment])
+
+    def portfolio_returns_and_stats():
+        simple_returns, cumulative_returns = \
+            get_daily_portfolio_returns(daily_log_returns, final_ticker_weights)
+        benchmark_cum_returns = (1 + benchmark_simple_returns).cumprod() - 1
+        get_portfolio_stats(cumulative_returns, simple_returns,
+                            benchmark_cum_returns, benchmark_simple_returns)
+
+    return {
+        'calc_risk_parity_weights': lambda: calc_risk_parity_weights(cov),
+        'covariance': covariance,
+        'get_log_returns_series': lambda: get_log_returns_series(tickers, first_date, store,
+                                                                 'Benchmark-', checkpoint=False),
+        'read_and_validate_csv_time_series':
+            lambda: read_and_validate_csv_time_series(path + 'daily-log-returns.csv'),
+        'portfolio_returns_and_stats': portfolio_returns_and_stats,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(sizes=SIZES, repeat=5, names=None):
+    """
+    Inputs:
+    - 'sizes': list of (n_tickers, n_days, overlap) panels to benchmark on
+    - 'repeat': number of timed calls of each benchmark
+    - 'names': optional list of the benchmarks to run, default all of them
+
+    Outputs:
+    - list of dicts, one per benchmark and panel, with the 'best' and
+        'median' seconds and what was run where
+    """
+    run = {'run_at': datetime.now().isoformat(timespec='seconds'), 'commit': _git_commit(),
+           'python': platform.python_version(), 'numpy': np.__version__,
+           'pandas': pd.__version__, 'platform': platform.platform()}
+    results = []
+    for n_tickers, n_days, overlap in sizes:
+        daily_log_returns, environments = simulate_returns_panel(n_tickers, n_days, overlap)
+        with tempfile.TemporaryDirectory() as directory:
+            benchmarks = get_benchmarks(daily_log_returns, environments, directory + '/')
+            for name, function in benchmarks.items():
+                if names and name not in names:
+                    continue
+                best, median = time_function(function, repeat)
+                results.append(dict(run, benchmark=name, n_tickers=n_tickers,
+                                    n_days=n_days, overlap=overlap, repeat=repeat,
+                                    best=best, median=median))
+    return results
+
+
+def save_results(results, path='results/benchmarks.jsonl'):
+    """Appends the results to a JSON lines file, to compare runs over time."""
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(path, 'a') as f:
+        for result in results:
+            f.write(json.dumps(result) + '\n')
+
+
+def load_results(path='results/benchmarks.jsonl'):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare_results(results, baseline, threshold=1.25):
+    """
+    Inputs:
+    - 'results' and 'baseline': lists of results from run_benchmarks() or
+        load_results(). When a benchmark was run more than once, its latest
+        run is used.
+    - 'threshold': ratio of the medians above which a benchmark has regressed
+
+    Outputs:
+    - DataFrame of the benchmarks run in both, indexed by (benchmark,
+        n_tickers, n_days, overlap), with the 'baseline' and 'median'
+        seconds, their 'ratio' and whether it 'regressed'
+    """
+    keys = ['benchmark', 'n_tickers', 'n_days', 'overlap']
+
+    def latest(rows):
+        return pd.DataFrame(rows).drop_duplicates(keys, keep='last').set_index(keys)['median']
+
+    comparison = pd.concat([latest(baseline).rename('baseline'), latest(results)],
+                           axis=1, join='inner')
+    comparison['ratio'] = comparison['median'] / comparison['baseline']
+    comparison['regressed'] = comparison['ratio'] > threshold
+    return comparison
+
+
+def main(argv):
+    """
+    python benchmark.py [--quick] [--baseline <results .jsonl>]
+
+    Times the hot paths on synthetic panels, prints the results, appends them
+    to results/benchmarks.jsonl and, given a baseline, exits with status 1 if
+    any benchmark regressed.
+    """
+    quick = '--quick' in argv
+    results = run_benchmarks(QUICK_SIZES if quick else SIZES, repeat=3 if quick else 5)
+    print(pd.DataFrame(results)[['benchmark', 'n_tickers', 'n_days', 'overlap',
+                                 'best', 'median']].to_string(index=False))
+    save_results(results)
+    if '--baseline' in argv:
+        comparison = compare_results(results, load_results(argv[argv.index('--baseline') + 1]))
+        print(comparison.to_string())
+        if comparison['regressed'].any():
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    print("Starting " + os.path.realpath(__file__))
+    sys.exit(main(sys.argv[1:]))
@@ -8,6 +8,9 @@ fi
 set -o errexit
 
 python3 -m unittest discover -v -s ./tests
-python3 get-ticker-time-series.py
-python3 calculate-all-weather-ticker-weights.py
-python3 assess-portfolio-historic-performance.py
+# fetch -> weights -> assessment in one process, saving each stage's
+# output so the three scripts below can also be re-run on their own:
+#   get-ticker-time-series.py
+#   calculate-all-weather-ticker-weights.py
+#   assess-portfolio-historic-performance.py
+python3 pipeline.py
@@ -0,0 +1,165 @@
+import numpy as np
+import pandas as pd
+from instrumentation import timed
+
+
+class RollingCovariance:
+    """
+    Sample covariance of a trailing window of returns, kept up to date by
+    adding the newest rows and dropping the oldest ones, instead of calling
+    DataFrame.cov() on every window.
+
+    The running sums are taken around a fixed shift (the mean of the first
+    rows added) so the covariance does not lose precision to cancellation
+    after thousands of updates.
+    """
+
+    def __init__(self, n_columns):
+        self.count = 0
+        self.shift = None
+        self.sums = np.zeros(n_columns)
+        self.cross_products = np.zeros((n_columns, n_columns))
+
+    def add(self, rows):
+        rows = np.atleast_2d(rows)
+        if len(rows) == 0:
+            return
+        if self.shift is None:
+            self.shift = rows.mean(axis=0)
+        centred = rows - self.shift
+        self.count += len(rows)
+        self.sums += centred.sum(axis=0)
+        self.cross_products += centred.T @ centred
+
+    def drop(self, rows):
+        rows = np.atleast_2d(rows)
+        if len(rows) == 0:
+            return
+        centred = rows - self.shift
+        self.count -= len(rows)
+        self.sums -= centred.sum(axis=0)
+        self.cross_products -= centred.T @ centred
+
+    def covariance(self):
+        if self.count < 2:
+            raise Exception('Error! At least 2 rows are needed to estimate a covariance matrix')
+        mean = self.sums / self.count
+        return (self.cross_products - self.count * np.outer(mean, mean)) / (self.count - 1)
+
+
+class EwmaCovariance:
+    """
+    Exponentially-weighted covariance, where a day's weight halves every
+    'halflife' days. Updating it with each new day (or chunk of days) costs
+    O(n^2), no matter how long the history is. Matches pandas'
+    DataFrame.ewm(halflife=halflife).cov() on the last day.
+    """
+
+    def __init__(self, n_columns, halflife):
+        self.decay = 0.5 ** (1 / halflife)
+        self.shift = None
+        self.weight = 0.0  # sum of the weights
+        self.weight_squared = 0.0  # sum of the squared weights
+        self.sums = np.zeros(n_columns)
+        self.cross_products = np.zeros((n_columns, n_columns))
+
+    def add(self, rows):
+        rows = np.atleast_2d(rows)
+        if len(rows) == 0:
+            return self
+        if self.shift is None:
+            self.shift = rows.mean(axis=0)
+        centred = rows - self.shift
+        # the newest row gets weight 1, and everything before it decays
+        weights = self.decay ** np.arange(len(rows) - 1, -1, -1)
+        decay = self.decay ** len(rows)
+        self.weight = decay * self.weight + weights.sum()
+        self.weight_squared = decay**2 * self.weight_squared + (weights**2).sum()
+        self.sums = decay * self.sums + weights @ centred
+        self.cross_products = decay * self.cross_products + (centred.T * weights) @ centred
+        return self
+
+    def covariance(self):
+        mean = self.sums / self.weight
+        biased = self.cross_products / self.weight - np.outer(mean, mean)
+        return biased / (1 - self.weight_squared / self.weight**2)
+
+
+def ledoit_wolf_covariance(returns):
+    """
+    Ledoit & Wolf (2004) shrinkage of the (biased) sample covariance towards
+    a scaled identity matrix, with the shrinkage intensity estimated from the
+    data. Much less noisy than the sample covariance when there are many
+    tickers relative to the number of days.
+    """
+    returns = np.asarray(returns)
+    n_samples, n_columns = returns.shape
+    centred = returns - returns.mean(axis=0)
+    sample = centred.T @ centred / n_samples
+    mu = np.trace(sample) / n_columns
+    target = mu * np.eye(n_columns)
+    delta = np.sum((sample - target)**2) / n_columns
+    squared = centred**2
+    beta = np.sum(squared.T @ squared / n_samples - sample**2) / (n_columns * n_samples)
+    shrinkage = min(beta, delta) / delta if delta > 0 else 0
+    return (1 - shrinkage) * sample + shrinkage * target
+
+
+@timed('covariance')
+def estimate_covariance(returns, estimator='sample', halflife=None):
+    """
+    Inputs:
+    - 'returns': (T, n) numpy.ndarray of log returns, where NaN marks a day
+        a ticker has no return (see the 'pairwise' MISSING_DATA_POLICY)
+    - 'estimator': 'sample' (same as DataFrame.cov(), which uses each pair's
+        overlapping days when there are NaNs), 'ewma' or 'ledoit_wolf' (which
+        only use the days without NaNs)
+    - 'halflife': in days, for 'ewma'
+
+    Outputs:
+    - (n, n) covariance matrix (numpy.ndarray)
+    """
+    returns = np.asarray(returns)
+    missing = np.isnan(returns)
+    if missing.any():
+        if estimator == 'sample':
+            return pd.DataFrame(returns).cov().to_numpy()
+        returns = returns[~missing.any(axis=1)]
+    if estimator == 'sample':
+        return np.atleast_2d(np.cov(returns, rowvar=False))
+    if estimator == 'ewma':
+        return EwmaCovariance(returns.shape[1], halflife).add(returns).covariance()
+    if estimator == 'ledoit_wolf':
+        return ledoit_wolf_covariance(returns)
+    raise Exception(f'Error! Unknown COVARIANCE_ESTIMATOR "{estimator}", '
+                    'use "sample", "ewma" or "ledoit_wolf"')
+
+
+class CovarianceCache:
+    """
+    Covariance matrices of one returns panel. The matrix of every ticker in
+    the panel is estimated once per date range and estimator, and each
+    environment gets its sub-block of it, so tickers that appear in several
+    environments (e.g. VTI, TLT) don't have their covariances re-estimated.
+    """
+
+    def __init__(self, daily_log_returns):
+        self.daily_log_returns = daily_log_returns
+        self.columns = {ticker: i for i, ticker in enumerate(daily_log_returns.columns)}
+        self.matrices = {}
+
+    def get(self, tickers, start=None, end=None, estimator='sample', halflife=None):
+        """
+        Returns the covariance matrix of 'tickers' (in that order) over the
+        days from 'start' to 'end' (inclusive, default all of them).
+        """
+        key = (start, end, estimator, halflife)
+        if key not in self.matrices:
+            returns = self.daily_log_returns
+            if start is not None:
+                returns = returns.loc[returns.index >= start]
+            if end is not None:
+                returns = returns.loc[returns.index <= end]
+            self.matrices[key] = estimate_covariance(returns.to_numpy(), estimator, halflife)
+        idx = [self.columns[ticker] for ticker in tickers]
+        return self.matrices[key][np.ix_(idx, idx)]
@@ -0,0 +1,29 @@
+import os
+import sys
+from market_data import import_long_format_prices
+from pipeline import PortfolioConfig
+
+
+def main(path, import_all=False):
+    """
+    Imports the CUSTOM_DATA_LIST tickers' prices from a long format vendor
+    file (date, ticker, adjusted close rows) into the store, ready for
+    get-ticker-time-series.py. Every ticker in the file is imported only
+    when '--all' is passed.
+    """
+    config = PortfolioConfig.from_yaml('portfolio-settings.yaml')
+    if not config.custom_data_list and not import_all:
+        raise Exception('Error! CUSTOM_DATA_LIST in portfolio-settings.yaml is empty, list the '
+                        'tickers to import or pass --all to import every ticker in the file')
+    first_dates = import_long_format_prices(path, config.store,
+                                            None if import_all else config.custom_data_list)
+    missing = [ticker for ticker in config.custom_data_list if ticker not in first_dates]
+    if missing:
+        print(f'No prices found in {path} for: {", ".join(missing)}')
+    for ticker, first_date in first_dates.items():
+        print(f'{ticker}: from {first_date:%Y-%m-%d}')
+
+
+if __name__ == '__main__':
+    print(f"Starting {os.path.realpath(__file__)}")
+    main(sys.argv[1], '--all' in sys.argv[2:])
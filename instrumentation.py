@@ -0,0 +1,163 @@
+import cProfile
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+# the RunReport being recorded into, if any, see RunReport.recording()
+_active_report = None
+
+
+class RunReport:
+    """
+    Where the time (and optionally memory) of a run went: each stage's wall
+    time and peak traced memory, the total time and number of calls of each
+    timed() function, and every risk parity solve with its size, solver
+    iterations and time. Written as JSON next to performance_stats.csv, e.g.
+
+        report = RunReport(memory=True)
+        with report.recording():
+            with report.stage('weights'):
+                calculate_weights(config, daily_log_returns)
+        report.write(config.results_path+config.portfolio_name+'run-report.json')
+
+    With 'profile' the whole recording is also run under cProfile, and the
+    stats are dumped to the same path with a .prof extension (view them with
+    python -m pstats or snakeviz).
+    """
+
+    def __init__(self, memory=False, profile=False):
+        self.memory = memory
+        self.profiler = cProfile.Profile() if profile else None
+        self.started_at = None
+        self.seconds = None
+        self.stages = []
+        self.timers = {}
+        self.solves = []
+        self._running = []  # [name, peak memory so far] of the stages being run
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def recording(self):
+        """Makes this the report that stage(), timed() and record_solve() record into."""
+        global _active_report
+        previous = _active_report
+        _active_report = self
+        started_tracing = self.memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        if self.profiler is not None:
+            self.profiler.enable()
+        self.started_at = datetime.now().isoformat(timespec='seconds')
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.seconds = time.perf_counter() - start
+            if self.profiler is not None:
+                self.profiler.disable()
+            if started_tracing:
+                tracemalloc.stop()
+            _active_report = previous
+
+    @contextmanager
+    def stage(self, name):
+        """Records the wall time (and peak memory) of the 'with' block as stage 'name'."""
+        tracing = self.memory and tracemalloc.is_tracing()
+        if tracing:
+            # the enclosing stage's peak so far, before resetting the peak for this one
+            if self._running:
+                self._running[-1][1] = max(self._running[-1][1], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        self._running.append([name, 0])
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            record = {'stage': name, 'seconds': time.perf_counter() - start}
+            _, peak = self._running.pop()
+            if tracing:
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+                record['peak_memory_mb'] = peak / 2**20
+                if self._running:
+                    self._running[-1][1] = max(self._running[-1][1], peak)
+            self.stages.append(record)
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            timer = self.timers.setdefault(name, {'calls': 0, 'seconds': 0.0})
+            timer['calls'] += 1
+            timer['seconds'] += seconds
+
+    def record_solve(self, n_assets, solver, seconds, iterations=None):
+        with self._lock:
+            self.solves.append({'stage': self._running[-1][0] if self._running else None,
+                                'n_assets': n_assets, 'solver': solver,
+                                'iterations': iterations, 'seconds': seconds})
+
+    def to_dict(self):
+        return {'started_at': self.started_at, 'seconds': self.seconds,
+                'stages': self.stages, 'timers': self.timers,
+                'solves': {'count': len(self.solves),
+                           'seconds': sum(solve['seconds'] for solve in self.solves),
+                           'iterations': sum(solve['iterations'] or 0 for solve in self.solves),
+                           'all': self.solves}}
+
+    def write(self, path):
+        """Saves the report as JSON at 'path', and the cProfile stats if profiling."""
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+        if self.profiler is not None:
+            self.profiler.dump_stats(os.path.splitext(path)[0] + '.prof')
+
+
+def active_report():
+    return _active_report
+
+
+@contextmanager
+def stage(name):
+    """RunReport.stage() of the active report, or nothing if none is being recorded."""
+    if _active_report is None:
+        yield
+    else:
+        with _active_report.stage(name):
+            yield
+
+
+def timed(name):
+    """
+    Decorator adding each call's wall time to the active report's timer
+    'name', e.g. @timed('store.read'). Costs one check when not recording.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            report = _active_report
+            if report is None:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                report.add_time(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def add_time(name, seconds):
+    """Adds 'seconds' to the active report's timer 'name', e.g. time spent waiting."""
+    if _active_report is not None:
+        _active_report.add_time(name, seconds)
+
+
+def record_solve(n_assets, solver, seconds, iterations=None):
+    if _active_report is not None:
+        _active_report.record_solve(n_assets, solver, seconds, iterations)
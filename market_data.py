@@ -0,0 +1,421 @@
+import http.client
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import (FIRST_COMPLETED, ThreadPoolExecutor, wait)
+from urllib.parse import urlencode, urlsplit
+import numpy as np
+import pandas as pd
+from instrumentation import (add_time, timed)
+from utils import validate_time_series
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket rate limiter: allows bursts of up to 'capacity'
+    calls and refills at 'rate' calls per 'per' seconds. acquire() blocks
+    only for as long as needed, instead of sleeping a fixed minute.
+    """
+
+    def __init__(self, rate, per=60.0, capacity=None):
+        self.rate = rate / per
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, cancelled=None):
+        """Waits for a token, or raises once the 'cancelled' threading.Event is set."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            if cancelled is None:
+                time.sleep(wait)
+            elif cancelled.wait(wait):
+                raise Exception('cancelled while waiting on the rate limit')
+            add_time('rate_limit_wait', wait)
+
+
+class DataProvider:
+    """
+    Wraps a 'fetch(ticker, recent)' function, returning a pandas Series of
+    adjusted close prices indexed by date (the full history, or only the last
+    few months when 'recent' is True), with the provider's own rate limit,
+    concurrency limit and retries with exponential backoff. 'burst' is how
+    many calls may be made back to back before the rate limit kicks in.
+    """
+
+    def __init__(self, name, fetch, calls_per_minute=None, burst=1, max_concurrency=4,
+                 retries=2, backoff=1.0):
+        self.name = name
+        self.fetch = fetch
+        self.rate_limiter = \
+            TokenBucket(calls_per_minute, capacity=burst) if calls_per_minute else None
+        self.semaphore = threading.BoundedSemaphore(max_concurrency)
+        self.retries = retries
+        self.backoff = backoff
+
+    def __call__(self, ticker, recent=False, cancelled=None):
+        """
+        Fetches the ticker's prices. Once the optional 'cancelled'
+        threading.Event is set (e.g. another provider has already answered),
+        the call gives up instead of waiting for its turn or making a request.
+        """
+        cancelled = threading.Event() if cancelled is None else cancelled
+        for attempt in range(self.retries + 1):
+            try:
+                while not self.semaphore.acquire(timeout=0.1):
+                    _raise_if_cancelled(cancelled)
+                try:
+                    _raise_if_cancelled(cancelled)
+                    if self.rate_limiter is not None:
+                        self.rate_limiter.acquire(cancelled)
+                    _raise_if_cancelled(cancelled)
+                    return timed('fetch.'+self.name)(self.fetch)(ticker, recent)
+                finally:
+                    self.semaphore.release()
+            except Exception:
+                if attempt == self.retries or cancelled.is_set():
+                    raise
+                wait = self.backoff * 2**attempt * (1 + random.random())
+                cancelled.wait(wait)
+                add_time('retry_backoff', wait)
+
+
+def _raise_if_cancelled(cancelled):
+    if cancelled.is_set():
+        raise Exception('cancelled, another provider answered first')
+
+
+def alpha_vantage_fetcher(api_key, base_url='https://www.alphavantage.co/query'):
+    """
+    Returns a fetch(ticker, recent) function for Alpha Vantage's
+    TIME_SERIES_DAILY_ADJUSTED endpoint, 'recent' gets the compact output
+    (the last 100 days). Each worker thread keeps one persistent (keep-alive) connection
+    to the API host, rather than opening a new connection per ticker.
+    """
+    url = urlsplit(base_url)
+    connection_class = \
+        http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+    connections = threading.local()
+
+    def fetch(ticker, recent=False):
+        query = urlencode({'function': 'TIME_SERIES_DAILY_ADJUSTED', 'symbol': ticker,
+                           'outputsize': 'compact' if recent else 'full',
+                           'apikey': api_key})
+        if getattr(connections, 'connection', None) is None:
+            connections.connection = connection_class(url.netloc, timeout=60)
+        try:
+            connections.connection.request('GET', url.path + '?' + query)
+            response = connections.connection.getresponse()
+            body = response.read()
+        except Exception:
+            connections.connection.close()
+            connections.connection = None
+            raise
+        if response.status != 200:
+            raise Exception(f'alpha_vantage returned HTTP {response.status} for {ticker}')
+        data = json.loads(body)
+        if 'Time Series (Daily)' not in data:
+            raise Exception(data.get('Error Message') or data.get('Note')
+                            or data.get('Information') or f'no data for {ticker}')
+        adjusted_close = pd.Series({date: float(values['5. adjusted close'])
+                                    for date, values in data['Time Series (Daily)'].items()},
+                                   name='adjusted_close')
+        adjusted_close.index = pd.to_datetime(adjusted_close.index)
+        adjusted_close.index.name = 'date'
+        return adjusted_close
+
+    return fetch
+
+
+def yfinance_fetcher():
+    """Returns a fetch(ticker, recent) function using the yfinance API."""
+    def fetch(ticker, recent=False):
+        import yfinance as yf
+        ticker_data = yf.Ticker(ticker).history(period='3mo' if recent else 'max')
+        if ticker_data.empty:
+            raise Exception(f'yfinance returned no data for {ticker}')
+        adjusted_close = ticker_data['Close'].rename('adjusted_close')
+        adjusted_close.index = pd.to_datetime(adjusted_close.index).tz_localize(None)
+        adjusted_close.index.name = 'date'
+        return adjusted_close
+
+    return fetch
+
+
+def default_providers(api_key):
+    """Alpha Vantage first, falling back to yfinance."""
+    return [
+        # alpha_vantage only allows 5 ticker downloads per min
+        DataProvider('alpha_vantage', alpha_vantage_fetcher(api_key),
+                     calls_per_minute=5, max_concurrency=5),
+        DataProvider('yfinance', yfinance_fetcher(), max_concurrency=4)]
+
+
+def _fetch_with_fallback(ticker, providers, recent=False, hedge_after=10.0):
+    """
+    Fetches from the providers in order of preference. The next provider is
+    started as soon as the current one fails, or alongside it once it's
+    taken more than 'hedge_after' seconds (e.g. it's waiting on its rate
+    limit), and the first prices returned are used. Returns the prices (or
+    None), the errors and the name of the provider that returned them.
+    """
+    errors = []
+    remaining = list(providers)
+    pending = {}
+    hedges = ThreadPoolExecutor(max_workers=max(len(providers), 1))
+    cancelled = threading.Event()
+
+    def start_next():
+        provider = remaining.pop(0)
+        pending[hedges.submit(provider, ticker, recent, cancelled)] = provider
+
+    if remaining:
+        start_next()
+    try:
+        while pending:
+            done, _ = wait(pending, timeout=hedge_after if remaining else None,
+                           return_when=FIRST_COMPLETED)
+            if not done:
+                start_next()  # still waiting on the current providers
+                continue
+            for future in done:
+                provider = pending.pop(future)
+                try:
+                    adjusted_close = future.result()
+                except Exception as e:
+                    errors.append(f'{provider.name}: {e}')
+                    if remaining:
+                        start_next()
+                    continue
+                adjusted_close = adjusted_close.loc[adjusted_close > 0].rename('adjusted_close')
+                adjusted_close.index.name = 'date'
+                return adjusted_close.sort_index(), errors, provider.name
+        return None, errors, None
+    finally:
+        # the slower providers still in flight give up before making their
+        # requests, rather than using up their rate limits on unused prices
+        cancelled.set()
+        hedges.shutdown(wait=False, cancel_futures=True)
+
+
+def _raise_for_failures(results):
+    failed = {ticker: result[1] for ticker, result in results.items() if result[0] is None}
+    if failed:
+        raise Exception('\nAll ticker data APIs failed for:\n\n' +
+                        '\n'.join(f'{ticker}: {"; ".join(errors)}' for ticker, errors in failed.items()))
+
+
+def fetch_adjusted_close(tickers, providers, max_workers=8, hedge_after=10.0):
+    """
+    Inputs:
+    - 'tickers': iterable of tickers, duplicates are only downloaded once
+    - 'providers': list of DataProvider, in order of preference
+    - 'max_workers': number of tickers fetched at once
+    - 'hedge_after': seconds to wait on a provider before also starting the
+        next one, e.g. while the preferred provider waits on its rate limit
+
+    Outputs:
+    - dict of ticker -> adjusted close Series (positive prices only, sorted
+        by date). Tickers are fetched concurrently, and a ticker whose
+        preferred provider fails, or is slow, falls back to the next provider
+        straight away, alongside the other downloads still in flight.
+    - raises an Exception naming every ticker that no provider could fetch
+    """
+    tickers = list(dict.fromkeys(tickers))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = dict(zip(tickers, executor.map(
+            lambda ticker: _fetch_with_fallback(ticker, providers, hedge_after=hedge_after),
+            tickers)))
+    _raise_for_failures(results)
+    return {ticker: result[0] for ticker, result in results.items()}
+
+
+def _read_manifest(store):
+    manifest_path = store.path+'price-store.json'
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def _write_manifest(store, manifest):
+    # write the manifest atomically, so an interrupted run can't corrupt it
+    manifest_path = store.path+'price-store.json'
+    with open(manifest_path+'.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(manifest_path+'.tmp', manifest_path)
+
+
+def _manifest_entry(adjusted_close, provider):
+    return {'first_date': adjusted_close.index[0].strftime('%Y-%m-%d'),
+            'last_date': adjusted_close.index[-1].strftime('%Y-%m-%d'),
+            'last_adjusted_close': float(adjusted_close.iloc[-1]),
+            'provider': provider}
+
+
+def update_adjusted_close(tickers, providers, store, max_workers=8, hedge_after=10.0):
+    """
+    Inputs:
+    - 'tickers': iterable of tickers, duplicates are only downloaded once
+    - 'providers': list of DataProvider, in order of preference
+    - 'store': store from storage.get_store() holding each ticker's prices,
+        alongside a 'price-store.json' manifest of each ticker's date range
+        and the provider it came from
+    - 'max_workers' and 'hedge_after': see fetch_adjusted_close()
+
+    Outputs:
+    - brings each ticker's stored prices up to date, to the last completed
+        session before today, and returns a dict of ticker -> first stored
+        date. Tickers already in the manifest only have their last few
+        months fetched, preferring the provider of the stored history, and
+        the rows after the last stored date appended. If the adjusted close
+        on the last stored date has changed (a dividend or split has
+        re-adjusted the history), the recent window came from a different
+        provider or it doesn't reach back to the last stored date, the
+        ticker's full history is fetched and rewritten instead.
+    - the manifest is saved even when some tickers fail, then an Exception
+        is raised naming them
+    """
+    tickers = list(dict.fromkeys(tickers))
+    manifest = _read_manifest(store)
+    # today's bar may still be trading, only store the completed sessions
+    today = pd.Timestamp.today().normalize()
+
+    def update_ticker(ticker):
+        stored = manifest.get(ticker)
+        preferred = list(providers)
+        if stored is not None and store.exists(ticker):
+            # the stored history's provider first, so its closes can be compared
+            preferred.sort(key=lambda provider: provider.name != stored.get('provider'))
+            recent, errors, provider = _fetch_with_fallback(ticker, preferred, True, hedge_after)
+            if recent is None:
+                return None, errors
+            recent = recent.loc[recent.index < today]
+            # the last stored row comes from the store itself, which may be
+            # ahead of the manifest if an earlier run was interrupted
+            stored_prices = store.read(ticker)['adjusted_close']
+            last_date = stored_prices.index[-1]
+            if provider == stored.get('provider', provider) and last_date in recent.index and \
+                    np.isclose(recent[last_date], stored_prices.iloc[-1], rtol=1e-6):
+                new_rows = recent.loc[recent.index > last_date]
+                store.append(ticker, new_rows)
+                last = new_rows if len(new_rows) else recent.loc[[last_date]]
+                return dict(_manifest_entry(last, provider),
+                            first_date=stored_prices.index[0].strftime('%Y-%m-%d')), errors
+        adjusted_close, errors, provider = _fetch_with_fallback(ticker, preferred, False, hedge_after)
+        if adjusted_close is None:
+            return None, errors
+        adjusted_close = adjusted_close.loc[adjusted_close.index < today]
+        store.write(ticker, adjusted_close)
+        return _manifest_entry(adjusted_close, provider), errors
+
+    def update(ticker):
+        # one ticker's failure mustn't stop the others' manifest entries
+        try:
+            return update_ticker(ticker)
+        except Exception as e:
+            return None, [str(e)]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = dict(zip(tickers, executor.map(update, tickers)))
+    for ticker, (entry, _) in results.items():
+        if entry is not None:
+            manifest[ticker] = entry
+    _write_manifest(store, manifest)
+    _raise_for_failures(results)
+    return {ticker: pd.Timestamp(manifest[ticker]['first_date']) for ticker in tickers}
+
+
+@timed('import_custom_data')
+def import_long_format_prices(path, store, tickers=None, chunksize=1000000):
+    """
+    Bulk imports a vendor file of prices in long format, i.e. one row per
+    ticker per day, into the store, e.g. for the CUSTOM_DATA_LIST tickers.
+
+    Inputs:
+    - 'path': .csv file whose first three columns are the date, ticker and
+        adjusted close (whatever they're called), in any row order
+    - 'store': store from storage.get_store()
+    - 'tickers': the tickers to import, default is all of them
+    - 'chunksize': rows read at a time, the file is never loaded whole
+
+    Outputs:
+    - each ticker's adjusted close saved in the store (replacing any already
+        there) and its date range in the 'price-store.json' manifest. Like
+        the downloads, only positive prices are kept. Each chunk is parsed
+        into a date and a price array per ticker, so the memory used is about
+        16 bytes per row rather than the parsed text.
+    - returns a dict of ticker -> first stored date
+    - raises an Exception, before anything is saved, if a ticker has a date
+        more than once
+    """
+    dates, prices = {}, {}
+    reader = pd.read_csv(path, usecols=[0, 1, 2], header=0,
+                         names=['date', 'ticker', 'adjusted_close'],
+                         dtype={'ticker': 'category', 'adjusted_close': float},
+                         chunksize=chunksize)
+    for chunk in reader:
+        if tickers is not None:
+            chunk = chunk.loc[chunk['ticker'].isin(tickers)]
+        chunk = chunk.loc[chunk['adjusted_close'] > 0]
+        # sort the rows by ticker once, then split them into each ticker's run
+        codes = chunk['ticker'].cat.codes.to_numpy()
+        order = np.argsort(codes, kind='stable')
+        codes = codes[order]
+        chunk_dates = pd.to_datetime(chunk['date']).to_numpy()[order]
+        chunk_prices = chunk['adjusted_close'].to_numpy()[order]
+        starts = np.flatnonzero(np.diff(codes, prepend=-1))
+        categories = chunk['ticker'].cat.categories
+        for code, ticker_dates, ticker_prices in zip(codes[starts], np.split(chunk_dates, starts[1:]),
+                                                    np.split(chunk_prices, starts[1:])):
+            dates.setdefault(categories[code], []).append(ticker_dates)
+            prices.setdefault(categories[code], []).append(ticker_prices)
+
+    # validate every ticker before writing any, so a bad file changes nothing
+    imported = {}
+    for ticker in sorted(dates):
+        adjusted_close = pd.Series(np.concatenate(prices.pop(ticker)),
+                                   index=pd.DatetimeIndex(np.concatenate(dates.pop(ticker)),
+                                                          name='date'),
+                                   name='adjusted_close')
+        imported[ticker] = validate_time_series(adjusted_close, f'{path} (ticker {ticker})')
+    manifest = _read_manifest(store)
+    for ticker, adjusted_close in imported.items():
+        store.write(ticker, adjusted_close)
+        manifest[ticker] = _manifest_entry(adjusted_close, 'custom')
+    _write_manifest(store, manifest)
+    return {ticker: pd.Timestamp(manifest[ticker]['first_date']) for ticker in imported}
+
+
+def get_stored_first_dates(tickers, store):
+    """
+    Dict of ticker -> first stored date, for 'tickers' already in the store,
+    e.g. CUSTOM_DATA_LIST tickers imported by import_long_format_prices() or
+    saved by hand, from the manifest where they're in it. Raises an
+    Exception naming any ticker that isn't stored.
+    """
+    manifest = _read_manifest(store)
+    first_dates = {}
+    missing = []
+    for ticker in tickers:
+        if ticker in manifest and store.exists(ticker):
+            first_dates[ticker] = pd.Timestamp(manifest[ticker]['first_date'])
+        elif store.exists(ticker):
+            first_dates[ticker] = store.read(ticker).index[0]
+        else:
+            missing.append(ticker)
+    if missing:
+        raise Exception(f'Error! No stored prices for the CUSTOM_DATA_LIST tickers '
+                        f'{", ".join(missing)} in {store.path}, import them first with '
+                        '`python3 import-custom-data.py <vendor file>`')
+    return first_dates
@@ -0,0 +1,154 @@
+import numpy as np
+import pandas as pd
+
+
+class OnlinePerformanceStats:
+    """
+    Running performance stats of a daily simple returns series, updated one
+    day or one chunk of days at a time in O(1) memory: the compounded growth,
+    its running peak, the current and max drawdown, and a Welford mean and
+    variance of the returns. snapshot() gives the same stats as
+    get_portfolio_stats() in performance.py would for all the days so far,
+    without rescanning them, e.g.
+
+        stats = OnlinePerformanceStats()
+        for chunk in pd.read_csv(path, index_col=0, parse_dates=True, chunksize=100000):
+            stats.update(chunk.iloc[:, 0])
+        stats.snapshot()
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0  # sum of squared deviations from the mean
+        self.growth = 1.0  # value of 1 invested before the first day
+        self.peak = None  # like get_max_drawdown(), the peak starts at day 1's close
+        self.drawdown = 0.0
+        self.max_drawdown = 0.0
+        self.first_date = None
+        self.last_date = None
+
+    def update(self, simple_returns, date=None):
+        """
+        Adds one day's return (a float, with its 'date'), or a chunk of days
+        (a pandas Series indexed by date), in date order.
+        """
+        if isinstance(simple_returns, pd.Series):
+            dates = simple_returns.index
+            returns = simple_returns.to_numpy(dtype=float)
+        else:
+            dates = [date]
+            returns = np.atleast_1d(np.asarray(simple_returns, dtype=float))
+        if len(returns) == 0:
+            return self
+        if self.first_date is None:
+            self.first_date = pd.Timestamp(dates[0])
+        self.last_date = pd.Timestamp(dates[-1])
+
+        # merge the chunk's mean and variance into the running ones (Chan et al.)
+        count = len(returns)
+        mean = returns.mean()
+        m2 = ((returns - mean)**2).sum()
+        delta = mean - self.mean
+        total = self.count + count
+        self.mean += delta * count / total
+        self.m2 += m2 + delta**2 * self.count * count / total
+        self.count = total
+
+        growth = self.growth * np.cumprod(1 + returns)
+        peak = np.maximum.accumulate(growth)
+        if self.peak is not None:
+            peak = np.maximum(peak, self.peak)
+        drawdown = (growth - peak) / peak
+        self.growth = growth[-1]
+        self.peak = peak[-1]
+        self.drawdown = drawdown[-1]
+        self.max_drawdown = min(self.max_drawdown, drawdown.min())
+        return self
+
+    def snapshot(self):
+        """
+        Returns a dict of the stats so far: 'annual_return' (CAGR),
+        'max_drawdown' and 'current_drawdown' (as fractions),
+        'return_risk_ratio', 'cumulative_return' and 'days'.
+        """
+        num_years = float((self.last_date - self.first_date).days) / 365 \
+            if self.count else np.nan
+        std = np.sqrt(self.m2 / self.count) if self.count else np.nan
+        return {'annual_return': self.growth**(1/num_years) - 1 if num_years else np.nan,
+                'max_drawdown': self.max_drawdown,
+                'current_drawdown': self.drawdown,
+                'return_risk_ratio': self.mean / std if std else np.nan,
+                'cumulative_return': self.growth - 1,
+                'days': self.count}
+
+
+def get_online_portfolio_stats(portfolio, benchmark):
+    """
+    Inputs:
+    - 'portfolio' and 'benchmark': OnlinePerformanceStats
+
+    Outputs:
+    - 'portfolio_stats' DataFrame laid out like get_portfolio_stats()
+    """
+    columns = ['annual_return', 'max_drawdown', 'return_risk_ratio']
+    return pd.DataFrame([portfolio.snapshot(), benchmark.snapshot()],
+                        index=['portfolio', 'benchmark'])[columns]
+
+
+def get_daily_simple_returns(daily_log_returns):
+    """exp(log returns) - 1, computed once and shared by all the portfolios."""
+    return np.expm1(daily_log_returns)
+
+
+def get_batch_portfolio_returns(daily_simple_returns, weights):
+    """
+    Inputs:
+    - 'daily_simple_returns' DataFrame (T days x n tickers), from
+        get_daily_simple_returns()
+    - 'weights': either a DataFrame of k portfolios (rows) x tickers
+        (columns), held constant like get_daily_portfolio_returns() does, or
+        a (T, k, n) numpy.ndarray of weights that change from day to day,
+        with tickers in the same order as daily_simple_returns' columns
+
+    Outputs:
+    - 'portfolio_simple_returns' DataFrame, T days x k portfolios
+    """
+    if isinstance(weights, pd.DataFrame):
+        R = daily_simple_returns[list(weights.columns)].to_numpy()
+        return pd.DataFrame(R @ weights.to_numpy().T, index=daily_simple_returns.index,
+                            columns=weights.index)
+    R = daily_simple_returns.to_numpy()
+    return pd.DataFrame(np.einsum('tn,tkn->tk', R, weights), index=daily_simple_returns.index)
+
+
+def get_batch_cumulative_returns(simple_returns):
+    """Cumulative returns of each column of 'simple_returns', like (1 + r).cumprod() - 1."""
+    return np.cumprod(1 + np.asarray(simple_returns), axis=0) - 1
+
+
+def get_batch_drawdowns(cumulative_returns):
+    """Drawdown (as a fraction) of each column, like get_drawdown() / 100."""
+    growth = np.asarray(cumulative_returns) + 1
+    peak = np.maximum.accumulate(growth, axis=0)
+    return (growth - peak) / peak
+
+
+def get_batch_portfolio_stats(simple_returns):
+    """
+    Inputs:
+    - 'simple_returns' DataFrame, T days x k portfolios, e.g. from
+        get_batch_portfolio_returns()
+
+    Outputs:
+    - DataFrame of k portfolios x 'annual_return', 'max_drawdown' and
+        'return_risk_ratio', defined as in get_portfolio_stats()
+    """
+    R = simple_returns.to_numpy()
+    cumulative_returns = get_batch_cumulative_returns(R)
+    num_years = float((simple_returns.index[-1] - simple_returns.index[0]).days) / 365
+    return pd.DataFrame({
+        'annual_return': (1 + cumulative_returns[-1])**(1/num_years) - 1,
+        'max_drawdown': get_batch_drawdowns(cumulative_returns).min(axis=0),
+        'return_risk_ratio': R.mean(axis=0) / R.std(axis=0)},
+        index=simple_returns.columns)
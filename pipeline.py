@@ -0,0 +1,239 @@
+import os
+import sys
+import pandas as pd
+import yaml
+from instrumentation import (RunReport, stage)
+from market_data import default_providers
+from performance import (get_daily_portfolio_returns, get_portfolio_stats,
+                         render_plots, submit_plots)
+from storage import get_store
+from time_series import (download_daily_adjusted_price, get_log_returns_series,
+                         get_benchmark_daily_returns)
+from utils import read_and_validate_csv_time_series
+from walk_forward import (get_walk_forward_weights, get_walk_forward_portfolio_returns)
+from weights import calc_environment_weights
+from weights_cache import WeightsCache
+
+
+class PortfolioConfig:
+    """
+    The settings from portfolio-settings.yaml, parsed once and passed to each
+    stage of the pipeline, e.g.
+
+        config = PortfolioConfig.from_yaml('portfolio-settings.yaml')
+        run_pipeline(config)
+    """
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.name = settings['PORTFOLIO_NAME']
+        self.portfolio_name = self.name+'-'  # prefix for the file names
+        self.data_path = settings['DATA_PATH']
+        self.results_path = settings['RESULTS_PATH']
+        self.environments = settings['ENVIRONMENTS']
+        self.benchmark_tickers = settings['BENCHMARK_TICKERS']
+        self.benchmark_ticker_weights = settings['BENCHMARK_TICKER_WEIGHTS']
+        self.custom_data_list = settings.get('CUSTOM_DATA_LIST') or []
+        self.storage_format = settings.get('STORAGE_FORMAT', 'csv')
+        self.rebalance_frequency = settings.get('REBALANCE_FREQUENCY')
+        self.lookback_window = settings.get('LOOKBACK_WINDOW')
+        self.covariance_estimator = settings.get('COVARIANCE_ESTIMATOR', 'sample')
+        self.ewma_halflife = settings.get('EWMA_HALFLIFE')
+        self.missing_data_policy = settings.get('MISSING_DATA_POLICY', 'intersection')
+        self.ffill_limit = settings.get('FFILL_LIMIT')
+        self.weights_cache_size = settings.get('WEIGHTS_CACHE_SIZE')
+        self.drift_threshold = settings.get('DRIFT_THRESHOLD', 0.02)
+        self._store = None
+        self._weights_cache = None
+
+    @classmethod
+    def from_yaml(cls, path='portfolio-settings.yaml'):
+        with open(path) as f:
+            return cls(yaml.safe_load(f))
+
+    @property
+    def tickers(self):
+        """Every ticker in the environments, each listed once."""
+        return list(dict.fromkeys(ticker for tickers in self.environments.values()
+                                  for ticker in tickers))
+
+    @property
+    def store(self):
+        if self._store is None:
+            self._store = get_store(self.data_path, self.storage_format)
+        return self._store
+
+    @property
+    def weights_cache(self):
+        """WeightsCache in DATA_PATH/weights-cache/, or None if WEIGHTS_CACHE_SIZE isn't set."""
+        if self._weights_cache is None and self.weights_cache_size:
+            self._weights_cache = WeightsCache(self.data_path+'weights-cache/',
+                                               self.weights_cache_size)
+        return self._weights_cache
+
+
+def fetch_returns(config, providers=None, checkpoint=True):
+    """
+    Fetch stage: brings each ticker's prices up to date and returns the
+    'daily_log_returns' and 'benchmark_simple_returns' DataFrames. Saves them
+    in the store if 'checkpoint', for the later stages to be run on their own.
+    """
+    tickers = config.tickers
+    if providers is None:
+        providers = default_providers(os.getenv("ALPHAVANTAGE_KEY"))
+    # download each ticker once, even if it's also a benchmark ticker
+    first_dates = download_daily_adjusted_price(tickers + config.benchmark_tickers, providers,
+                                                config.store, config.custom_data_list)
+    max_first_date = max(first_dates[ticker] for ticker in tickers
+                         if ticker in first_dates).strftime('%Y-%m-%d')
+    daily_log_returns = get_log_returns_series(tickers, max_first_date, config.store,
+                                               config.portfolio_name, checkpoint,
+                                               config.missing_data_policy, config.ffill_limit)
+    benchmark_simple_returns = get_benchmark_daily_returns(
+        config.benchmark_tickers, config.benchmark_ticker_weights, max_first_date,
+        config.store, config.portfolio_name, checkpoint,
+        config.missing_data_policy, config.ffill_limit)
+    return daily_log_returns, benchmark_simple_returns
+
+
+def load_returns(config):
+    """Reads back the DataFrames checkpointed by fetch_returns()."""
+    daily_log_returns = config.store.read(config.portfolio_name+'daily-log-returns-per-ticker')
+    benchmark_simple_returns = config.store.read(config.portfolio_name+'benchmark-simple-returns')
+    return daily_log_returns, benchmark_simple_returns
+
+
+def calculate_weights(config, daily_log_returns, checkpoint=True):
+    """
+    Weights stage: returns the 'final_ticker_weights' DataFrame (with 'ticker'
+    and 'weight' columns), and the 'walk_forward_weights' DataFrame if
+    REBALANCE_FREQUENCY is set (otherwise None). Both are always saved in
+    RESULTS_PATH, the intermediate weights only if 'checkpoint'.
+    """
+    if not os.path.exists(config.results_path):
+        os.makedirs(config.results_path)
+    final_ticker_weights = calc_environment_weights(
+        daily_log_returns, config, checkpoint,
+        weights_cache=config.weights_cache).final_ticker_weights()
+    final_ticker_weights.to_csv(config.results_path+config.portfolio_name+'final-ticker-weights.csv')
+    walk_forward_weights = None
+    # optionally re-estimate the weights on a rebalance schedule from a trailing window
+    if config.rebalance_frequency:
+        walk_forward_weights = get_walk_forward_weights(daily_log_returns, config.environments,
+                                                        config.lookback_window,
+                                                        config.rebalance_frequency,
+                                                        config.covariance_estimator,
+                                                        config.ewma_halflife)
+        walk_forward_weights.index.name = 'date'
+        walk_forward_weights.to_csv(config.results_path+config.portfolio_name
+                                    +'walk-forward-ticker-weights.csv')
+    return final_ticker_weights.reset_index(), walk_forward_weights
+
+
+def load_weights(config):
+    """Reads back the weights saved by calculate_weights()."""
+    final_ticker_weights = pd.read_csv(config.results_path+config.portfolio_name
+                                       + 'final-ticker-weights.csv')
+    walk_forward_weights = None
+    if config.rebalance_frequency:
+        walk_forward_weights = read_and_validate_csv_time_series(
+            config.results_path+config.portfolio_name+'walk-forward-ticker-weights.csv')
+    return final_ticker_weights, walk_forward_weights
+
+
+def assess_performance(config, daily_log_returns, benchmark_simple_returns,
+                       final_ticker_weights, walk_forward_weights=None, plots=True):
+    """
+    Assessment stage: returns the 'portfolio_stats' DataFrame, and saves it in
+    RESULTS_PATH along with a copy of the portfolio settings and, depending
+    on 'plots', the returns and drawdown plots:
+    - True: render the plots before returning
+    - False: stats only, plotnine isn't even imported
+    - a concurrent.futures executor: render the plots on it in the background,
+        shutting the executor down waits for them
+    """
+    if not os.path.exists(config.results_path):
+        os.makedirs(config.results_path)
+    if walk_forward_weights is not None:
+        simple_returns, cumulative_returns = \
+            get_walk_forward_portfolio_returns(daily_log_returns, walk_forward_weights)
+        # compare against the benchmark over the same out-of-sample period
+        benchmark_simple_returns = benchmark_simple_returns.loc[
+            benchmark_simple_returns.index >= simple_returns.index[0]]
+    else:
+        simple_returns, cumulative_returns = \
+            get_daily_portfolio_returns(daily_log_returns, final_ticker_weights)
+    benchmark_cum_returns = (1 + benchmark_simple_returns).cumprod() - 1
+    portfolio_stats = get_portfolio_stats(cumulative_returns, simple_returns,
+                                          benchmark_cum_returns, benchmark_simple_returns)
+    portfolio_stats.to_csv(config.results_path+config.portfolio_name
+                           + 'performance_stats.csv', header=True)
+    # plotnine has annoying warnings, couldn't figure out how to suppress
+    if plots is True:
+        with stage('plots'):
+            render_plots(config, cumulative_returns, benchmark_cum_returns)
+    elif plots:
+        submit_plots(plots, config, cumulative_returns, benchmark_cum_returns)
+    # save portfolio settings in results folder
+    with open(config.results_path+config.name+'.yml', 'w') as outfile:
+        yaml.dump(config.settings, outfile)
+    return portfolio_stats
+
+
+def run_pipeline(config, fetch=True, checkpoint=False, providers=None, plots=True,
+                 report=None):
+    """
+    Runs fetch -> weights -> assessment in one process, handing the
+    DataFrames from one stage to the next in memory.
+
+    Inputs:
+    - 'config': PortfolioConfig
+    - 'fetch': whether to download new data, if False the returns saved in
+        the store by an earlier run are used. The INDEX-backtest portfolio's
+        returns are never downloaded.
+    - 'checkpoint': also save each stage's intermediate DataFrames, so the
+        stages can later be re-run on their own
+    - 'providers': optional list of market_data.DataProvider
+    - 'plots': True, False (stats only) or an executor, see assess_performance()
+    - 'report': optional instrumentation.RunReport, e.g. with memory tracing
+        or profiling, by default a timing-only one. It's saved in
+        RESULTS_PATH as <PORTFOLIO_NAME>-run-report.json.
+
+    Outputs:
+    - dict with the 'daily_log_returns', 'benchmark_simple_returns',
+        'final_ticker_weights', 'walk_forward_weights' and 'portfolio_stats'
+    """
+    if report is None:
+        report = RunReport()
+    with report.recording():
+        if fetch and config.portfolio_name != "INDEX-backtest-":
+            with report.stage('fetch'):
+                daily_log_returns, benchmark_simple_returns = \
+                    fetch_returns(config, providers, checkpoint)
+        else:
+            with report.stage('load'):
+                daily_log_returns, benchmark_simple_returns = load_returns(config)
+        with report.stage('weights'):
+            final_ticker_weights, walk_forward_weights = \
+                calculate_weights(config, daily_log_returns, checkpoint)
+        with report.stage('assessment'):
+            portfolio_stats = assess_performance(config, daily_log_returns,
+                                                 benchmark_simple_returns, final_ticker_weights,
+                                                 walk_forward_weights, plots)
+    report.write(config.results_path+config.portfolio_name+'run-report.json')
+    return {'daily_log_returns': daily_log_returns,
+            'benchmark_simple_returns': benchmark_simple_returns,
+            'final_ticker_weights': final_ticker_weights,
+            'walk_forward_weights': walk_forward_weights,
+            'portfolio_stats': portfolio_stats}
+
+
+if __name__ == '__main__':
+    print("Starting " + os.path.realpath(__file__))
+    # --stats-only skips the plots, e.g. for nightly jobs that only need the stats
+    # --trace-memory adds each stage's peak memory to the run report (slower)
+    # --profile also saves a cProfile dump, <PORTFOLIO_NAME>-run-report.prof
+    run_pipeline(PortfolioConfig.from_yaml(), checkpoint=True,
+                 plots='--stats-only' not in sys.argv,
+                 report=RunReport(memory='--trace-memory' in sys.argv,
+                                  profile='--profile' in sys.argv))
@@ -0,0 +1,204 @@
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from metrics import get_batch_portfolio_stats
+from covariance import estimate_covariance
+from pipeline import (PortfolioConfig, load_returns)
+from storage import NpyStore
+from utils import calc_risk_parity_weights_batch
+
+
+def get_block_bootstrap_indices(n_days, n_paths, block_length, rng):
+    """
+    Moving block bootstrap: each path is made of blocks of 'block_length'
+    consecutive days starting at random days, so the autocorrelation and
+    volatility clustering within a block are kept. Returns a (n_paths,
+    n_days) numpy.ndarray of row positions.
+    """
+    n_blocks = -(-n_days // block_length)
+    starts = rng.integers(0, n_days - block_length + 1, size=(n_paths, n_blocks))
+    indices = starts[:, :, np.newaxis] + np.arange(block_length)
+    return indices.reshape(n_paths, -1)[:, :n_days]
+
+
+def simulate_paths(log_returns, n_paths, method='bootstrap', block_length=21, rng=None):
+    """
+    Inputs:
+    - 'log_returns': (T, n) numpy.ndarray of the daily log returns
+    - 'n_paths': number of paths to draw
+    - 'method': 'bootstrap' (moving blocks of 'block_length' days) or
+        'normal' (multivariate normal with the sample mean and covariance)
+    - 'rng': numpy.random.Generator
+
+    Outputs:
+    - (n_paths, T, n) numpy.ndarray of simulated log returns
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    n_days, n_tickers = log_returns.shape
+    if method == 'bootstrap':
+        return log_returns[get_block_bootstrap_indices(n_days, n_paths, block_length, rng)]
+    if method == 'normal':
+        return rng.multivariate_normal(log_returns.mean(axis=0),
+                                       np.cov(log_returns, rowvar=False),
+                                       size=(n_paths, n_days))
+    raise Exception(f'Error! Unknown simulation method "{method}", use "bootstrap" or "normal"')
+
+
+def _batch_covariance(paths):
+    centred = paths - paths.mean(axis=1, keepdims=True)
+    return np.einsum('pti,ptj->pij', centred, centred) / (paths.shape[1] - 1)
+
+
+def solve_paths(paths, members):
+    """
+    Solves the two-level all-weather weights on each path at once, with the
+    sample covariance of each path (whatever the COVARIANCE_ESTIMATOR).
+
+    Inputs:
+    - 'paths': (P, T, n) numpy.ndarray of log returns
+    - 'members': dict of environment -> list of the positions of its tickers
+
+    Outputs:
+    - 'final_weights': (P, n) ticker weights
+    - 'environment_weights': (P, number of environments) between-environment
+        weights
+    - 'converged': (P,) bool, whether every solve on the path converged
+    """
+    covs = _batch_covariance(paths)
+    simple_returns = np.expm1(paths)
+    converged = np.ones(len(paths), dtype=bool)
+    within = {}
+    environment_log_returns = np.empty(paths.shape[:2] + (len(members),))
+    for i, (environment, idx) in enumerate(members.items()):
+        weights, _, diagnostics = calc_risk_parity_weights_batch(covs[:, idx][:, :, idx])
+        within[environment] = weights
+        converged &= diagnostics['converged']
+        environment_log_returns[:, :, i] = \
+            np.log1p(np.einsum('ptn,pn->pt', simple_returns[:, :, idx], weights))
+    environment_weights, _, diagnostics = \
+        calc_risk_parity_weights_batch(_batch_covariance(environment_log_returns))
+    converged &= diagnostics['converged']
+    final_weights = np.zeros(paths.shape[::2])
+    for i, (environment, idx) in enumerate(members.items()):
+        final_weights[:, idx] += environment_weights[:, i, np.newaxis] * within[environment]
+    return final_weights, environment_weights, converged
+
+
+def evaluate_paths(paths, members, cov, index):
+    """
+    Inputs:
+    - 'paths' and 'members': see solve_paths()
+    - 'cov': covariance matrix of the actual returns (with the
+        COVARIANCE_ESTIMATOR), to measure how the risk of each path's weights
+        would actually have been split
+    - 'index': the dates of the actual returns, for the annual returns
+
+    Outputs:
+    - DataFrame, one row per path, with the ticker and environment weights,
+        each ticker's risk contribution under 'cov', whether the solves
+        converged, and the in-sample performance stats of the path
+    """
+    final_weights, environment_weights, converged = solve_paths(paths, members)
+    risk = final_weights * (final_weights @ cov)
+    risk_contributions = risk / risk.sum(axis=1, keepdims=True)
+    simple_returns = np.einsum('ptn,pn->tp', np.expm1(paths), final_weights)
+    stats = get_batch_portfolio_stats(pd.DataFrame(simple_returns, index=index))
+    n = final_weights.shape[1]
+    columns = [('weight', i) for i in range(n)] + [('risk_contribution', i) for i in range(n)] \
+        + [('environment_weight', environment) for environment in members]
+    results = pd.DataFrame(np.hstack([final_weights, risk_contributions, environment_weights]),
+                           columns=pd.MultiIndex.from_tuples(columns))
+    results[('converged', '')] = converged
+    for stat in stats:
+        results[('stat', stat)] = stats[stat].to_numpy()
+    return results
+
+
+# each worker process memory-maps the shared returns panel once, and
+# estimates its covariance once, in _init_worker()
+_log_returns = None
+_index = None
+_cov = None
+
+
+def _init_worker(path, name, estimator='sample', halflife=None):
+    global _log_returns, _index, _cov
+    dates, _, _log_returns = NpyStore(path).read_arrays(name)
+    _index = pd.DatetimeIndex(dates)
+    _cov = estimate_covariance(np.asarray(_log_returns), estimator, halflife)
+
+
+def _evaluate_batch(job):
+    seed, n_paths, method, block_length, members = job
+    rng = np.random.default_rng(seed)
+    paths = simulate_paths(np.asarray(_log_returns), n_paths, method, block_length, rng)
+    return evaluate_paths(paths, members, _cov, _index)
+
+
+def summarise(results, tickers, quantiles=(0.05, 0.5, 0.95)):
+    """
+    Mean, standard deviation and 'quantiles' of each weight, risk
+    contribution and performance stat over the paths, i.e. their
+    distributions and confidence intervals.
+    """
+    values = results.drop(columns='converged', level=0).rename(
+        columns=dict(enumerate(tickers)), level=1)
+    summary = pd.concat([values.mean().rename('mean'), values.std().rename('std'),
+                         values.quantile(list(quantiles)).T.rename(columns=lambda q: f'{q:.0%}')],
+                        axis=1)
+    summary.index.names = ['measure', 'name']
+    return summary
+
+
+def run_robustness(config, daily_log_returns=None, n_paths=1000, method='bootstrap',
+                   block_length=21, batch_size=100, max_workers=None, seed=0):
+    """
+    Inputs:
+    - 'config': PortfolioConfig
+    - 'daily_log_returns': DataFrame, by default loaded from the store
+    - 'n_paths', 'method' and 'block_length': the paths, see simulate_paths()
+    - 'batch_size': paths solved together by each task of the process pool
+    - 'max_workers': number of worker processes, default is one per CPU
+    - 'seed': the paths are the same for the same seed, whatever the number
+        of workers
+
+    Outputs:
+    - 'results' DataFrame with one row per path, see evaluate_paths()
+    - 'summary' DataFrame from summarise(), also saved in RESULTS_PATH as
+        <PORTFOLIO_NAME>-robustness.csv
+    """
+    if daily_log_returns is None:
+        daily_log_returns, _ = load_returns(config)
+    tickers = config.tickers
+    # whole days are resampled, so only the days every ticker has a return on
+    # are kept (the 'pairwise' MISSING_DATA_POLICY leaves NaNs in the others)
+    daily_log_returns = daily_log_returns[tickers].dropna()
+    columns = {ticker: i for i, ticker in enumerate(tickers)}
+    members = {environment: [columns[ticker] for ticker in environment_tickers]
+               for environment, environment_tickers in config.environments.items()}
+    sizes = [min(batch_size, n_paths - start) for start in range(0, n_paths, batch_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    jobs = [(seeds[i], size, method, block_length, members) for i, size in enumerate(sizes)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        NpyStore(directory + '/').write('panel', daily_log_returns)
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                 initargs=(directory + '/', 'panel', config.covariance_estimator,
+                                           config.ewma_halflife)) as executor:
+            results = pd.concat(executor.map(_evaluate_batch, jobs), ignore_index=True)
+    results.index.name = 'path'
+    summary = summarise(results, tickers)
+    if not os.path.exists(config.results_path):
+        os.makedirs(config.results_path)
+    summary.to_csv(config.results_path+config.portfolio_name+'robustness.csv')
+    return results.rename(columns=dict(enumerate(tickers)), level=1), summary
+
+
+if __name__ == '__main__':
+    print("Starting " + os.path.realpath(__file__))
+    results, summary = run_robustness(PortfolioConfig.from_yaml('portfolio-settings.yaml'),
+                                      n_paths=int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
+    print(summary)
@@ -0,0 +1,324 @@
+import asyncio
+import json
+import os
+import sys
+import numpy as np
+import pandas as pd
+from covariance import (EwmaCovariance, RollingCovariance, estimate_covariance)
+from market_data import default_providers
+from pipeline import (PortfolioConfig, load_returns)
+from time_series import (download_daily_adjusted_price, read_adjusted_close)
+from utils import calc_risk_parity_weights
+
+
+class LivePortfolio:
+    """
+    The returns history, covariance estimates and current weights of a
+    portfolio, kept in memory and updated one daily bar at a time by
+    update(). Each bar is appended to a preallocated buffer and added to the
+    running co-moments of the tickers' and the environments' returns, so an
+    update costs O(n^2) whatever the length of the history ('ledoit_wolf'
+    is the exception, its shrinkage is re-estimated from the whole window).
+    The weights are only re-solved (warm-started from the current ones) when
+    some risk contribution has drifted more than 'drift_threshold' from its
+    budget. The starting weights are the same as calculate_weights() gives
+    for 'daily_log_returns'.
+
+    Inputs:
+    - 'config': PortfolioConfig, using its 'environments',
+        'covariance_estimator', 'ewma_halflife', 'missing_data_policy',
+        'ffill_limit' and, if REBALANCE_FREQUENCY is set, 'lookback_window'
+        as a trailing window (otherwise all the history is used, like the
+        static weights, and 'ewma' always decays the older days away instead)
+    - 'daily_log_returns': DataFrame of the history so far
+    - 'last_prices': dict of each ticker's last adjusted close, which the
+        next bar's returns are from
+    - 'drift_threshold': largest allowed gap between a risk contribution and
+        its budget (e.g. 0.02 is 2% of the risk) before re-solving
+
+    The running covariances need every ticker's return each day, so the
+    'pairwise' MISSING_DATA_POLICY is treated as 'intersection'.
+    """
+
+    def __init__(self, config, daily_log_returns, last_prices, drift_threshold=0.02):
+        self.environments = config.environments
+        self.tickers = config.tickers
+        columns = {ticker: i for i, ticker in enumerate(self.tickers)}
+        self.members = {environment: [columns[ticker] for ticker in tickers]
+                        for environment, tickers in self.environments.items()}
+        self.estimator = config.covariance_estimator
+        self.halflife = config.ewma_halflife
+        self.window = None
+        if config.rebalance_frequency and self.estimator != 'ewma':
+            self.window = config.lookback_window
+        self.missing_data = config.missing_data_policy
+        self.ffill_limit = config.ffill_limit
+        self.drift_threshold = drift_threshold
+        log_returns = daily_log_returns[self.tickers].dropna().to_numpy(dtype=float)
+        if self.window:
+            log_returns = log_returns[-self.window:]
+        self._buffer = np.empty((max(2 * len(log_returns), 256), len(self.tickers)))
+        self._buffer[:len(log_returns)] = log_returns
+        self._start, self._end = 0, len(log_returns)
+        self.date = daily_log_returns.index[-1]
+        self.last_prices = np.array([last_prices[ticker] for ticker in self.tickers], dtype=float)
+        self.missing_days = np.zeros(len(self.tickers), dtype=int)
+        self.moments = self._new_moments(len(self.tickers))
+        if self.moments is not None:
+            self.moments.add(log_returns)
+        self.environment_moments = None
+        self.within = {}
+        self.between = None
+        self.solves = 0
+        self.solve()
+
+    @property
+    def log_returns(self):
+        """The returns history (or trailing window), a view of the buffer."""
+        return self._buffer[self._start:self._end]
+
+    def _new_moments(self, n_columns):
+        """Running co-moments for the estimator, or None if it has none ('ledoit_wolf')."""
+        if self.estimator == 'sample':
+            return RollingCovariance(n_columns)
+        if self.estimator == 'ewma':
+            return EwmaCovariance(n_columns, self.halflife)
+        return None
+
+    def _covariance(self, moments, log_returns):
+        if moments is not None:
+            return moments.covariance()
+        return estimate_covariance(log_returns, self.estimator, self.halflife)
+
+    def _environment_log_returns(self, log_returns):
+        """Log returns of each environment with the current within weights."""
+        simple_returns = np.expm1(np.atleast_2d(log_returns))
+        return np.column_stack([
+            np.log1p(simple_returns[:, self.members[environment]] @ self.within[environment])
+            for environment in self.environments])
+
+    def _environment_covariance(self):
+        if self.environment_moments is not None:
+            return self.environment_moments.covariance()
+        return estimate_covariance(self._environment_log_returns(self.log_returns),
+                                   self.estimator, self.halflife)
+
+    def _append(self, row):
+        if self._end == len(self._buffer):
+            n_rows = self._end - self._start
+            if n_rows <= len(self._buffer) // 2:
+                # move the window back to the start of the buffer
+                self._buffer[:n_rows] = self._buffer[self._start:self._end]
+            else:
+                buffer = np.empty((2 * len(self._buffer), len(self.tickers)))
+                buffer[:n_rows] = self._buffer[self._start:self._end]
+                self._buffer = buffer
+            self._start, self._end = 0, n_rows
+        self._buffer[self._end] = row
+        self._end += 1
+
+    def solve(self):
+        """Re-solves all the weights, warm-started from the current ones if any."""
+        cov = self._covariance(self.moments, self.log_returns)
+        for environment, idx in self.members.items():
+            self.within[environment], _ = calc_risk_parity_weights(
+                cov[np.ix_(idx, idx)], self.within.get(environment))
+        # the environments' returns depend on the within weights, so their
+        # co-moments are rebuilt from the history after each solve
+        self.environment_moments = self._new_moments(len(self.environments))
+        if self.environment_moments is not None:
+            self.environment_moments.add(self._environment_log_returns(self.log_returns))
+        self.between, _ = calc_risk_parity_weights(self._environment_covariance(), self.between)
+        self.solves += 1
+        self.solved_on = self.date
+        self._update_risk_contributions(cov)
+
+    def _update_risk_contributions(self, cov):
+        def risk_contributions(cov, weights):
+            risk = weights * (cov @ weights)
+            return risk / risk.sum()
+        self.risk_contributions = {
+            environment: risk_contributions(cov[np.ix_(idx, idx)], self.within[environment])
+            for environment, idx in self.members.items()}
+        self.between_risk_contributions = \
+            risk_contributions(self._environment_covariance(), self.between)
+        self.drift = max(np.abs(rc - 1 / len(rc)).max() for rc in
+                         list(self.risk_contributions.values()) + [self.between_risk_contributions])
+
+    def update(self, date, prices):
+        """
+        Adds the daily bar of 'prices' (dict of ticker -> adjusted close) on
+        'date'. Bars on or before the current date are ignored. A bar missing
+        some tickers only updates their last prices, unless MISSING_DATA_POLICY
+        is 'ffill' and they've been missing for at most FFILL_LIMIT days, in
+        which case their prices are carried forward (like get_returns_panel()).
+        Returns True if the bar was added.
+        """
+        date = pd.Timestamp(date)
+        if date <= self.date:
+            return False
+        new_prices = np.array([prices.get(ticker, np.nan) for ticker in self.tickers],
+                              dtype=float)
+        missing = np.isnan(new_prices)
+        self.missing_days = np.where(missing, self.missing_days + 1, 0)
+        if self.missing_data == 'ffill':
+            limit = np.inf if self.ffill_limit is None else self.ffill_limit
+            carried = missing & (self.missing_days <= limit)
+            new_prices = np.where(carried, self.last_prices, new_prices)
+            # past the limit, the ticker's next price has no previous one to return from
+            self.last_prices = np.where(missing & ~carried, np.nan, self.last_prices)
+        row = np.log(new_prices / self.last_prices)
+        self.last_prices = np.where(np.isnan(new_prices), self.last_prices, new_prices)
+        if np.isnan(row).any():
+            return False
+        self.date = date
+        self._append(row)
+        environment_row = self._environment_log_returns(row)
+        if self.moments is not None:
+            self.moments.add(row)
+            self.environment_moments.add(environment_row)
+        if self.window and self._end - self._start > self.window:
+            dropped = self._buffer[self._start].copy()
+            self._start += 1
+            if self.moments is not None:
+                self.moments.drop(dropped)
+                self.environment_moments.drop(self._environment_log_returns(dropped))
+        self._update_risk_contributions(self._covariance(self.moments, self.log_returns))
+        if self.drift > self.drift_threshold:
+            self.solve()
+        return True
+
+    def final_weights(self):
+        weights = np.zeros(len(self.tickers))
+        for i, (environment, idx) in enumerate(self.members.items()):
+            np.add.at(weights, idx, self.between[i] * self.within[environment])
+        return weights
+
+    def snapshot(self):
+        """The current target weights and risk contributions, as a JSON-friendly dict."""
+        return {
+            'date': self.date.strftime('%Y-%m-%d'),
+            'weights': dict(zip(self.tickers, self.final_weights().tolist())),
+            'environments': {
+                environment: {'weight': float(self.between[i]),
+                              'risk_contribution': float(self.between_risk_contributions[i]),
+                              'tickers': self.environments[environment],
+                              'weights': self.within[environment].tolist(),
+                              'risk_contributions': self.risk_contributions[environment].tolist()}
+                for i, environment in enumerate(self.environments)},
+            'drift': float(self.drift),
+            'solved_on': self.solved_on.strftime('%Y-%m-%d'),
+            'solves': self.solves}
+
+
+class PortfolioService:
+    """
+    Serves a LivePortfolio over a small local HTTP API:
+    - GET /weights: the current snapshot()
+    - POST /update with {"date": "2024-01-02", "prices": {"VTI": 240.1, ...}}:
+        adds a daily bar and returns the new snapshot()
+    and/or updates it from a data feed with consume().
+    """
+
+    def __init__(self, portfolio):
+        self.portfolio = portfolio
+        self.snapshot = portfolio.snapshot()
+
+    def update(self, date, prices):
+        added = self.portfolio.update(date, prices)
+        if added:
+            self.snapshot = self.portfolio.snapshot()
+        return added
+
+    async def consume(self, feed):
+        """Applies each (date, prices) bar from the async iterator 'feed'."""
+        async for date, prices in feed:
+            self.update(date, prices)
+
+    async def handle(self, reader, writer):
+        try:
+            request_line = (await reader.readline()).decode().split()
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode().strip()
+                if not line:
+                    break
+                key, _, value = line.partition(':')
+                headers[key.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get('content-length', 0)))
+            status, response = self.route(*request_line[:2], body)
+        except Exception as error:
+            status, response = 400, {'error': str(error)}
+        payload = json.dumps(response).encode()
+        writer.write(f'HTTP/1.1 {status} {"OK" if status == 200 else "Error"}\r\n'
+                     'Content-Type: application/json\r\n'
+                     f'Content-Length: {len(payload)}\r\n'
+                     'Connection: close\r\n\r\n'.encode() + payload)
+        await writer.drain()
+        writer.close()
+
+    def route(self, method, path, body):
+        if method == 'GET' and path == '/weights':
+            return 200, self.snapshot
+        if method == 'POST' and path == '/update':
+            bar = json.loads(body)
+            self.update(bar['date'], bar['prices'])
+            return 200, self.snapshot
+        return 404, {'error': f'Unknown request {method} {path}'}
+
+    async def serve(self, host='127.0.0.1', port=8765):
+        """Returns the started asyncio server, call serve_forever() on it to run."""
+        return await asyncio.start_server(self.handle, host, port)
+
+
+async def provider_feed(config, providers, interval=3600, last_date=None):
+    """
+    Yields (date, prices) daily bars as they become available, bringing the
+    stored prices up to date from the providers every 'interval' seconds.
+    The first poll yields every stored bar after 'last_date' (e.g. the date
+    of the LivePortfolio), or none if it's None. Bars after the last date of
+    a downloaded ticker that's lagging behind the others are held back until
+    it has caught up, so its price on those dates isn't skipped.
+    """
+    downloaded = [ticker for ticker in config.tickers
+                  if ticker not in config.custom_data_list] or config.tickers
+    while True:
+        await asyncio.to_thread(download_daily_adjusted_price, config.tickers, providers,
+                                config.store, config.custom_data_list)
+        adjusted_close = await asyncio.to_thread(read_adjusted_close, config.tickers,
+                                                 config.store)
+        complete = adjusted_close[downloaded].apply(pd.Series.last_valid_index).min()
+        if last_date is not None:
+            bars = adjusted_close.loc[(adjusted_close.index > last_date)
+                                      & (adjusted_close.index <= complete)]
+            for date, prices in bars.iterrows():
+                yield date, prices.dropna().to_dict()
+        last_date = max(complete, last_date or complete)
+        await asyncio.sleep(interval)
+
+
+def load_live_portfolio(config):
+    """A LivePortfolio from the returns and prices saved by the fetch stage."""
+    daily_log_returns, _ = load_returns(config)
+    adjusted_close = read_adjusted_close(config.tickers, config.store).ffill()
+    last_prices = adjusted_close.loc[adjusted_close.index <= daily_log_returns.index[-1]].iloc[-1]
+    return LivePortfolio(config, daily_log_returns, last_prices.to_dict(),
+                         config.drift_threshold)
+
+
+async def main(port=8765, interval=3600):
+    config = PortfolioConfig.from_yaml('portfolio-settings.yaml')
+    portfolio = load_live_portfolio(config)
+    service = PortfolioService(portfolio)
+    server = await service.serve(port=port)
+    print(f'Serving the current weights on http://127.0.0.1:{port}/weights')
+    providers = default_providers(os.getenv("ALPHAVANTAGE_KEY"))
+    async with server:
+        await asyncio.gather(server.serve_forever(),
+                             service.consume(provider_feed(config, providers, interval,
+                                                          portfolio.date)))
+
+
+if __name__ == '__main__':
+    print("Starting " + os.path.realpath(__file__))
+    asyncio.run(main(*map(int, sys.argv[1:3])))
@@ -0,0 +1,153 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from instrumentation import timed
+from utils import (read_and_validate_csv_time_series, validate_time_series)
+
+
+def get_store(path, storage_format='csv'):
+    """
+    Inputs:
+    - 'path': folder the time series are stored in, e.g. config 'DATA_PATH'
+    - 'storage_format': 'csv', 'parquet' (needs pyarrow) or 'npy'
+
+    Outputs:
+    - a store with read(name), write(name, df), append(name, df),
+        exists(name) and export_csv(name) methods, where 'name' is e.g. a
+        ticker or 'Global-daily-log-returns-per-ticker'
+    """
+    stores = {'csv': CsvStore, 'parquet': ParquetStore, 'npy': NpyStore}
+    if storage_format not in stores:
+        raise Exception(f'Error! Unknown STORAGE_FORMAT "{storage_format}", '
+                        'use "csv", "parquet" or "npy"')
+    return stores[storage_format](path)
+
+
+class CsvStore:
+    """
+    Time series (DataFrames with a date index) stored as one .csv each. The
+    other stores share this interface but keep the data typed and already
+    validated and sorted, so reading it back needs no parsing.
+    """
+    extension = '.csv'
+
+    def __init__(self, path):
+        self.path = path
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+    def file(self, name):
+        return self.path+name+self.extension
+
+    def exists(self, name):
+        return os.path.exists(self.file(name))
+
+    @timed('store.read')
+    def read(self, name):
+        return read_and_validate_csv_time_series(self.file(name))
+
+    @timed('store.write')
+    def write(self, name, df):
+        df = validate_time_series(_to_frame(df), self.file(name))
+        self._write(name, df)
+
+    def append(self, name, df):
+        """Adds rows dated after the last stored row."""
+        df = _to_frame(df)
+        if len(df):
+            stored_dates = pd.read_csv(self.file(name), usecols=[0], index_col=0).index
+            _check_append(self.file(name), stored_dates, df)
+            df.to_csv(self.file(name), mode='a', header=False)
+
+    def export_csv(self, name, path=None):
+        self.read(name).to_csv(path or self.path+name+'.csv', header=True)
+
+    def _write(self, name, df):
+        # write to a temporary file first, so an interrupted write leaves the old file
+        df.to_csv(self.file(name)+'.tmp', header=True)
+        os.replace(self.file(name)+'.tmp', self.file(name))
+
+
+class ParquetStore(CsvStore):
+    extension = '.parquet'
+
+    @timed('store.read')
+    def read(self, name):
+        return pd.read_parquet(self.file(name))
+
+    def append(self, name, df):
+        if len(df):
+            stored = self.read(name)
+            _check_append(self.file(name), stored.index, _to_frame(df))
+            self._write(name, pd.concat([stored, _to_frame(df)]))
+
+    def _write(self, name, df):
+        df.to_parquet(self.file(name)+'.tmp')
+        os.replace(self.file(name)+'.tmp', self.file(name))
+
+
+class NpyStore(CsvStore):
+    """
+    Stores each time series as a float64 .npy matrix, plus its dates in
+    <name>.dates.npy and its column names in <name>.columns.json. read()
+    memory-maps the matrix, so only the pages actually used are loaded and
+    several processes reading the same file share one copy of it.
+    """
+    extension = '.npy'
+
+    @timed('store.read')
+    def read(self, name):
+        dates, columns, values = self.read_arrays(name)
+        return pd.DataFrame(values, index=pd.DatetimeIndex(dates, name='date'),
+                            columns=columns, copy=False)
+
+    def read_arrays(self, name):
+        """Returns the (dates, columns, memory-mapped values) without pandas."""
+        values = np.load(self.file(name), mmap_mode='r')
+        dates = np.load(self.path+name+'.dates.npy')
+        with open(self.path+name+'.columns.json') as f:
+            columns = json.load(f)
+        if values.shape != (len(dates), len(columns)):
+            raise Exception(f'Error! The matrix, dates and columns files of "{name}" in '
+                            f'{self.path} don\'t match, write it again')
+        return dates, columns, values
+
+    def append(self, name, df):
+        if len(df):
+            stored = self.read(name)
+            _check_append(self.file(name), stored.index, _to_frame(df))
+            self._write(name, pd.concat([stored, _to_frame(df)]))
+
+    def _write(self, name, df):
+        values = df.to_numpy(dtype=np.float64)
+        dates = pd.DatetimeIndex(df.index).to_numpy()
+        # write all three files to temporary files first, then swap them in,
+        # so an interrupted write leaves the old ones (which may still be
+        # memory-mapped) in place
+        np.save(self.path+name+'.tmp.npy', values)
+        np.save(self.path+name+'.dates.tmp.npy', dates)
+        with open(self.path+name+'.columns.tmp.json', 'w') as f:
+            json.dump([str(column) for column in df.columns], f)
+        os.replace(self.path+name+'.tmp.npy', self.file(name))
+        os.replace(self.path+name+'.dates.tmp.npy', self.path+name+'.dates.npy')
+        os.replace(self.path+name+'.columns.tmp.json', self.path+name+'.columns.json')
+
+
+def _to_frame(df):
+    if isinstance(df, pd.Series):
+        df = df.to_frame()
+    if df.index.name is None:
+        df = df.rename_axis('date')
+    return df
+
+
+def _check_append(path, stored_dates, df):
+    """Raises unless the rows of 'df' are in date order and after 'stored_dates'."""
+    dates = pd.DatetimeIndex(pd.to_datetime(df.index))
+    if len(stored_dates) and dates[0] <= pd.to_datetime(stored_dates).max() \
+            or dates.has_duplicates or not dates.is_monotonic_increasing:
+        raise Exception(f'\nDirty Data!\n\n\
+            The rows appended to\n\n\
+            {path}\n\n\
+            should be in date order, each date or timestamp only once, and after the last stored row\n')
@@ -0,0 +1,173 @@
+import itertools
+import json
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import yaml
+from covariance import CovarianceCache
+from performance import (get_daily_portfolio_returns, get_portfolio_stats)
+from pipeline import (PortfolioConfig, load_returns)
+from storage import NpyStore
+from walk_forward import (get_walk_forward_weights, get_walk_forward_portfolio_returns)
+from weights import calc_environment_weights
+
+
+def expand_grid(grid):
+    """
+    Inputs:
+    - 'grid': dict of setting -> list of values to try, e.g.
+        {'LOOKBACK_WINDOW': [252, 504], 'REBALANCE_FREQUENCY': ['monthly', 'quarterly']}
+
+    Outputs:
+    - list of dicts of settings, one for every combination of the values
+    """
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*grid.values())]
+
+
+def evaluate_variant(config, daily_log_returns, benchmark_simple_returns,
+                     covariance_cache=None):
+    """
+    Inputs:
+    - 'config': PortfolioConfig of the variant
+    - 'daily_log_returns': DataFrame holding (at least) the variant's tickers
+    - 'benchmark_simple_returns': DataFrame of the base config's benchmark,
+        used when the variant's benchmark tickers aren't in daily_log_returns
+    - 'covariance_cache': optional CovarianceCache of daily_log_returns,
+        shared by the variants
+
+    Outputs:
+    - 'portfolio_stats' DataFrame, like get_portfolio_stats(). Nothing is
+        saved and nothing is plotted.
+    """
+    if covariance_cache is None:
+        covariance_cache = CovarianceCache(daily_log_returns)
+    # a copy of only the variant's columns, the rest of the panel stays mapped
+    daily_log_returns = daily_log_returns[config.tickers]
+    if set(config.benchmark_tickers) <= set(daily_log_returns.columns):
+        benchmark_simple_returns = pd.DataFrame(
+            {'benchmark': (np.exp(daily_log_returns[config.benchmark_tickers].to_numpy()) - 1)
+             @ np.asarray(config.benchmark_ticker_weights)},
+            index=daily_log_returns.index)
+    if config.rebalance_frequency:
+        walk_forward_weights = get_walk_forward_weights(daily_log_returns, config.environments,
+                                                        config.lookback_window,
+                                                        config.rebalance_frequency,
+                                                        config.covariance_estimator,
+                                                        config.ewma_halflife)
+        simple_returns, cumulative_returns = \
+            get_walk_forward_portfolio_returns(daily_log_returns, walk_forward_weights)
+        benchmark_simple_returns = benchmark_simple_returns.loc[
+            benchmark_simple_returns.index >= simple_returns.index[0]]
+    else:
+        final_ticker_weights = calc_environment_weights(
+            daily_log_returns, config, checkpoint=False, covariance_cache=covariance_cache,
+            weights_cache=config.weights_cache).final_ticker_weights()
+        simple_returns, cumulative_returns = \
+            get_daily_portfolio_returns(daily_log_returns, final_ticker_weights.reset_index())
+    benchmark_cum_returns = (1 + benchmark_simple_returns).cumprod() - 1
+    return get_portfolio_stats(cumulative_returns, simple_returns,
+                               benchmark_cum_returns, benchmark_simple_returns)
+
+
+# each worker process memory-maps the shared returns panel once, in _init_worker()
+_panel = None
+_benchmark = None
+_covariance_cache = None
+
+
+def _init_worker(path, name, benchmark_simple_returns):
+    global _panel, _benchmark, _covariance_cache
+    _panel = NpyStore(path).read(name)
+    _benchmark = benchmark_simple_returns
+    _covariance_cache = CovarianceCache(_panel)
+
+
+def _evaluate_settings(settings):
+    return evaluate_variant(PortfolioConfig(settings), _panel, _benchmark, _covariance_cache)
+
+
+def run_sweep(config, variants, daily_log_returns=None, benchmark_simple_returns=None,
+              max_workers=None):
+    """
+    Inputs:
+    - 'config': the base PortfolioConfig
+    - 'variants': list of dicts of settings overriding the base settings, e.g.
+        from expand_grid(). Each variant is named PORTFOLIO_NAME-<number>
+        unless it sets its own PORTFOLIO_NAME.
+    - 'daily_log_returns' and 'benchmark_simple_returns': the shared returns
+        panel, by default loaded once from the base config's store. It must
+        hold every variant's tickers.
+    - 'max_workers': number of worker processes, default is one per CPU
+
+    Outputs:
+    - one combined 'sweep_stats' DataFrame, indexed by (variant, portfolio or
+        benchmark), with the performance stats and the settings each variant
+        changed. Also saved as <PORTFOLIO_NAME>-sweep-performance_stats.csv in
+        RESULTS_PATH.
+
+    The panel is written once as a memory-mapped .npy matrix which all the
+    workers map, so the whole panel isn't pickled or copied for each worker.
+    Each variant does copy its own tickers' columns out of it, since the
+    weights and returns functions work on DataFrames of those columns.
+    """
+    if daily_log_returns is None:
+        daily_log_returns, benchmark_simple_returns = load_returns(config)
+    all_settings = []
+    for i, overrides in enumerate(variants):
+        settings = dict(config.settings, **overrides)
+        if 'PORTFOLIO_NAME' not in overrides:
+            settings['PORTFOLIO_NAME'] = f'{config.name}-{i:03d}'
+        missing = set(PortfolioConfig(settings).tickers) - set(daily_log_returns.columns)
+        if missing:
+            raise Exception(f'Error! The returns panel has no data for {sorted(missing)}, '
+                            f'needed by variant {settings["PORTFOLIO_NAME"]}')
+        all_settings.append(settings)
+
+    with tempfile.TemporaryDirectory() as directory:
+        NpyStore(directory + '/').write('panel', daily_log_returns)
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                 initargs=(directory + '/', 'panel',
+                                           benchmark_simple_returns)) as executor:
+            all_stats = list(executor.map(_evaluate_settings, all_settings))
+
+    frames = []
+    for settings, overrides, portfolio_stats in zip(all_settings, variants, all_stats):
+        for key, value in overrides.items():
+            portfolio_stats[key] = value if np.isscalar(value) else json.dumps(value)
+        frames.append(portfolio_stats.assign(variant=settings['PORTFOLIO_NAME']))
+    sweep_stats = pd.concat(frames, sort=False)
+    sweep_stats.index.name = 'series'
+    sweep_stats = sweep_stats.reset_index().set_index(['variant', 'series'])
+    if not os.path.exists(config.results_path):
+        os.makedirs(config.results_path)
+    sweep_stats.to_csv(config.results_path+config.portfolio_name+'sweep-performance_stats.csv')
+    return sweep_stats
+
+
+def main(sweep_path):
+    """
+    Runs a sweep from a .yaml file with a GRID of settings to combine and/or
+    a list of VARIANTS, each overriding settings in portfolio-settings.yaml:
+
+        GRID:
+          LOOKBACK_WINDOW: [252, 504]
+          REBALANCE_FREQUENCY: ["monthly", "quarterly"]
+        VARIANTS:
+          - BENCHMARK_TICKER_WEIGHTS: [.5, .5]
+    """
+    config = PortfolioConfig.from_yaml('portfolio-settings.yaml')
+    with open(sweep_path) as f:
+        sweep = yaml.safe_load(f)
+    variants = list(sweep.get('VARIANTS') or [])
+    if sweep.get('GRID'):
+        variants += expand_grid(sweep['GRID'])
+    print(run_sweep(config, variants))
+
+
+if __name__ == '__main__':
+    print("Starting " + os.path.realpath(__file__))
+    main(sys.argv[1])
@@ -0,0 +1,24 @@
+import numpy as np
+import pandas as pd
+
+TICKERS = ['A', 'B', 'C', 'D', 'E']
+VOLS = np.array([1, 2, 3, 0.5, 1.5])
+
+
+def simulate_log_returns(n_days=500, seed=0, index=None, vol=0.005, drift=0.0):
+    """
+    Independent normal log returns for the tickers A to E, each with its own
+    multiple of 'vol', one row per business day from 2010-01-01 or per
+    timestamp of 'index'. 'seed' can also be a numpy Generator.
+    """
+    rng = np.random.default_rng(seed)
+    if index is None:
+        index = pd.bdate_range('2010-01-01', periods=n_days)
+    returns = rng.normal(drift, VOLS * vol, size=(len(index), len(TICKERS)))
+    return pd.DataFrame(returns, index=index, columns=TICKERS)
+
+
+def simulate_prices(n_days=500, seed=0, index=None, vol=0.005, drift=0.0):
+    """Prices starting from 100 with the log returns of simulate_log_returns()."""
+    log_returns = simulate_log_returns(n_days, seed, index, vol, drift)
+    return 100 * np.exp(log_returns.cumsum())
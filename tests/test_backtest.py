@@ -0,0 +1,102 @@
+import tempfile
+import numpy as np
+import pandas as pd
+from backtest import (get_backtest_stats, get_rebalance_days, get_ticker_costs,
+                      run_backtest, run_backtests)
+from metrics import get_batch_portfolio_stats
+from performance import (get_daily_portfolio_returns, get_portfolio_stats)
+from pipeline import PortfolioConfig
+import unittest
+
+
+class TestBacktest(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(5)
+        index = pd.bdate_range('2015-01-01', periods=600, name='date')
+        self.daily_log_returns = pd.DataFrame(
+            rng.normal(0.0003, [0.004, 0.012, 0.02], size=(600, 3)),
+            index=index, columns=['A', 'B', 'C'])
+        self.daily_simple_returns = np.expm1(self.daily_log_returns)
+        self.final_ticker_weights = pd.DataFrame({'ticker': ['A', 'B', 'C'],
+                                                  'weight': [0.6, 0.3, 0.1]})
+        self.target_weights = self.final_ticker_weights.set_index('ticker')['weight']
+
+    def test_daily_rebalance_without_costs_matches_constant_weights(self):
+        backtest = run_backtest(self.daily_simple_returns, self.target_weights,
+                                [{'frequency': 'daily'}, {'band': 0}])
+        simple_returns, cumulative_returns = get_daily_portfolio_returns(
+            self.daily_log_returns, self.final_ticker_weights)
+        for name in [0, 1]:
+            np.testing.assert_allclose(backtest['simple_returns'][name],
+                                       simple_returns['portfolio_simple_returns'])
+        expected = get_portfolio_stats(cumulative_returns, simple_returns,
+                                       cumulative_returns, simple_returns)
+        stats = get_backtest_stats(backtest)
+        np.testing.assert_allclose(stats.loc[0, ['annual_return', 'max_drawdown']],
+                                   expected.loc['portfolio', ['annual_return', 'max_drawdown']])
+        self.assertAlmostEqual(stats.loc[0, 'cost_drag'], 0)
+
+    def test_buy_and_hold_drifts(self):
+        backtest = run_backtest(self.daily_simple_returns, self.target_weights, [{}])
+        # without rebalancing, the value of each holding just compounds
+        growth = (1 + self.daily_simple_returns).prod().to_numpy() @ self.target_weights.to_numpy()
+        self.assertAlmostEqual((1 + backtest['simple_returns'][0]).prod(), growth)
+        self.assertEqual(backtest['turnover'][0].sum(), 0)
+
+    def test_bands_and_calendar(self):
+        scenarios = [{'band': 0.02}, {'band': 0.5}, {'frequency': 'quarterly'},
+                     {'frequency': 'monthly', 'band': 0.02}]
+        stats = get_backtest_stats(run_backtest(self.daily_simple_returns,
+                                                self.target_weights, scenarios))
+        self.assertGreater(stats.loc[0, 'rebalances'], 0)
+        # a zero band rebalances on any drift, unlike no band at all
+        zero_band = get_backtest_stats(run_backtest(self.daily_simple_returns,
+                                                    self.target_weights, [{'band': 0}, {}]))
+        self.assertEqual(list(zero_band['rebalances']), [len(self.daily_simple_returns), 0])
+        self.assertEqual(stats.loc[1, 'rebalances'], 0)
+        self.assertEqual(stats.loc[2, 'rebalances'],
+                         get_rebalance_days(self.daily_simple_returns.index, 'quarterly').sum())
+        self.assertGreaterEqual(stats.loc[3, 'rebalances'], stats.loc[0, 'rebalances'])
+
+    def test_costs(self):
+        scenarios = [{'band': 0.02, 'name': 'free'},
+                     {'band': 0.02, 'costs': 10, 'name': 'flat'},
+                     {'band': 0.02, 'costs': {'default': 10, 'C': 50}, 'name': 'per-ticker'}]
+        backtest = run_backtest(self.daily_simple_returns, self.target_weights, scenarios)
+        np.testing.assert_allclose(get_ticker_costs(['A', 'C'], {'default': 10, 'C': 50}),
+                                   [0.001, 0.005])
+        # the trades are the same, only what they cost differs
+        np.testing.assert_allclose(backtest['turnover']['flat'], backtest['turnover']['free'])
+        np.testing.assert_allclose(backtest['costs']['flat'], backtest['turnover']['flat'] * 0.001)
+        np.testing.assert_allclose(backtest['gross_simple_returns']['per-ticker'],
+                                   backtest['simple_returns']['free'])
+        stats = get_backtest_stats(backtest)
+        self.assertAlmostEqual(stats.loc['free', 'cost_drag'], 0)
+        self.assertGreater(stats.loc['flat', 'cost_drag'], 0)
+        self.assertGreater(stats.loc['per-ticker', 'cost_drag'], stats.loc['flat', 'cost_drag'])
+        np.testing.assert_allclose(stats['annual_return'] + stats['cost_drag'],
+                                   get_batch_portfolio_stats(
+                                       backtest['gross_simple_returns'])['annual_return'])
+
+    def test_run_backtests_saves_stats(self):
+        with tempfile.TemporaryDirectory() as directory:
+            config = PortfolioConfig({'PORTFOLIO_NAME': 'Test',
+                                      'DATA_PATH': directory + '/data/',
+                                      'RESULTS_PATH': directory + '/results/',
+                                      'BENCHMARK_TICKERS': ['A'],
+                                      'BENCHMARK_TICKER_WEIGHTS': [1],
+                                      'CUSTOM_DATA_LIST': [],
+                                      'ENVIRONMENTS': {'ONE': ['A', 'B', 'C']}})
+            benchmark_simple_returns = self.daily_simple_returns[['A']]
+            stats = run_backtests(config, [{'band': 0.05, 'costs': 5, 'name': 'band'}],
+                                  self.daily_log_returns, benchmark_simple_returns,
+                                  self.final_ticker_weights)
+            self.assertEqual(list(stats.index), ['band', 'benchmark'])
+            saved = pd.read_csv(config.results_path + 'Test-backtest-performance_stats.csv',
+                                index_col=0)
+            self.assertEqual(list(saved.columns), list(stats.columns))
+
+
+if __name__ == '__main__':
+    unittest.main()
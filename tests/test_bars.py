@@ -0,0 +1,65 @@
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from bars import (iter_price_chunks, get_streaming_covariance, get_streaming_weights)
+from pipeline import PortfolioConfig
+from simulate import simulate_prices
+from time_series import get_returns_panel
+from weights import (get_weights_within_environment, get_weights_between_environments)
+import unittest
+
+
+def simulate_bars(n_days=20, seed=4):
+    """Minute bars for 6 trading hours a day, with some bars missing."""
+    rng = np.random.default_rng(seed)
+    days = pd.bdate_range('2021-03-01', periods=n_days)
+    index = pd.DatetimeIndex(np.concatenate([
+        day + pd.Timedelta(hours=9, minutes=30) + pd.timedelta_range(0, periods=360, freq='min')
+        for day in days]), name='timestamp')
+    prices = simulate_prices(seed=rng, index=index, vol=0.0005)
+    return prices.mask(rng.random(prices.shape) < 0.02)
+
+
+class TestBars(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name + '/'
+        self.prices = simulate_bars()
+        self.config = PortfolioConfig({
+            'PORTFOLIO_NAME': 'Test', 'DATA_PATH': self.path, 'RESULTS_PATH': self.path,
+            'BENCHMARK_TICKERS': ['A'], 'BENCHMARK_TICKER_WEIGHTS': [1],
+            'ENVIRONMENTS': {'ONE': ['A', 'B', 'C'], 'TWO': ['C', 'D'], 'THREE': ['A', 'E']}})
+        # one partition file per day, plus the same bars in one file
+        os.makedirs(self.path + 'bars')
+        for day, bars in self.prices.groupby(self.prices.index.date):
+            bars.to_csv(self.path + f'bars/{day}.csv')
+        self.prices.to_csv(self.path + 'bars.csv')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_matches_in_memory_weights(self):
+        returns = get_returns_panel(self.prices)
+        within = get_weights_within_environment(returns, self.config, checkpoint=False)
+        between = get_weights_between_environments(returns, within, self.config,
+                                                   checkpoint=False)
+        for path, chunksize in [(self.path + 'bars', None), (self.path + 'bars.csv', 997)]:
+            cov, count = get_streaming_covariance(path, ['A', 'B', 'C', 'D', 'E'], chunksize)
+            self.assertEqual(count, len(returns))
+            np.testing.assert_allclose(cov, returns.cov().to_numpy(), rtol=1e-9)
+            streamed = get_streaming_weights(path, self.config, chunksize)
+            for expected, actual in zip([within, between], streamed):
+                pd.testing.assert_frame_equal(actual.reset_index(drop=True),
+                                              expected.reset_index(drop=True), rtol=1e-6)
+
+    def test_out_of_order_partitions(self):
+        first_day = self.prices.loc[self.prices.index.date == self.prices.index[0].date()]
+        first_day.to_csv(self.path + 'bars/9999-12-31.csv')
+        with self.assertRaises(Exception):
+            list(iter_price_chunks(self.path + 'bars', ['A', 'B']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+import os
+import tempfile
+from benchmark import (simulate_returns_panel, run_benchmarks, save_results, load_results,
+                       compare_results)
+import unittest
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_simulated_panel(self):
+        daily_log_returns, environments = simulate_returns_panel(40, 300, overlap=0.5)
+        self.assertEqual(daily_log_returns.shape, (300, 40))
+        self.assertEqual(len(environments), 4)
+        memberships = sum(len(tickers) for tickers in environments.values())
+        self.assertEqual(memberships, 40 + 20)
+        self.assertEqual(set().union(*environments.values()), set(daily_log_returns.columns))
+
+    def test_run_save_and_compare(self):
+        results = run_benchmarks([(8, 250, 0.25)], repeat=1)
+        self.assertEqual(len(results), 5)
+        self.assertTrue(all(result['median'] > 0 for result in results))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'benchmarks.jsonl')
+            save_results(results, path)
+            save_results(results, path)
+            self.assertEqual(load_results(path), results * 2)
+        slower = [dict(result, median=result['median'] * 2) for result in results]
+        comparison = compare_results(slower, results)
+        self.assertEqual(len(comparison), 5)
+        self.assertTrue(comparison['regressed'].all())
+        self.assertFalse(compare_results(results, results)['regressed'].any())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import numpy as np
+from covariance import (CovarianceCache, EwmaCovariance, estimate_covariance,
+                        ledoit_wolf_covariance)
+from simulate import simulate_log_returns
+import unittest
+
+
+class TestEwmaCovariance(unittest.TestCase):
+
+    def test_matches_pandas(self):
+        returns = simulate_log_returns(seed=2)
+        expected = returns.ewm(halflife=30).cov().loc[returns.index[-1]].to_numpy()
+        # adding the days one chunk at a time gives the same as all at once
+        ewma = EwmaCovariance(returns.shape[1], 30)
+        for chunk in np.array_split(returns.to_numpy(), 7):
+            ewma.add(chunk)
+        np.testing.assert_allclose(ewma.covariance(), expected, rtol=1e-9)
+        np.testing.assert_allclose(estimate_covariance(returns.to_numpy(), 'ewma', 30),
+                                   expected, rtol=1e-9)
+
+
+class TestLedoitWolf(unittest.TestCase):
+
+    def test_shrinks_towards_scaled_identity(self):
+        returns = simulate_log_returns(n_days=60, seed=2).to_numpy()
+        sample = np.cov(returns, rowvar=False, bias=True)
+        shrunk = ledoit_wolf_covariance(returns)
+        np.testing.assert_allclose(np.trace(shrunk), np.trace(sample))
+        off_diagonal = ~np.eye(len(sample), dtype=bool)
+        self.assertLess(np.abs(shrunk[off_diagonal]).sum(), np.abs(sample[off_diagonal]).sum())
+        np.testing.assert_allclose(shrunk, shrunk.T)
+
+    def test_unknown_estimator(self):
+        with self.assertRaises(Exception):
+            estimate_covariance(simulate_log_returns(seed=2).to_numpy(), 'median')
+
+
+class TestCovarianceCache(unittest.TestCase):
+
+    def test_serves_sub_blocks_of_one_matrix(self):
+        returns = simulate_log_returns(seed=2)
+        cache = CovarianceCache(returns)
+        for tickers in [['A', 'B', 'C'], ['C', 'D'], ['E', 'A']]:
+            np.testing.assert_allclose(cache.get(tickers), returns[tickers].cov().to_numpy())
+        self.assertEqual(len(cache.matrices), 1)
+        start = returns.index[100]
+        np.testing.assert_allclose(cache.get(['B', 'D'], start=start),
+                                   returns.loc[start:, ['B', 'D']].cov().to_numpy())
+        self.assertEqual(len(cache.matrices), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
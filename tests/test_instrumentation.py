@@ -0,0 +1,62 @@
+import json
+import os
+import tempfile
+import numpy as np
+from instrumentation import (RunReport, active_report, timed)
+from utils import calc_risk_parity_weights
+import unittest
+
+
+@timed('double')
+def double(x):
+    return 2 * x
+
+
+class TestRunReport(unittest.TestCase):
+
+    def test_stages_timers_and_solves(self):
+        cov = np.array([[1.0, 0.2, 0.1], [0.2, 2.0, 0.3], [0.1, 0.3, 4.0]]) * 1e-4
+        self.assertEqual(double(2), 4)  # nothing recorded outside recording()
+        report = RunReport(memory=True)
+        with report.recording():
+            self.assertIs(active_report(), report)
+            with report.stage('outer'):
+                with report.stage('inner'):
+                    big = np.ones(2**20)  # 8MB
+                    del big
+                double(1)
+                weights, _ = calc_risk_parity_weights(cov)
+                calc_risk_parity_weights(cov, weights * [1.1, 1, 0.9])
+        self.assertIsNone(active_report())
+        stages = {stage['stage']: stage for stage in report.stages}
+        self.assertEqual(list(stages), ['inner', 'outer'])
+        self.assertGreaterEqual(stages['inner']['peak_memory_mb'], 8)
+        # the outer stage's peak includes the inner one's
+        self.assertGreaterEqual(stages['outer']['peak_memory_mb'],
+                                stages['inner']['peak_memory_mb'])
+        self.assertGreaterEqual(stages['outer']['seconds'], stages['inner']['seconds'])
+        self.assertEqual(report.timers['double']['calls'], 1)
+        self.assertEqual([(solve['stage'], solve['solver'], solve['n_assets'])
+                          for solve in report.solves],
+                         [('outer', 'rpp.vanilla', 3), ('outer', 'newton', 3)])
+        self.assertIsNone(report.solves[0]['iterations'])
+        self.assertGreater(report.solves[1]['iterations'], 0)
+
+    def test_write_with_profile(self):
+        report = RunReport(profile=True)
+        with report.recording():
+            with report.stage('work'):
+                double(3)
+        with tempfile.TemporaryDirectory() as directory:
+            path = directory + '/results/Test-run-report.json'
+            report.write(path)
+            with open(path) as f:
+                written = json.load(f)
+            self.assertEqual(written['stages'][0]['stage'], 'work')
+            self.assertNotIn('peak_memory_mb', written['stages'][0])
+            self.assertEqual(written['solves']['count'], 0)
+            self.assertTrue(os.path.exists(directory + '/results/Test-run-report.prof'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,331 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import pandas as pd
+from market_data import (DataProvider, TokenBucket, alpha_vantage_fetcher,
+                         fetch_adjusted_close, import_long_format_prices,
+                         update_adjusted_close)
+from storage import get_store
+from time_series import download_daily_adjusted_price
+from utils import read_and_validate_csv_time_series
+import unittest
+
+
+class StubAlphaVantage(BaseHTTPRequestHandler):
+    """Serves canned TIME_SERIES_DAILY_ADJUSTED responses, failing for 'BAD'.
+    'compact' responses only have the last 2 days of 'prices'."""
+    protocol_version = 'HTTP/1.1'  # keep-alive
+    requests = []
+    prices = {}
+
+    def do_GET(self):
+        query = parse_qs(urlsplit(self.path).query)
+        symbol = query['symbol'][0]
+        self.requests.append((symbol, query['outputsize'][0]))
+        prices = self.prices.get(symbol, {'2020-01-01': 0.0, '2020-01-02': 10.0,
+                                          '2020-01-03': 11.0})
+        if query['outputsize'][0] == 'compact':
+            prices = dict(sorted(prices.items())[-2:])
+        if symbol == 'BAD':
+            data = {'Error Message': 'Invalid API call'}
+        else:
+            data = {'Time Series (Daily)': {date: {'5. adjusted close': str(price)}
+                                            for date, price in prices.items()}}
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestMarketData(unittest.TestCase):
+
+    def setUp(self):
+        StubAlphaVantage.requests = []
+        StubAlphaVantage.prices = {}
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubAlphaVantage)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f'http://127.0.0.1:{self.server.server_address[1]}/query'
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_downloads_each_ticker_once(self):
+        provider = DataProvider('stub', alpha_vantage_fetcher('key', self.base_url),
+                                retries=0)
+        data = fetch_adjusted_close(['VTI', 'VEA', 'VTI', 'TLT', 'VEA'], [provider])
+        self.assertEqual(sorted(symbol for symbol, _ in StubAlphaVantage.requests),
+                         ['TLT', 'VEA', 'VTI'])
+        # the non-positive price is dropped and dates are sorted
+        self.assertEqual(list(data['VTI']), [10.0, 11.0])
+        self.assertEqual(data['VTI'].index[0], pd.Timestamp('2020-01-02'))
+
+    def test_falls_back_to_next_provider(self):
+        primary = DataProvider('stub', alpha_vantage_fetcher('key', self.base_url),
+                               retries=1, backoff=0.01)
+        fallback = DataProvider('fallback', lambda ticker, recent: pd.Series(
+            [5.0], index=pd.to_datetime(['2020-01-02'])), retries=0)
+        data = fetch_adjusted_close(['VTI', 'BAD'], [primary, fallback])
+        self.assertEqual(StubAlphaVantage.requests.count(('BAD', 'full')), 2)  # 1 retry
+        self.assertEqual(list(data['BAD']), [5.0])
+        self.assertEqual(list(data['VTI']), [10.0, 11.0])
+
+    def test_slow_provider_is_hedged(self):
+        def slow(ticker, recent):
+            time.sleep(1)
+            return pd.Series([1.0], index=pd.to_datetime(['2020-01-02']))
+        primary = DataProvider('slow', slow, retries=0)
+        fallback = DataProvider('fallback', lambda ticker, recent: pd.Series(
+            [5.0], index=pd.to_datetime(['2020-01-02'])), retries=0)
+        start = time.monotonic()
+        data = fetch_adjusted_close(['VTI', 'VEA'], [primary, fallback], hedge_after=0.1)
+        self.assertLess(time.monotonic() - start, 0.8)
+        self.assertEqual(list(data['VTI']), [5.0])
+
+    def test_hedged_out_calls_give_up(self):
+        # the whole process, since Python waits for every worker thread on exit
+        script = textwrap.dedent("""
+            import atexit
+            import pandas as pd
+            from market_data import DataProvider, fetch_adjusted_close
+            calls = []
+            atexit.register(lambda: print(len(calls)))
+            primary = DataProvider('limited', lambda ticker, recent: calls.append(ticker) or
+                                   pd.Series([1.0], index=pd.to_datetime(['2020-01-02'])),
+                                   calls_per_minute=60, retries=0)  # 1 call per second
+            fallback = DataProvider('fallback', lambda ticker, recent: pd.Series(
+                [5.0], index=pd.to_datetime(['2020-01-02'])), retries=0)
+            fetch_adjusted_close([f'T{i}' for i in range(6)], [primary, fallback],
+                                 hedge_after=0.1)
+            """)
+        start = time.monotonic()
+        output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True,
+                                check=True, cwd=os.path.dirname(os.path.dirname(
+                                    os.path.abspath(__file__)))).stdout
+        self.assertLess(time.monotonic() - start, 3)
+        self.assertLessEqual(int(output), 1)  # only the burst token's call was made
+
+    def test_raises_when_all_providers_fail(self):
+        provider = DataProvider('stub', alpha_vantage_fetcher('key', self.base_url),
+                                retries=0)
+        with self.assertRaises(Exception) as context:
+            fetch_adjusted_close(['VTI', 'BAD'], [provider])
+        self.assertIn('BAD', str(context.exception))
+        self.assertIn('Invalid API call', str(context.exception))
+
+    def test_rate_limit_is_shared_across_threads(self):
+        calls = []
+        provider = DataProvider('stub', lambda ticker, recent: calls.append(time.monotonic())
+                                or pd.Series([1.0], index=pd.to_datetime(['2020-01-02'])),
+                                calls_per_minute=600, max_concurrency=8)  # 1 per 0.1s
+        fetch_adjusted_close([f'T{i}' for i in range(6)], [provider])
+        calls.sort()
+        self.assertGreaterEqual(calls[-1] - calls[0], 0.45)
+
+    def test_update_only_appends_new_days(self):
+        provider = DataProvider('stub', alpha_vantage_fetcher('key', self.base_url),
+                                retries=0)
+        prices = {'2020-01-02': 10.0, '2020-01-03': 11.0, '2020-01-06': 12.0}
+        StubAlphaVantage.prices = {'VTI': dict(prices)}
+        with tempfile.TemporaryDirectory() as data_path:
+            data_path += '/'
+            first_dates = update_adjusted_close(['VTI'], [provider], get_store(data_path))
+            self.assertEqual(first_dates['VTI'], pd.Timestamp('2020-01-02'))
+            # one new day arrives
+            StubAlphaVantage.prices['VTI']['2020-01-07'] = 13.0
+            update_adjusted_close(['VTI'], [provider], get_store(data_path))
+            self.assertEqual(StubAlphaVantage.requests[-1], ('VTI', 'compact'))
+            stored = read_and_validate_csv_time_series(data_path+'VTI.csv')
+            self.assertEqual(list(stored.adjusted_close), [10.0, 11.0, 12.0, 13.0])
+            with open(data_path+'price-store.json') as f:
+                self.assertEqual(json.load(f)['VTI']['last_date'], '2020-01-07')
+            # nothing new arrives
+            update_adjusted_close(['VTI'], [provider], get_store(data_path))
+            stored = read_and_validate_csv_time_series(data_path+'VTI.csv')
+            self.assertEqual(len(stored), 4)
+
+    def test_update_ignores_todays_partial_bar(self):
+        today = pd.Timestamp.today().normalize()
+        closes = {'value': 12.0}
+        requests = []
+
+        def fetch(ticker, recent):
+            requests.append(recent)
+            return pd.Series([10.0, 11.0, closes['value']],
+                             index=[today - pd.Timedelta(days=2), today - pd.Timedelta(days=1),
+                                    today])
+        provider = DataProvider('stub', fetch, retries=0)
+        with tempfile.TemporaryDirectory() as data_path:
+            data_path += '/'
+            update_adjusted_close(['VTI'], [provider], get_store(data_path))
+            stored = read_and_validate_csv_time_series(data_path+'VTI.csv')
+            self.assertEqual(list(stored.adjusted_close), [10.0, 11.0])
+            # today's close has moved since, but that isn't a restatement
+            closes['value'] = 12.5
+            update_adjusted_close(['VTI'], [provider], get_store(data_path))
+            self.assertEqual(requests, [False, True])
+
+    def test_update_refetches_adjusted_history(self):
+        provider = DataProvider('stub', alpha_vantage_fetcher('key', self.base_url),
+                                retries=0)
+        StubAlphaVantage.prices = {'VTI': {'2020-01-02': 10.0, '2020-01-03': 11.0,
+                                           '2020-01-06': 12.0}}
+        with tempfile.TemporaryDirectory() as data_path:
+            data_path += '/'
+            update_adjusted_close(['VTI'], [provider], get_store(data_path))
+            # a dividend re-adjusts the whole history, then a new day arrives
+            StubAlphaVantage.prices = {'VTI': {'2020-01-02': 9.0, '2020-01-03': 10.0,
+                                               '2020-01-06': 11.0, '2020-01-07': 12.0}}
+            update_adjusted_close(['VTI'], [provider], get_store(data_path))
+            self.assertEqual(StubAlphaVantage.requests[-2:],
+                             [('VTI', 'compact'), ('VTI', 'full')])
+            stored = read_and_validate_csv_time_series(data_path+'VTI.csv')
+            self.assertEqual(list(stored.adjusted_close), [9.0, 10.0, 11.0, 12.0])
+
+
+    def test_update_recovers_from_interrupted_run(self):
+        provider = DataProvider('stub', alpha_vantage_fetcher('key', self.base_url),
+                                retries=0)
+        StubAlphaVantage.prices = {'VTI': {'2020-01-02': 10.0, '2020-01-03': 11.0,
+                                           '2020-01-06': 12.0}}
+        with tempfile.TemporaryDirectory() as data_path:
+            data_path += '/'
+            store = get_store(data_path)
+            update_adjusted_close(['VTI'], [provider], store)
+            # a run appended a day, then stopped before saving the manifest
+            StubAlphaVantage.prices['VTI']['2020-01-07'] = 13.0
+            store.append('VTI', pd.Series([13.0], name='adjusted_close',
+                                          index=pd.DatetimeIndex(['2020-01-07'], name='date')))
+            StubAlphaVantage.prices['VTI']['2020-01-08'] = 14.0
+            # and a failing ticker doesn't stop VTI's manifest entry being saved
+            with self.assertRaisesRegex(Exception, 'BAD'):
+                update_adjusted_close(['BAD', 'VTI'], [provider], store)
+            self.assertEqual([request for request in StubAlphaVantage.requests[1:]
+                              if request[0] == 'VTI'], [('VTI', 'compact')])
+            stored = read_and_validate_csv_time_series(data_path+'VTI.csv')
+            self.assertEqual(list(stored.adjusted_close), [10.0, 11.0, 12.0, 13.0, 14.0])
+            with open(data_path+'price-store.json') as f:
+                self.assertEqual(json.load(f)['VTI']['last_date'], '2020-01-08')
+
+    def test_update_compares_closes_from_the_same_provider(self):
+        dates = pd.bdate_range('2020-01-02', periods=4)
+        calls = []
+        failing = {'first'}
+
+        def fetcher(name, scale):
+            def fetch(ticker, recent):
+                calls.append((name, recent))
+                if name in failing:
+                    raise Exception('unavailable')
+                # the providers adjust the history differently
+                return pd.Series([10.0, 11.0, 12.0, 13.0], index=dates) * scale
+            return fetch
+        providers = [DataProvider('first', fetcher('first', 1.0), retries=0),
+                     DataProvider('second', fetcher('second', 0.9), retries=0)]
+        with tempfile.TemporaryDirectory() as data_path:
+            data_path += '/'
+            update_adjusted_close(['VTI'], providers, get_store(data_path))
+            # the recent window comes from the provider of the stored history
+            failing.clear()
+            del calls[:]
+            update_adjusted_close(['VTI'], providers, get_store(data_path))
+            self.assertEqual(calls, [('second', True)])
+            # which can't be compared with another provider's closes
+            failing.add('second')
+            del calls[:]
+            update_adjusted_close(['VTI'], providers, get_store(data_path))
+            self.assertEqual(calls, [('second', True), ('first', True), ('second', False),
+                                     ('first', False)])
+            stored = read_and_validate_csv_time_series(data_path+'VTI.csv')
+            self.assertEqual(list(stored.adjusted_close), [10.0, 11.0, 12.0, 13.0])
+            with open(data_path+'price-store.json') as f:
+                self.assertEqual(json.load(f)['VTI']['provider'], 'first')
+
+
+class TestImportLongFormatPrices(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name + '/vendor.csv'
+        self.data_path = self.directory.name + '/data/'
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_vendor_file(self, rows):
+        pd.DataFrame(rows, columns=['Date', 'Symbol', 'AdjClose']).to_csv(self.path, index=False)
+
+    def test_imports_each_ticker_in_chunks(self):
+        self.write_vendor_file([('2020-01-03', 'AAA', 11.0), ('2020-01-02', 'BBB', 5.0),
+                                ('2020-01-02', 'AAA', 10.0), ('2020-01-06', 'BBB', 0.0),
+                                ('2020-01-07', 'BBB', 6.0), ('2020-01-06', 'CCC', 1.0),
+                                ('2020-01-06', 'AAA', 12.0)])
+        store = get_store(self.data_path)
+        first_dates = import_long_format_prices(self.path, store, ['AAA', 'BBB'], chunksize=2)
+        self.assertEqual(first_dates, {'AAA': pd.Timestamp('2020-01-02'),
+                                       'BBB': pd.Timestamp('2020-01-02')})
+        self.assertFalse(store.exists('CCC'))
+        self.assertEqual(list(store.read('AAA').adjusted_close), [10.0, 11.0, 12.0])
+        # the non-positive price is dropped
+        self.assertEqual(list(store.read('BBB').index),
+                         list(pd.to_datetime(['2020-01-02', '2020-01-07'])))
+        with open(self.data_path+'price-store.json') as f:
+            self.assertEqual(json.load(f)['AAA']['last_date'], '2020-01-06')
+
+    def test_rejects_duplicate_dates_across_chunks(self):
+        self.write_vendor_file([('2020-01-02', 'AAA', 10.0), ('2020-01-03', 'AAA', 11.0),
+                                ('2020-01-02', 'BBB', 5.0), ('2020-01-02', 'AAA', 10.5)])
+        with self.assertRaises(Exception) as context:
+            import_long_format_prices(self.path, get_store(self.data_path), chunksize=2)
+        self.assertIn('AAA', str(context.exception))
+
+    def test_bad_file_changes_nothing(self):
+        store = get_store(self.data_path)
+        self.write_vendor_file([('2020-01-02', 'AAA', 10.0), ('2020-01-03', 'AAA', 11.0)])
+        import_long_format_prices(self.path, store)
+        # AAA would be written first, but the later BBB has a duplicate date
+        self.write_vendor_file([('2019-12-31', 'AAA', 9.0), ('2020-01-02', 'AAA', 10.0),
+                                ('2020-01-02', 'BBB', 5.0), ('2020-01-02', 'BBB', 5.5)])
+        with self.assertRaisesRegex(Exception, 'BBB'):
+            import_long_format_prices(self.path, store)
+        self.assertEqual(list(store.read('AAA').adjusted_close), [10.0, 11.0])
+        self.assertFalse(store.exists('BBB'))
+
+    def test_custom_tickers_first_dates(self):
+        self.write_vendor_file([('2020-01-03', 'AAA', 11.0), ('2020-01-06', 'AAA', 12.0)])
+        store = get_store(self.data_path)
+        import_long_format_prices(self.path, store)
+        # saved by hand, so not in the manifest
+        store.write('BBB', pd.DataFrame({'adjusted_close': [1.0, 2.0]},
+                                        index=pd.to_datetime(['2020-01-07', '2020-01-08'])))
+        first_dates = download_daily_adjusted_price(['AAA', 'BBB'], [], store, ['AAA', 'BBB'])
+        self.assertEqual(first_dates, {'AAA': pd.Timestamp('2020-01-03'),
+                                       'BBB': pd.Timestamp('2020-01-07')})
+        with self.assertRaises(Exception) as context:
+            download_daily_adjusted_price(['AAA', 'ZZZ'], [], store, ['AAA', 'ZZZ'])
+        self.assertIn('ZZZ', str(context.exception))
+        self.assertIn('import-custom-data.py', str(context.exception))
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_allows_burst_then_waits(self):
+        bucket = TokenBucket(10, per=1.0, capacity=3)
+        start = time.monotonic()
+        for _ in range(3):
+            bucket.acquire()
+        self.assertLess(time.monotonic() - start, 0.05)
+        bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
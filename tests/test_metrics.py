@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+from metrics import (OnlinePerformanceStats, get_online_portfolio_stats,
+                     get_daily_simple_returns, get_batch_portfolio_returns,
+                     get_batch_portfolio_stats)
+from performance import (get_daily_portfolio_returns, get_portfolio_stats)
+import unittest
+
+
+class TestOnlinePerformanceStats(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(4)
+        index = pd.bdate_range('2010-01-01', periods=2000)
+        self.simple_returns = pd.DataFrame(
+            {'portfolio_simple_returns': rng.normal(0.0003, 0.01, 2000)}, index=index)
+        self.benchmark_simple_returns = pd.DataFrame(
+            {'benchmark': rng.normal(0.0004, 0.012, 2000)}, index=index)
+        cumulative_returns = (1 + self.simple_returns).cumprod() - 1
+        benchmark_cum_returns = (1 + self.benchmark_simple_returns).cumprod() - 1
+        self.expected = get_portfolio_stats(
+            cumulative_returns.rename(columns={'portfolio_simple_returns': 'returns'}),
+            self.simple_returns, benchmark_cum_returns, self.benchmark_simple_returns)
+
+    def test_chunks_match_full_history(self):
+        portfolio = OnlinePerformanceStats()
+        benchmark = OnlinePerformanceStats()
+        for start in range(0, 2000, 333):
+            portfolio.update(self.simple_returns.iloc[start:start + 333, 0])
+            benchmark.update(self.benchmark_simple_returns.iloc[start:start + 333, 0])
+        pd.testing.assert_frame_equal(get_online_portfolio_stats(portfolio, benchmark),
+                                      self.expected.astype(float), rtol=1e-9)
+
+    def test_one_day_at_a_time(self):
+        portfolio = OnlinePerformanceStats().update(self.simple_returns.iloc[:1500, 0])
+        for date, simple_return in self.simple_returns.iloc[1500:, 0].items():
+            portfolio.update(simple_return, date)
+        snapshot = portfolio.snapshot()
+        self.assertEqual(snapshot['days'], 2000)
+        for stat in ['annual_return', 'max_drawdown', 'return_risk_ratio']:
+            self.assertAlmostEqual(snapshot[stat], self.expected.loc['portfolio', stat])
+        growth = (1 + self.simple_returns.iloc[:, 0]).cumprod()
+        self.assertAlmostEqual(snapshot['current_drawdown'],
+                               growth.iloc[-1] / growth.max() - 1)
+
+
+class TestBatchPortfolioStats(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(5)
+        index = pd.bdate_range('2010-01-01', periods=1500)
+        self.daily_log_returns = pd.DataFrame(rng.normal(0.0003, 0.01, size=(1500, 4)),
+                                              index=index, columns=['A', 'B', 'C', 'D'])
+        self.weights = pd.DataFrame(rng.dirichlet(np.ones(4), size=20),
+                                    columns=['D', 'C', 'B', 'A'])
+
+    def test_matches_one_portfolio_at_a_time(self):
+        daily_simple_returns = get_daily_simple_returns(self.daily_log_returns)
+        simple_returns = get_batch_portfolio_returns(daily_simple_returns, self.weights)
+        self.assertEqual(simple_returns.shape, (1500, 20))
+        batch_stats = get_batch_portfolio_stats(simple_returns)
+        for k in [0, 7, 19]:
+            final_ticker_weights = self.weights.iloc[k].rename('weight').rename_axis('ticker')\
+                .reset_index()
+            portfolio_simple_returns, cumulative_returns = \
+                get_daily_portfolio_returns(self.daily_log_returns, final_ticker_weights)
+            expected = get_portfolio_stats(cumulative_returns, portfolio_simple_returns,
+                                           cumulative_returns, portfolio_simple_returns)
+            for stat in ['annual_return', 'max_drawdown', 'return_risk_ratio']:
+                self.assertAlmostEqual(batch_stats.iloc[k][stat], expected.loc['portfolio', stat])
+
+    def test_time_varying_weights(self):
+        daily_simple_returns = get_daily_simple_returns(self.daily_log_returns)
+        # the same weights every day match the constant weights
+        constant = self.weights[['A', 'B', 'C', 'D']].to_numpy()
+        varying = np.broadcast_to(constant, (1500, 20, 4))
+        np.testing.assert_allclose(
+            get_batch_portfolio_returns(daily_simple_returns, varying).to_numpy(),
+            get_batch_portfolio_returns(daily_simple_returns, self.weights).to_numpy())
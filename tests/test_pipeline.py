@@ -0,0 +1,98 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from market_data import DataProvider
+from pipeline import (PortfolioConfig, run_pipeline, load_returns, load_weights)
+import unittest
+
+
+def simulated_prices(ticker, recent=False):
+    """A random walk of adjusted close prices, different for each ticker."""
+    rng = np.random.default_rng(sum(map(ord, ticker)))
+    index = pd.bdate_range('2012-01-02', periods=1500, name='date')
+    returns = rng.normal(0.0003, 0.01 * (1 + rng.random()), size=len(index))
+    return pd.Series(100 * np.exp(np.cumsum(returns)), index=index, name='adjusted_close')
+
+
+class TestPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        path = self.directory.name + '/'
+        self.config = PortfolioConfig({
+            'PORTFOLIO_NAME': 'Test',
+            'DATA_PATH': path + 'data/',
+            'RESULTS_PATH': path + 'results/',
+            'BENCHMARK_TICKERS': ['VEA', 'VTI'],
+            'BENCHMARK_TICKER_WEIGHTS': [.4, .6],
+            'CUSTOM_DATA_LIST': [],
+            'ENVIRONMENTS': {'RISING_GROWTH': ['VEA', 'VTI', 'EEM'],
+                             'FALLING_GROWTH': ['BWX', 'TLT'],
+                             'RISING_INFLATION': ['GLD', 'DBC', 'EMB'],
+                             'FALLING_INFLATION': ['VEA', 'VTI', 'TLT']}})
+        self.requested = []
+
+        def fetch(ticker, recent):
+            self.requested.append(ticker)
+            return simulated_prices(ticker, recent)
+        self.providers = [DataProvider('simulated', fetch)]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_runs_in_memory(self):
+        results = run_pipeline(self.config, providers=self.providers)
+        # benchmark tickers are only downloaded once
+        self.assertEqual(sorted(self.requested), sorted(self.config.tickers))
+        self.assertEqual(list(results['daily_log_returns'].columns), self.config.tickers)
+        self.assertAlmostEqual(results['final_ticker_weights']['weight'].sum(), 1)
+        self.assertEqual(list(results['portfolio_stats'].index), ['portfolio', 'benchmark'])
+        # no intermediate checkpoints, only the results
+        results_path = self.config.results_path
+        self.assertTrue(os.path.exists(results_path + 'Test-performance_stats.csv'))
+        self.assertTrue(os.path.exists(results_path + 'Test-final-ticker-weights.csv'))
+        self.assertFalse(self.config.store.exists('Test-daily-log-returns-per-ticker'))
+        self.assertTrue(os.path.exists(results_path + 'Test-returns.png'))
+        with open(results_path + 'Test-run-report.json') as f:
+            report = json.load(f)
+        self.assertEqual([stage['stage'] for stage in report['stages']],
+                         ['fetch', 'weights', 'plots', 'assessment'])
+        self.assertEqual(report['solves']['count'], 5)  # 4 environments + between them
+        self.assertEqual(report['timers']['fetch.simulated']['calls'], 8)
+
+    def test_checkpoints_can_be_reloaded(self):
+        results = run_pipeline(self.config, checkpoint=True, providers=self.providers)
+        daily_log_returns, benchmark_simple_returns = load_returns(self.config)
+        pd.testing.assert_frame_equal(daily_log_returns, results['daily_log_returns'],
+                                      check_freq=False, check_names=False)
+        final_ticker_weights, _ = load_weights(self.config)
+        pd.testing.assert_frame_equal(final_ticker_weights, results['final_ticker_weights'])
+        # later stages re-run from the checkpoints, without downloading again
+        self.requested.clear()
+        rerun = run_pipeline(self.config, fetch=False)
+        self.assertEqual(self.requested, [])
+        pd.testing.assert_frame_equal(rerun['portfolio_stats'], results['portfolio_stats'])
+
+    def test_stats_only(self):
+        run_pipeline(self.config, providers=self.providers, plots=False)
+        results_path = self.config.results_path
+        self.assertTrue(os.path.exists(results_path + 'Test-performance_stats.csv'))
+        self.assertFalse(os.path.exists(results_path + 'Test-returns.png'))
+        self.assertFalse(os.path.exists(results_path + 'Test-drawdowns.png'))
+
+    def test_plots_in_background(self):
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            run_pipeline(self.config, providers=self.providers, plots=executor)
+        self.assertTrue(os.path.exists(self.config.results_path + 'Test-returns.png'))
+        self.assertTrue(os.path.exists(self.config.results_path + 'Test-drawdowns.png'))
+
+    def test_plotting_libraries_not_imported(self):
+        imported = subprocess.run(
+            [sys.executable, '-c', 'import sys, pipeline; print("plotnine" in sys.modules)'],
+            capture_output=True, text=True, check=True).stdout.strip()
+        self.assertEqual(imported, 'False')
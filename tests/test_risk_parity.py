@@ -1,6 +1,7 @@
 import numpy as np
 import pandas as pd
-from utils import (calc_risk_parity_weights)
+from utils import (calc_risk_parity_weights, calc_risk_parity_weights_batch,
+                   solve_spinu_newton)
 import unittest
 
 
@@ -41,3 +42,57 @@ class TestRiskParity(unittest.TestCase):
         self.assertAlmostEqual(3/2, weight_two/weight_three)
         # three should be given 1.333'x times the weight of 4
         self.assertAlmostEqual(4/3, weight_three/weight_four)
+
+
+class TestWarmStartedRiskParity(unittest.TestCase):
+
+    def setUp(self):
+        # 5 correlated assets with different volatilities
+        rng = np.random.default_rng(0)
+        returns = rng.normal(size=(2000, 5)) @ rng.normal(size=(5, 5)) * 0.01
+        self.cov = np.cov(returns, rowvar=False)
+
+    def test_matches_cold_solve(self):
+        cold_weights, _ = calc_risk_parity_weights(self.cov)
+        # start from a deliberately poor guess
+        warm_weights, risk_contributions = \
+            calc_risk_parity_weights(self.cov, np.array([.6, .1, .1, .1, .1]))
+        np.testing.assert_allclose(warm_weights, cold_weights, atol=1e-4)
+        np.testing.assert_allclose(risk_contributions, np.ones(5) / 5, atol=1e-8)
+
+    def test_converges_quickly_from_nearby_weights(self):
+        weights, _ = calc_risk_parity_weights(self.cov)
+        risk_budget = np.ones(5) / 5
+        _, iterations = solve_spinu_newton(self.cov * 1.01, risk_budget, weights)
+        self.assertLessEqual(iterations, 4)
+
+
+class TestBatchRiskParity(unittest.TestCase):
+
+    def setUp(self):
+        # a stack of 50 covariance matrices for 6 correlated assets
+        rng = np.random.default_rng(1)
+        returns = rng.normal(size=(50, 500, 6)) @ rng.normal(size=(6, 6)) * 0.01
+        centred = returns - returns.mean(axis=1, keepdims=True)
+        self.covs = np.einsum('tki,tkj->tij', centred, centred) / (500 - 1)
+
+    def test_matches_single_solves(self):
+        weights, risk_contributions, diagnostics = calc_risk_parity_weights_batch(self.covs)
+        self.assertTrue(diagnostics['converged'].all())
+        np.testing.assert_allclose(risk_contributions, np.ones((50, 6)) / 6, atol=1e-8)
+        for t in [0, 17, 49]:
+            expected, _ = calc_risk_parity_weights(self.covs[t])
+            np.testing.assert_allclose(weights[t], expected, atol=1e-4)
+
+    def test_per_matrix_risk_budgets(self):
+        risk_budgets = np.random.default_rng(2).dirichlet(np.ones(6), size=50)
+        _, risk_contributions, diagnostics = \
+            calc_risk_parity_weights_batch(self.covs, risk_budgets)
+        self.assertTrue(diagnostics['converged'].all())
+        np.testing.assert_allclose(risk_contributions, risk_budgets, atol=1e-8)
+
+    def test_reports_rather_than_raises(self):
+        _, _, diagnostics = calc_risk_parity_weights_batch(self.covs, max_iter=1)
+        self.assertFalse(diagnostics['converged'].any())
+        self.assertTrue((diagnostics['iterations'] == 1).all())
+        self.assertTrue((diagnostics['max_error'] > 0).all())
@@ -0,0 +1,79 @@
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from pipeline import PortfolioConfig
+from robustness import (get_block_bootstrap_indices, simulate_paths, solve_paths,
+                        run_robustness)
+from weights import (get_weights_within_environment, get_weights_between_environments,
+                     get_final_ticker_weights)
+import unittest
+
+
+class TestRobustness(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        path = self.directory.name + '/'
+        self.config = PortfolioConfig({
+            'PORTFOLIO_NAME': 'Test', 'DATA_PATH': path + 'data/',
+            'RESULTS_PATH': path + 'results/',
+            'BENCHMARK_TICKERS': ['A'], 'BENCHMARK_TICKER_WEIGHTS': [1],
+            'ENVIRONMENTS': {'ONE': ['A', 'B', 'C'], 'TWO': ['C', 'D'], 'THREE': ['A', 'E']}})
+        rng = np.random.default_rng(6)
+        index = pd.bdate_range('2012-01-02', periods=500, name='date')
+        self.daily_log_returns = pd.DataFrame(
+            rng.normal(0.0003, [0.005, 0.01, 0.015, 0.003, 0.008], size=(500, 5)),
+            index=index, columns=['A', 'B', 'C', 'D', 'E'])
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_block_bootstrap(self):
+        indices = get_block_bootstrap_indices(100, 3, 10, np.random.default_rng(0))
+        self.assertEqual(indices.shape, (3, 100))
+        self.assertTrue((indices >= 0).all() and (indices < 100).all())
+        # consecutive days within each block
+        self.assertTrue((np.diff(indices.reshape(3, 10, 10), axis=2) == 1).all())
+        paths = simulate_paths(self.daily_log_returns.to_numpy(), 4, 'normal',
+                               rng=np.random.default_rng(0))
+        self.assertEqual(paths.shape, (4, 500, 5))
+
+    def test_solve_paths_matches_weights(self):
+        members = {'ONE': [0, 1, 2], 'TWO': [2, 3], 'THREE': [0, 4]}
+        final_weights, _, converged = solve_paths(self.daily_log_returns.to_numpy()[np.newaxis],
+                                                  members)
+        within = get_weights_within_environment(self.daily_log_returns, self.config, False)
+        between = get_weights_between_environments(self.daily_log_returns, within,
+                                                   self.config, False)
+        expected = get_final_ticker_weights(within, between)['weight']
+        self.assertTrue(converged.all())
+        np.testing.assert_allclose(final_weights[0], expected.loc[self.config.tickers], atol=1e-5)
+
+    def test_run_robustness(self):
+        results, summary = run_robustness(self.config, self.daily_log_returns, n_paths=20,
+                                          batch_size=8, max_workers=2, seed=1)
+        self.assertEqual(len(results), 20)
+        self.assertTrue(results['converged'].all())
+        np.testing.assert_allclose(results['weight'].sum(axis=1), 1)
+        np.testing.assert_allclose(results['risk_contribution'].sum(axis=1), 1)
+        self.assertIn(('weight', 'A'), summary.index)
+        self.assertIn(('stat', 'max_drawdown'), summary.index)
+        self.assertEqual(list(summary.columns), ['mean', 'std', '5%', '50%', '95%'])
+        self.assertTrue(os.path.exists(self.config.results_path + 'Test-robustness.csv'))
+        # the same paths, whatever the number of workers
+        same, _ = run_robustness(self.config, self.daily_log_returns, n_paths=20,
+                                 batch_size=8, max_workers=1, seed=1)
+        pd.testing.assert_frame_equal(results, same)
+
+    def test_pairwise_returns(self):
+        # the NaNs of the 'pairwise' MISSING_DATA_POLICY don't spread into the results
+        returns = self.daily_log_returns.copy()
+        returns.iloc[::7, 1] = np.nan
+        results, _ = run_robustness(self.config, returns, n_paths=8, batch_size=8,
+                                    max_workers=1)
+        self.assertFalse(results.isna().any().any())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,200 @@
+import asyncio
+import json
+import tempfile
+import numpy as np
+import pandas as pd
+from market_data import DataProvider
+from pipeline import PortfolioConfig
+from service import (LivePortfolio, PortfolioService, provider_feed)
+from simulate import simulate_prices
+from storage import CsvStore
+from weights import (get_weights_within_environment, get_weights_between_environments)
+import unittest
+
+
+async def fake_feed(prices):
+    for date, row in prices.iterrows():
+        await asyncio.sleep(0)
+        yield date, row.to_dict()
+
+
+async def request(port, method, path, body=None):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    payload = json.dumps(body).encode() if body is not None else b''
+    writer.write(f'{method} {path} HTTP/1.1\r\nHost: localhost\r\n'
+                 f'Content-Length: {len(payload)}\r\n\r\n'.encode() + payload)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b'\r\n\r\n')
+    return int(head.split()[1]), json.loads(body)
+
+
+class TestLivePortfolio(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        path = self.directory.name + '/'
+        self.config = PortfolioConfig({
+            'PORTFOLIO_NAME': 'Test', 'DATA_PATH': path, 'RESULTS_PATH': path,
+            'BENCHMARK_TICKERS': ['A'], 'BENCHMARK_TICKER_WEIGHTS': [1],
+            'ENVIRONMENTS': {'ONE': ['A', 'B', 'C'], 'TWO': ['C', 'D'], 'THREE': ['A', 'E']}})
+        self.prices = simulate_prices(800, seed=5, drift=0.0002,
+                                      index=pd.bdate_range('2015-01-01', periods=800, name='date'))
+        self.daily_log_returns = np.log(self.prices / self.prices.shift(1)).dropna()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def live_portfolio(self, days, drift_threshold):
+        history = self.daily_log_returns.iloc[:days]
+        return LivePortfolio(self.config, history, self.prices.iloc[days].to_dict(),
+                             drift_threshold)
+
+    def with_settings(self, **settings):
+        self.config = PortfolioConfig(dict(self.config.settings, **settings))
+
+    def batch_weights(self, daily_log_returns):
+        within = get_weights_within_environment(daily_log_returns, self.config, False)
+        between = get_weights_between_environments(daily_log_returns, within, self.config, False)
+        return within['weight'].to_numpy(), between['weight'].to_numpy()
+
+    def test_updates_match_batch_weights(self):
+        portfolio = self.live_portfolio(600, drift_threshold=0)
+        within, between = self.batch_weights(self.daily_log_returns.iloc[:600])
+        np.testing.assert_allclose(np.concatenate(list(portfolio.within.values())), within)
+        np.testing.assert_allclose(portfolio.between, between)
+        for date, row in self.prices.iloc[601:700].iterrows():
+            self.assertTrue(portfolio.update(date, row.to_dict()))
+        # with no drift allowed, every bar re-solves to the batch weights
+        self.assertEqual(portfolio.solves, 100)
+        # up to the tolerance of rpp.vanilla.design, used by the batch weights
+        within, between = self.batch_weights(self.daily_log_returns.iloc[:699])
+        np.testing.assert_allclose(np.concatenate(list(portfolio.within.values())), within,
+                                   atol=1e-4)
+        np.testing.assert_allclose(portfolio.between, between, atol=1e-4)
+        self.assertAlmostEqual(portfolio.final_weights().sum(), 1)
+
+    def test_only_resolves_on_drift(self):
+        portfolio = self.live_portfolio(600, drift_threshold=0.01)
+        for date, row in self.prices.iloc[601:].iterrows():
+            portfolio.update(date, row.to_dict())
+            self.assertLessEqual(portfolio.drift, 0.01)
+        self.assertGreater(portfolio.solves, 1)
+        self.assertLess(portfolio.solves, 50)
+        # stale and incomplete bars aren't added
+        self.assertFalse(portfolio.update('2015-01-02', {'A': 1}))
+        self.assertFalse(portfolio.update('2100-01-01', {'A': 1}))
+
+    def test_other_covariance_estimators(self):
+        for estimator in ['ewma', 'ledoit_wolf']:
+            self.with_settings(COVARIANCE_ESTIMATOR=estimator, EWMA_HALFLIFE=60)
+            portfolio = self.live_portfolio(600, drift_threshold=0)
+            for date, row in self.prices.iloc[601:620].iterrows():
+                portfolio.update(date, row.to_dict())
+            within, between = self.batch_weights(self.daily_log_returns.iloc[:619])
+            np.testing.assert_allclose(np.concatenate(list(portfolio.within.values())), within,
+                                       atol=1e-4)
+            np.testing.assert_allclose(portfolio.between, between, atol=1e-4)
+
+    def test_trailing_window_is_kept_in_the_buffer(self):
+        self.with_settings(REBALANCE_FREQUENCY='monthly', LOOKBACK_WINDOW=250)
+        portfolio = self.live_portfolio(600, drift_threshold=0.01)
+        buffer_size = len(portfolio._buffer)
+        for date, row in self.prices.iloc[601:].iterrows():
+            portfolio.update(date, row.to_dict())
+        self.assertEqual(len(portfolio._buffer), buffer_size)
+        np.testing.assert_array_equal(portfolio.log_returns,
+                                      self.daily_log_returns.iloc[-250:].to_numpy())
+        np.testing.assert_allclose(portfolio.moments.covariance(),
+                                   self.daily_log_returns.iloc[-250:].cov().to_numpy())
+
+    def test_ffill_missing_data_policy(self):
+        self.with_settings(MISSING_DATA_POLICY='ffill', FFILL_LIMIT=1)
+        portfolio = self.live_portfolio(600, drift_threshold=0.02)
+        dates = self.prices.index[601:605]
+        partial = self.prices.loc[dates[0]].drop('B').to_dict()
+        # carried forward for one day, so B's return that day is 0
+        self.assertTrue(portfolio.update(dates[0], partial))
+        self.assertEqual(portfolio.log_returns[-1, 1], 0)
+        self.assertTrue(portfolio.update(dates[1], self.prices.loc[dates[1]].to_dict()))
+        # missing for longer than the limit, so its next price has no return
+        self.assertTrue(portfolio.update(dates[2], self.prices.loc[dates[2]].drop('B').to_dict()))
+        self.assertFalse(portfolio.update(dates[3], self.prices.loc[dates[3]].drop('B').to_dict()))
+        self.assertFalse(portfolio.update(self.prices.index[605],
+                                          self.prices.iloc[605].to_dict()))
+        self.assertTrue(portfolio.update(self.prices.index[606],
+                                         self.prices.iloc[606].to_dict()))
+
+    def test_feed_replays_bars_since_the_checkpoint(self):
+        # every ticker is custom data, so nothing is downloaded
+        self.with_settings(CUSTOM_DATA_LIST=['A', 'B', 'C', 'D', 'E'])
+        store = CsvStore(self.config.data_path)
+        for ticker in self.prices:
+            store.write(ticker, self.prices[[ticker]].iloc[:650]
+                        .rename(columns={ticker: 'adjusted_close'}))
+        portfolio = self.live_portfolio(600, drift_threshold=0.02)
+        expected = self.live_portfolio(600, drift_threshold=0.02)
+
+        async def first_poll():
+            feed = provider_feed(self.config, [], interval=0, last_date=portfolio.date)
+            return [await feed.__anext__() for _ in range(49)]
+
+        bars = asyncio.run(first_poll())
+        self.assertEqual([date for date, _ in bars], list(self.prices.index[601:650]))
+        for date, prices in bars:
+            self.assertTrue(portfolio.update(date, prices))
+        for date, row in self.prices.iloc[601:650].iterrows():
+            expected.update(date, row.to_dict())
+        np.testing.assert_allclose(portfolio.log_returns, expected.log_returns)
+        self.assertEqual(portfolio.date, self.prices.index[649])
+
+    def test_feed_waits_for_lagging_tickers(self):
+        self.with_settings(CUSTOM_DATA_LIST=[])
+        last_row = {ticker: 650 for ticker in self.prices}
+        last_row['B'] = 640  # B's prices arrive late
+        provider = DataProvider('stub', lambda ticker, recent:
+                                self.prices[ticker].iloc[:last_row[ticker]], retries=0)
+        portfolio = self.live_portfolio(600, drift_threshold=0.02)
+
+        async def polls():
+            feed = provider_feed(self.config, [provider], interval=0, last_date=portfolio.date)
+            first = [await feed.__anext__() for _ in range(39)]
+            last_row['B'] = 650
+            return first, [await feed.__anext__() for _ in range(10)]
+
+        first, second = asyncio.run(polls())
+        self.assertEqual([date for date, _ in first], list(self.prices.index[601:640]))
+        # the held back dates are yielded once B has caught up, with B's prices
+        self.assertEqual([date for date, _ in second], list(self.prices.index[640:650]))
+        for date, prices in second:
+            pd.testing.assert_series_equal(pd.Series(prices), self.prices.loc[date],
+                                           check_names=False)
+
+    def test_service_with_fake_feed(self):
+        service = PortfolioService(self.live_portfolio(600, drift_threshold=0.02))
+
+        async def run():
+            server = await service.serve(port=0)
+            port = server.sockets[0].getsockname()[1]
+            async with server:
+                await service.consume(fake_feed(self.prices.iloc[601:650]))
+                status, snapshot = await request(port, 'GET', '/weights')
+                self.assertEqual(status, 200)
+                self.assertEqual(snapshot['date'], self.prices.index[649].strftime('%Y-%m-%d'))
+                self.assertAlmostEqual(sum(snapshot['weights'].values()), 1)
+                date = self.prices.index[650]
+                status, snapshot = await request(
+                    port, 'POST', '/update',
+                    {'date': date.strftime('%Y-%m-%d'), 'prices': self.prices.loc[date].to_dict()})
+                self.assertEqual(snapshot['date'], date.strftime('%Y-%m-%d'))
+                status, _ = await request(port, 'GET', '/missing')
+                self.assertEqual(status, 404)
+                status, _ = await request(port, 'POST', '/update', {'date': 'x'})
+                self.assertEqual(status, 400)
+
+        asyncio.run(run())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import tempfile
+import numpy as np
+import pandas as pd
+from storage import get_store
+import unittest
+
+
+class TestStorage(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name + '/'
+        index = pd.bdate_range('2015-01-01', periods=300, name='date')
+        self.returns = pd.DataFrame(np.random.default_rng(0).normal(size=(300, 3)),
+                                    index=index, columns=['VTI', 'TLT', 'GLD'])
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_round_trip_every_format(self):
+        for storage_format in ['csv', 'parquet', 'npy']:
+            store = get_store(self.path, storage_format)
+            # written out of order, read back sorted
+            store.write('returns', self.returns.iloc[::-1])
+            self.assertTrue(store.exists('returns'))
+            pd.testing.assert_frame_equal(store.read('returns'), self.returns,
+                                          check_freq=False)
+
+    def test_append_every_format(self):
+        for storage_format in ['csv', 'parquet', 'npy']:
+            store = get_store(self.path, storage_format)
+            store.write('VTI', self.returns['VTI'].iloc[:200].rename('adjusted_close'))
+            store.append('VTI', self.returns['VTI'].iloc[200:].rename('adjusted_close'))
+            pd.testing.assert_series_equal(store.read('VTI')['adjusted_close'],
+                                           self.returns['VTI'].rename('adjusted_close'),
+                                           check_freq=False)
+
+    def test_rejects_stale_appends_every_format(self):
+        for storage_format in ['csv', 'parquet', 'npy']:
+            store = get_store(self.path, storage_format)
+            store.write('VTI', self.returns['VTI'].iloc[:200].rename('adjusted_close'))
+            for rows in [self.returns['VTI'].iloc[150:250],  # overlaps the stored rows
+                         self.returns['VTI'].iloc[[210, 205]],  # out of order
+                         self.returns['VTI'].iloc[[210, 210]]]:
+                with self.assertRaises(Exception):
+                    store.append('VTI', rows.rename('adjusted_close'))
+            self.assertEqual(len(store.read('VTI')), 200)
+
+    def test_rejects_duplicate_dates(self):
+        store = get_store(self.path, 'npy')
+        with self.assertRaises(Exception):
+            store.write('returns', pd.concat([self.returns, self.returns.iloc[:1]]))
+
+    def test_export_csv(self):
+        store = get_store(self.path, 'npy')
+        store.write('returns', self.returns)
+        store.export_csv('returns')
+        pd.testing.assert_frame_equal(get_store(self.path, 'csv').read('returns'),
+                                      self.returns, check_freq=False)
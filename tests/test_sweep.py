@@ -0,0 +1,59 @@
+import tempfile
+import numpy as np
+import pandas as pd
+from pipeline import PortfolioConfig
+from sweep import (expand_grid, evaluate_variant, run_sweep)
+import unittest
+
+
+class TestSweep(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        path = self.directory.name + '/'
+        self.config = PortfolioConfig({
+            'PORTFOLIO_NAME': 'Test',
+            'DATA_PATH': path + 'data/',
+            'RESULTS_PATH': path + 'results/',
+            'BENCHMARK_TICKERS': ['A', 'B'],
+            'BENCHMARK_TICKER_WEIGHTS': [.4, .6],
+            'CUSTOM_DATA_LIST': [],
+            'ENVIRONMENTS': {'ONE': ['A', 'B', 'C'], 'TWO': ['C', 'D'],
+                             'THREE': ['A', 'E']}})
+        rng = np.random.default_rng(3)
+        index = pd.bdate_range('2012-01-02', periods=800, name='date')
+        self.daily_log_returns = pd.DataFrame(
+            rng.normal(0.0003, [0.005, 0.01, 0.015, 0.003, 0.008], size=(800, 5)),
+            index=index, columns=['A', 'B', 'C', 'D', 'E'])
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_expand_grid(self):
+        variants = expand_grid({'LOOKBACK_WINDOW': [252, 504],
+                                'REBALANCE_FREQUENCY': ['monthly', 'quarterly', None]})
+        self.assertEqual(len(variants), 6)
+        self.assertIn({'LOOKBACK_WINDOW': 504, 'REBALANCE_FREQUENCY': None}, variants)
+
+    def test_matches_serial_evaluation(self):
+        variants = expand_grid({'LOOKBACK_WINDOW': [252],
+                                'REBALANCE_FREQUENCY': ['monthly', None]})
+        variants.append({'ENVIRONMENTS': {'ONE': ['A', 'D'], 'TWO': ['B', 'E']},
+                         'BENCHMARK_TICKER_WEIGHTS': [.5, .5]})
+        sweep_stats = run_sweep(self.config, variants, self.daily_log_returns,
+                                max_workers=2)
+        self.assertEqual(list(sweep_stats.index.get_level_values('variant').unique()),
+                         ['Test-000', 'Test-001', 'Test-002'])
+        for i, overrides in enumerate(variants):
+            expected = evaluate_variant(PortfolioConfig(dict(self.config.settings, **overrides)),
+                                        self.daily_log_returns, None)
+            actual = sweep_stats.loc[f'Test-{i:03d}', list(expected.columns)]
+            np.testing.assert_allclose(actual.to_numpy(dtype=float),
+                                       expected.to_numpy(dtype=float))
+        saved = pd.read_csv(self.config.results_path + 'Test-sweep-performance_stats.csv')
+        self.assertEqual(len(saved), 6)
+
+    def test_rejects_tickers_missing_from_panel(self):
+        with self.assertRaises(Exception):
+            run_sweep(self.config, [{'ENVIRONMENTS': {'ONE': ['A', 'Z']}}],
+                      self.daily_log_returns, max_workers=1)
@@ -0,0 +1,64 @@
+import tempfile
+import numpy as np
+import pandas as pd
+from covariance import estimate_covariance
+from storage import CsvStore
+from time_series import (get_returns_panel, get_log_returns_series, read_adjusted_close)
+import unittest
+
+
+class TestReturnsPanel(unittest.TestCase):
+
+    def setUp(self):
+        index = pd.bdate_range('2020-01-01', periods=10, name='date')
+        self.adjusted_close = pd.DataFrame({
+            'A': 100 * 1.01**np.arange(10),
+            'B': [50, 51, np.nan, np.nan, np.nan, 52, 53, 54, 55, 56],
+            'C': [np.nan, np.nan, 10, 11, 12, 13, 12, 11, np.nan, 12]}, index=index)
+
+    def test_intersection(self):
+        returns = get_returns_panel(self.adjusted_close)
+        self.assertEqual(list(returns.index), list(self.adjusted_close.index[[5, 6, 7, 9]]))
+        # a ticker's return is from its own previous trading day
+        self.assertAlmostEqual(returns['B'].iloc[0], np.log(52 / 51))
+        self.assertAlmostEqual(returns['C'].iloc[-1], np.log(12 / 11))
+        simple = get_returns_panel(self.adjusted_close, kind='simple')
+        np.testing.assert_allclose(simple, np.expm1(returns))
+
+    def test_ffill_limit(self):
+        returns = get_returns_panel(self.adjusted_close, missing_data='ffill', ffill_limit=2)
+        # B's price is carried forward to day 3, but its 3 day gap is longer
+        # than the limit, so its returns only restart on day 6
+        self.assertEqual(list(returns.index), list(self.adjusted_close.index[[3, 6, 7, 8, 9]]))
+        self.assertEqual(returns['B'].iloc[0], 0)
+        self.assertEqual(returns['C'].iloc[3], 0)  # carried forward on day 8
+        unlimited = get_returns_panel(self.adjusted_close, missing_data='ffill')
+        self.assertEqual(unlimited.index[0], self.adjusted_close.index[3])
+
+    def test_pairwise(self):
+        returns = get_returns_panel(self.adjusted_close, missing_data='pairwise',
+                                    start=self.adjusted_close.index[1])
+        self.assertEqual(len(returns), 9)
+        self.assertTrue(returns['B'].isna().any())
+        np.testing.assert_allclose(estimate_covariance(returns.to_numpy()),
+                                   returns.cov().to_numpy())
+        with self.assertRaises(Exception):
+            get_returns_panel(self.adjusted_close, missing_data='drop')
+
+    def test_log_returns_series_from_store(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = CsvStore(directory + '/')
+            for ticker in self.adjusted_close:
+                store.write(ticker, self.adjusted_close[[ticker]].dropna()
+                            .rename(columns={ticker: 'adjusted_close'}))
+            pd.testing.assert_frame_equal(read_adjusted_close(['A', 'B', 'C'], store),
+                                          self.adjusted_close, check_freq=False)
+            returns = get_log_returns_series(['A', 'B', 'C'], '2020-01-03', store, 'Test-',
+                                             checkpoint=True)
+            pd.testing.assert_frame_equal(store.read('Test-daily-log-returns-per-ticker'),
+                                          returns, check_freq=False, check_names=False)
+            self.assertEqual(len(returns), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
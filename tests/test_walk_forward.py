@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+from covariance import RollingCovariance
+from simulate import simulate_log_returns
+from walk_forward import (get_rebalance_dates, get_walk_forward_weights,
+                          get_walk_forward_portfolio_returns)
+import unittest
+
+
+class TestRollingCovariance(unittest.TestCase):
+
+    def test_matches_full_recompute(self):
+        returns = simulate_log_returns(n_days=1000, seed=1).to_numpy()
+        rolling = RollingCovariance(returns.shape[1])
+        rolling.add(returns[:250])
+        for end in range(260, 1000, 10):
+            rolling.add(returns[end - 10:end])
+            rolling.drop(returns[end - 260:end - 250])
+            expected = np.cov(returns[end - 250:end], rowvar=False)
+            np.testing.assert_allclose(rolling.covariance(), expected, rtol=1e-9, atol=1e-15)
+
+
+class TestWalkForward(unittest.TestCase):
+
+    def setUp(self):
+        self.daily_log_returns = simulate_log_returns(n_days=1000, seed=1)
+        self.environments = {'ONE': ['A', 'B', 'C'], 'TWO': ['C', 'D'], 'THREE': ['A', 'E']}
+
+    def test_rebalance_dates(self):
+        index = self.daily_log_returns.index
+        positions = get_rebalance_dates(index, 'monthly', 100)
+        self.assertTrue(all(positions >= 100))
+        self.assertTrue(all(index[positions].month != index[positions - 1].month))
+        self.assertLess(len(get_rebalance_dates(index, 'quarterly', 100)), len(positions))
+
+    def test_weights_sum_to_one(self):
+        weights = get_walk_forward_weights(self.daily_log_returns, self.environments,
+                                           250, 'quarterly')
+        self.assertEqual(list(weights.columns), ['A', 'B', 'C', 'D', 'E'])
+        np.testing.assert_allclose(weights.sum(axis=1), 1)
+
+    def test_other_covariance_estimators(self):
+        for estimator in ['ewma', 'ledoit_wolf']:
+            weights = get_walk_forward_weights(self.daily_log_returns, self.environments,
+                                               250, 'quarterly', estimator, halflife=60)
+            np.testing.assert_allclose(weights.sum(axis=1), 1)
+
+    def test_history_shorter_than_window(self):
+        with self.assertRaises(Exception) as context:
+            get_walk_forward_weights(self.daily_log_returns.iloc[:200], self.environments,
+                                     250, 'monthly')
+        self.assertIn('LOOKBACK_WINDOW = 250', str(context.exception))
+        self.assertIn('200', str(context.exception))
+        with self.assertRaises(Exception):
+            get_walk_forward_portfolio_returns(self.daily_log_returns,
+                                               pd.DataFrame(columns=['A', 'B']))
+
+    def test_no_look_ahead(self):
+        weights = get_walk_forward_weights(self.daily_log_returns, self.environments,
+                                           250, 'monthly')
+        # changing returns on and after a rebalance date can't change its weights
+        rebalance_date = weights.index[5]
+        changed = self.daily_log_returns.copy()
+        changed.loc[changed.index >= rebalance_date] *= 3
+        changed_weights = get_walk_forward_weights(changed, self.environments,
+                                                   250, 'monthly')
+        pd.testing.assert_frame_equal(weights.loc[:rebalance_date],
+                                      changed_weights.loc[:rebalance_date])
+
+    def test_portfolio_returns_start_at_first_rebalance(self):
+        weights = get_walk_forward_weights(self.daily_log_returns, self.environments,
+                                           250, 'monthly')
+        simple_returns, cumulative_returns = \
+            get_walk_forward_portfolio_returns(self.daily_log_returns, weights)
+        self.assertEqual(simple_returns.index[0], weights.index[0])
+        first_day = np.exp(self.daily_log_returns.loc[weights.index[0]]) - 1
+        self.assertAlmostEqual(simple_returns.iloc[0, 0], first_day @ weights.iloc[0])
+        self.assertEqual(list(cumulative_returns.columns), ['returns'])
@@ -0,0 +1,63 @@
+import tempfile
+import numpy as np
+import pandas as pd
+from pipeline import PortfolioConfig
+from weights import (EnvironmentWeights, calc_environment_weights,
+                     get_weights_within_environment, get_weights_between_environments,
+                     get_final_ticker_weights)
+import unittest
+
+
+class TestEnvironmentWeights(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name + '/'
+        self.config = PortfolioConfig({
+            'PORTFOLIO_NAME': 'Test', 'DATA_PATH': self.path, 'RESULTS_PATH': self.path,
+            'BENCHMARK_TICKERS': ['A'], 'BENCHMARK_TICKER_WEIGHTS': [1],
+            'ENVIRONMENTS': {'ONE': ['B', 'A', 'C'], 'TWO': ['C', 'D'], 'THREE': ['A', 'E']}})
+        rng = np.random.default_rng(7)
+        self.daily_log_returns = pd.DataFrame(
+            rng.normal(0.0003, [0.005, 0.01, 0.015, 0.003, 0.008], size=(500, 5)),
+            index=pd.bdate_range('2012-01-02', periods=500, name='date'),
+            columns=['A', 'B', 'C', 'D', 'E'])
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_membership(self):
+        environment_weights = EnvironmentWeights(self.config.environments)
+        self.assertEqual(environment_weights.tickers, ['B', 'A', 'C', 'D', 'E'])
+        np.testing.assert_array_equal(environment_weights.membership(),
+                                      [[1, 1, 1, 0, 0], [0, 0, 1, 1, 0], [0, 1, 0, 0, 1]])
+        environment_weights.set_within(1, [.3, .7], [.5, .5])
+        np.testing.assert_array_equal(environment_weights.within_weights(1), [.3, .7])
+        np.testing.assert_array_equal(environment_weights.within[1], [0, 0, .3, .7, 0])
+
+    def test_matches_the_dataframe_functions(self):
+        within = get_weights_within_environment(self.daily_log_returns, self.config, False)
+        between = get_weights_between_environments(self.daily_log_returns, within,
+                                                   self.config, False)
+        environment_weights = calc_environment_weights(self.daily_log_returns, self.config,
+                                                       checkpoint=True)
+        frames = environment_weights.to_frames()
+        pd.testing.assert_frame_equal(frames[0], within)
+        pd.testing.assert_frame_equal(frames[1], between)
+        # A is in two environments, so its final weight sums both
+        final = environment_weights.final_ticker_weights()
+        between_weights, within_weights = between['weight'].to_numpy(), within['weight'].to_numpy()
+        self.assertAlmostEqual(final.loc['A', 'weight'],
+                               between_weights[0] * within_weights[1]
+                               + between_weights[2] * within_weights[5])
+        pd.testing.assert_frame_equal(final, get_final_ticker_weights(within, between))
+        # and back from the .csv files
+        from_csv = EnvironmentWeights.from_frames(
+            pd.read_csv(self.path + 'Test-weights_within_environment.csv'),
+            pd.read_csv(self.path + 'Test-weights_between_environments.csv'))
+        np.testing.assert_allclose(from_csv.final_weights(), environment_weights.final_weights())
+        self.assertEqual(from_csv.environments, ['ONE', 'TWO', 'THREE'])
+
+
+if __name__ == '__main__':
+    unittest.main()
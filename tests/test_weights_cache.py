@@ -0,0 +1,98 @@
+import os
+import tempfile
+from unittest import mock
+import numpy as np
+import pandas as pd
+from pipeline import PortfolioConfig
+from simulate import simulate_log_returns
+from weights import (get_weights_within_environment, get_weights_between_environments)
+from weights_cache import WeightsCache
+import unittest
+
+
+class TestWeightsCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name + '/'
+        self.daily_log_returns = simulate_log_returns(seed=3)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_key_depends_on_every_input(self):
+        cache = WeightsCache(self.path)
+        returns = self.daily_log_returns[['A', 'B']]
+        key = cache.key(returns)
+        self.assertEqual(key, cache.key(returns.copy()))
+        self.assertNotEqual(key, cache.key(returns.iloc[1:]))
+        self.assertNotEqual(key, cache.key(returns * 2))
+        self.assertNotEqual(key, cache.key(returns.set_axis(['A', 'C'], axis=1)))
+        self.assertNotEqual(key, cache.key(returns, 'ewma', 60))
+        self.assertNotEqual(key, cache.key(returns, risk_budget=np.array([.3, .7])))
+        # a block of a larger sample covariance matrix doesn't depend on the other tickers
+        self.assertEqual(key, cache.key(returns, universe=self.daily_log_returns))
+        ledoit_wolf = cache.key(returns, 'ledoit_wolf', universe=self.daily_log_returns)
+        self.assertNotEqual(ledoit_wolf, cache.key(returns, 'ledoit_wolf',
+                                                   universe=self.daily_log_returns[['A', 'B']]))
+
+    def test_evicts_least_recently_used(self):
+        cache = WeightsCache(self.path, max_entries=2)
+        for i, key in enumerate(['first', 'second']):
+            cache.put(key, np.array([i, 1.]), np.array([.5, .5]))
+            os.utime(cache.file(key), (i, i))
+        self.assertIsNotNone(cache.get('first'))  # now more recently used than 'second'
+        cache.put('third', np.array([2, 1.]), np.array([.5, .5]))
+        self.assertIsNone(cache.get('second'))
+        np.testing.assert_array_equal(cache.get('first')[0], [0, 1])
+        self.assertEqual(cache.stats(), {'hits': 2, 'misses': 1, 'entries': 2})
+
+    def test_repeat_run_skips_solves(self):
+        config = PortfolioConfig({
+            'PORTFOLIO_NAME': 'Test', 'DATA_PATH': self.path, 'RESULTS_PATH': self.path,
+            'BENCHMARK_TICKERS': ['A'], 'BENCHMARK_TICKER_WEIGHTS': [1],
+            'WEIGHTS_CACHE_SIZE': 100,
+            'ENVIRONMENTS': {'ONE': ['A', 'B', 'C'], 'TWO': ['C', 'D'], 'THREE': ['A', 'E']}})
+
+        def weights():
+            within = get_weights_within_environment(self.daily_log_returns, config, False,
+                                                    weights_cache=config.weights_cache)
+            between = get_weights_between_environments(self.daily_log_returns, within, config,
+                                                       False, weights_cache=config.weights_cache)
+            return within, between
+
+        first = weights()
+        self.assertEqual(config.weights_cache.stats(), {'hits': 0, 'misses': 4, 'entries': 4})
+        with mock.patch('weights.calc_risk_parity_weights') as solve:
+            second = weights()
+        solve.assert_not_called()
+        self.assertEqual(config.weights_cache.stats(), {'hits': 4, 'misses': 4, 'entries': 4})
+        for expected, cached in zip(first, second):
+            pd.testing.assert_frame_equal(expected, cached)
+
+
+    def test_shared_environment_with_other_tickers(self):
+        # the Ledoit-Wolf shrinkage of ONE's block depends on the other tickers
+        def config(environments):
+            return PortfolioConfig({
+                'PORTFOLIO_NAME': 'Test', 'DATA_PATH': self.path, 'RESULTS_PATH': self.path,
+                'BENCHMARK_TICKERS': ['A'], 'BENCHMARK_TICKER_WEIGHTS': [1],
+                'WEIGHTS_CACHE_SIZE': 100, 'COVARIANCE_ESTIMATOR': 'ledoit_wolf',
+                'ENVIRONMENTS': environments})
+
+        first = config({'ONE': ['A', 'B'], 'TWO': ['C']})
+        second = config({'ONE': ['A', 'B'], 'TWO': ['D', 'E']})
+        for portfolio in [first, second]:
+            tickers = portfolio.tickers
+            get_weights_within_environment(self.daily_log_returns[tickers], portfolio, False,
+                                           weights_cache=portfolio.weights_cache)
+        tickers = second.tickers
+        cached = get_weights_within_environment(self.daily_log_returns[tickers], second, False,
+                                                weights_cache=second.weights_cache)
+        fresh = get_weights_within_environment(self.daily_log_returns[tickers], second, False)
+        self.assertEqual(second.weights_cache.hits, 2)
+        pd.testing.assert_frame_equal(cached, fresh)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+from datetime import datetime, timedelta
+import pandas as pd
+import numpy as np
+from market_data import (get_stored_first_dates, update_adjusted_close)
+
+
+def download_daily_adjusted_price(tickers, providers, store, custom_data_list):
+    """
+    Inputs:
+    - List of stock tickers
+    - List of DataProvider to download from, in order of preference
+    - 'custom_data_list': tickers not downloaded, whose prices are already
+        in the store, e.g. imported by import-custom-data.py
+    Outputs:
+    - Each ticker's daily adjusted close price time series saved in the store,
+        only downloading the days since the last run where possible.
+    - Returns a dict of each downloaded or custom ticker's first date.
+    """
+    custom_tickers = [ticker for ticker in tickers if ticker in custom_data_list]
+    tickers = [ticker for ticker in tickers if ticker not in custom_data_list]
+    first_dates = update_adjusted_close(tickers, providers, store)
+    first_dates.update(get_stored_first_dates(custom_tickers, store))
+    return first_dates
+
+
+def read_adjusted_close(tickers, store):
+    """
+    Reads each ticker's adjusted close prices, saved by
+    download_daily_adjusted_price(), into one DataFrame with a column per
+    ticker, aligned on the union of their trading days in a single concat.
+    """
+    return pd.concat({ticker: store.read(ticker)['adjusted_close'] for ticker in tickers},
+                     axis=1).sort_index()
+
+
+def get_returns_panel(adjusted_close, start=None, end=None, kind='log',
+                      missing_data='intersection', ffill_limit=None):
+    """
+    Inputs:
+    - 'adjusted_close' DataFrame from read_adjusted_close()
+    - 'start' and 'end': first and last dates of returns to keep
+    - 'kind': 'log' or 'simple' returns
+    - 'missing_data': what to do with days a ticker has no price on
+        - 'intersection': each ticker's return is from its own previous
+            trading day, and only days every ticker traded on are kept
+        - 'ffill': carry prices forward for up to 'ffill_limit' days (None
+            for no limit), then keep the days every ticker has a return on
+        - 'pairwise': like 'intersection' but the missing returns are left as
+            NaN, so each pair of tickers' covariance uses the days both traded
+    - 'ffill_limit': see 'ffill'
+
+    Outputs:
+    - DataFrame of returns, one column per ticker, computed for the whole
+        matrix at once
+    """
+    if missing_data == 'ffill':
+        prices = adjusted_close.ffill(limit=ffill_limit)
+        previous = prices.shift(1)
+    elif missing_data in ('intersection', 'pairwise'):
+        prices = adjusted_close
+        previous = adjusted_close.ffill().shift(1)
+    else:
+        raise Exception(f'Error! Unknown MISSING_DATA_POLICY "{missing_data}", '
+                        'use "intersection", "ffill" or "pairwise"')
+    if kind == 'log':
+        returns = np.log(prices.to_numpy() / previous.to_numpy())
+    else:
+        returns = prices.to_numpy() / previous.to_numpy() - 1
+    returns = pd.DataFrame(returns, index=prices.index, columns=prices.columns)
+    if start is not None:
+        returns = returns.loc[returns.index >= start]
+    if end is not None:
+        returns = returns.loc[returns.index <= end]
+    if missing_data == 'pairwise':
+        return returns.dropna(how='all')
+    return returns.dropna()
+
+
+def get_log_returns_series(tickers, max_first_date, store, portfolio_name, checkpoint=True,
+                           missing_data='intersection', ffill_limit=None):
+    """
+    Inputs:
+    - List containing stock tickers
+        representing the price series downloaded and saved by
+        download_daily_adjusted_price().
+    - Maximum start date out of all the time series in the list
+    - 'missing_data' and 'ffill_limit': the missing data policy, see
+        get_returns_panel()
+
+    Outputs:
+    -  Returns (and, if 'checkpoint', saves in the store) one dataframe
+        containing the the daily log returns of each ticker, date rows with
+        missing data are removed (or, for 'pairwise', left as NaN).
+    """
+    #set max date to yesterday
+    max_last_date = (datetime.now() - timedelta(1)).strftime('%Y-%m-%d')
+    df_merge = get_returns_panel(read_adjusted_close(tickers, store), max_first_date,
+                                 max_last_date, 'log', missing_data, ffill_limit)
+    if checkpoint:
+        store.write(portfolio_name+'daily-log-returns-per-ticker', df_merge)
+    return df_merge
+
+
+def get_benchmark_daily_returns(benchmark_tickers, benchmark_ticker_weights, \
+                                max_first_date, store, portfolio_name, checkpoint=True,
+                                missing_data='intersection', ffill_limit=None):
+    """
+    Reads the benchmark tickers' adjusted close prices, already saved by
+    download_daily_adjusted_price(), and returns (and, if 'checkpoint', saves
+    in the store) the weighted benchmark simple daily returns. The benchmark
+    needs every ticker's return each day, so 'pairwise' is treated as
+    'intersection'.
+    """
+    if missing_data == 'pairwise':
+        missing_data = 'intersection'
+    max_last_date = (datetime.now() - timedelta(1)).strftime('%Y-%m-%d')
+    adjusted_close = read_adjusted_close(benchmark_tickers, store)
+    # as before, the first benchmark return is the day after max_first_date
+    adjusted_close = adjusted_close.loc[adjusted_close.index >= max_first_date]
+    daily_simple_returns = get_returns_panel(adjusted_close, max_first_date, max_last_date,
+                                             'simple', missing_data, ffill_limit)
+    benchmark_simple_returns = daily_simple_returns.to_numpy() @ benchmark_ticker_weights
+    benchmark_simple_returns = pd.DataFrame({'benchmark': benchmark_simple_returns}, \
+                                             index=daily_simple_returns.index)
+    if checkpoint:
+        store.write(portfolio_name+'benchmark-simple-returns', benchmark_simple_returns)
+    return benchmark_simple_returns
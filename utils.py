@@ -1,24 +1,34 @@
+import time
 import numpy as np
 import pandas as pd
 import riskparityportfolio as rpp
+from instrumentation import (record_solve, timed)
 
 
+@timed('read_csv')
 def read_and_validate_csv_time_series(path):
     df = pd.read_csv(path, index_col=0)
-    if any(df.index.duplicated()):
+    return validate_time_series(df, path)
+
+
+def validate_time_series(df, path):
+    if df.index.duplicated().any():
         raise Exception(f'\nDirty Data!\n\n\
             There are duplicated dates or timestamps in\n\n\
             {path}\n\n\
             Each date or timestamp should only appear once in the timeseries\n')
-    df.index = pd.to_datetime(df.index)  # change index to type datetime
+    if not isinstance(df.index, pd.DatetimeIndex):
+        df.index = pd.to_datetime(df.index)  # change index to type datetime
     df = df.sort_index(ascending=True)  # sort starting with earliest date/timestamp
     return df
 
 
-def calc_risk_parity_weights(cov):
+def calc_risk_parity_weights(cov, initial_weights=None):
     """
     Inputs:
     - 'cov': a covariance matrix (numpy.ndarray) from n log-returns time-series 
+    - 'initial_weights': optional weights (numpy.ndarray) to warm-start the
+        solve from, e.g. the weights found at the previous rebalance date
 
     Outputs:
     - 'weights': capital weight % needed, for each time-series from cov, to achieve the risk budget (i.e. risk parity)
@@ -27,9 +37,115 @@ def calc_risk_parity_weights(cov):
     # create the desired risk budgeting vector (i.e. equal risk contributions)
     risk_budget = np.ones(len(cov)) / len(cov)
     # get the portfolio weights
-    weights = rpp.vanilla.design(cov, risk_budget)
+    start = time.perf_counter()
+    if initial_weights is None:
+        weights = rpp.vanilla.design(cov, risk_budget)
+        record_solve(len(cov), 'rpp.vanilla', time.perf_counter() - start)
+    else:
+        weights, iterations = solve_spinu_newton(cov, risk_budget, initial_weights)
+        record_solve(len(cov), 'newton', time.perf_counter() - start, int(iterations))
     # check risk contributions
     risk_contributions = (weights @ (cov * weights)) / np.sum((weights @ (cov * weights)))
     if (not np.array_equal(risk_contributions.round(2), risk_budget.round(2))):
         raise Exception('Error! The risk contributions do not match the risk budget')
-    return weights, risk_contributions
\ No newline at end of file
+    return weights, risk_contributions
+
+
+def solve_spinu_newton(cov, risk_budget, initial_weights, tol=1e-12, max_iter=100):
+    """
+    Solves the same convex risk budgeting problem as rpp.vanilla.design, i.e.
+    Spinu (2013): minimise 0.5*x'*cov*x - sum(risk_budget*log(x)), with a
+    damped Newton method that starts from 'initial_weights'. Starting from a
+    nearby solution (e.g. yesterday's weights) usually converges in 2-3 steps.
+
+    Inputs:
+    - 'cov': a covariance matrix (numpy.ndarray)
+    - 'risk_budget': desired risk contribution of each asset, summing to 1
+    - 'initial_weights': positive starting weights (numpy.ndarray)
+
+    Outputs:
+    - 'weights': capital weights summing to 1
+    - 'iterations': number of Newton steps taken
+    """
+    weights, iterations, _ = _solve_spinu_newton_batch(cov[np.newaxis], risk_budget[np.newaxis],
+                                                       np.asarray(initial_weights, dtype=float)[np.newaxis],
+                                                       tol, max_iter)
+    return weights[0], iterations[0]
+
+
+def calc_risk_parity_weights_batch(covs, risk_budgets=None, initial_weights=None,
+                                   tol=1e-12, max_iter=100):
+    """
+    Vectorized version of calc_risk_parity_weights() for a whole stack of
+    covariance matrices, e.g. one per rebalance date or per parameter set.
+    All the matrices are solved together by the same damped Newton iteration
+    as solve_spinu_newton(), so T problems cost a handful of array operations
+    rather than T Python-level calls.
+
+    Inputs:
+    - 'covs': (T, n, n) numpy.ndarray of covariance matrices
+    - 'risk_budgets': optional (n,) or (T, n) risk budgets, each summing to 1,
+        default is equal risk contributions (i.e. risk parity)
+    - 'initial_weights': optional (n,) or (T, n) weights to warm-start from,
+        default is inverse-volatility weights
+
+    Outputs:
+    - 'weights': (T, n) capital weights, each row summing to 1
+    - 'risk_contributions': (T, n) risk % contributed by each asset
+    - 'diagnostics': dict of (T,) arrays, 'converged', 'iterations' and
+        'max_error' (largest absolute gap between risk contribution and
+        budget). Unlike calc_risk_parity_weights() nothing is raised, so
+        check 'converged' before using the weights.
+    """
+    covs = np.asarray(covs, dtype=float)
+    n_matrices, n_assets = covs.shape[:2]
+    if risk_budgets is None:
+        risk_budgets = np.ones(n_assets) / n_assets
+    risk_budgets = np.broadcast_to(np.asarray(risk_budgets, dtype=float),
+                                   (n_matrices, n_assets))
+    if initial_weights is None:
+        initial_weights = 1 / np.sqrt(np.diagonal(covs, axis1=1, axis2=2))
+    initial_weights = np.broadcast_to(np.asarray(initial_weights, dtype=float),
+                                      (n_matrices, n_assets))
+    start = time.perf_counter()
+    weights, iterations, converged = \
+        _solve_spinu_newton_batch(covs, risk_budgets, initial_weights, tol, max_iter)
+    record_solve(n_assets, 'newton_batch', time.perf_counter() - start, int(iterations.sum()))
+    risk = weights * np.einsum('tij,tj->ti', covs, weights)
+    risk_contributions = risk / risk.sum(axis=1, keepdims=True)
+    diagnostics = {'converged': converged,
+                   'iterations': iterations,
+                   'max_error': np.abs(risk_contributions - risk_budgets).max(axis=1)}
+    return weights, risk_contributions, diagnostics
+
+
+def _solve_spinu_newton_batch(covs, risk_budgets, initial_weights, tol, max_iter):
+    x = np.array(initial_weights, dtype=float)
+    # fall back to equal weights for any unusable starting point
+    bad_start = np.any(~(x > 0), axis=1)
+    x[bad_start] = 1 / x.shape[1]
+    # rescale each start along its own ray onto the optimal scale, x'*cov*x = sum(b)
+    x *= np.sqrt(risk_budgets.sum(axis=1) / np.einsum('ti,tij,tj->t', x, covs, x))[:, np.newaxis]
+    iterations = np.zeros(len(x), dtype=int)
+    converged = np.zeros(len(x), dtype=bool)
+    active = np.arange(len(x))
+    for _ in range(max_iter):
+        cov, budget, x_active = covs[active], risk_budgets[active], x[active]
+        gradient = np.einsum('tij,tj->ti', cov, x_active) - budget / x_active
+        hessian = cov.copy()
+        hessian[:, np.arange(x.shape[1]), np.arange(x.shape[1])] += budget / x_active**2
+        step = np.linalg.solve(hessian, gradient[..., np.newaxis])[..., 0]
+        decrement = np.einsum('ti,ti->t', gradient, step)  # squared Newton decrement
+        # damped step while far from the optimum, and never leave x > 0
+        step_size = np.where(decrement < 0.25, 1, 1 / (1 + np.sqrt(np.abs(decrement))))
+        with np.errstate(divide='ignore'):
+            boundary = np.where(step > 0, x_active / step, np.inf).min(axis=1)
+        step_size = np.minimum(step_size, 0.5 * boundary)
+        x[active] = x_active - step_size[:, np.newaxis] * step
+        iterations[active] += 1
+        done = decrement / 2 <= tol
+        converged[active[done]] = True
+        active = active[~done]
+        if len(active) == 0:
+            break
+    return x / x.sum(axis=1, keepdims=True), iterations, converged
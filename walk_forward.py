@@ -0,0 +1,141 @@
+import numpy as np
+import pandas as pd
+from covariance import (EwmaCovariance, RollingCovariance, estimate_covariance,
+                        ledoit_wolf_covariance)
+from utils import calc_risk_parity_weights
+
+
+def get_rebalance_dates(index, frequency, window):
+    """
+    Inputs:
+    - 'index': the DatetimeIndex of the daily log returns
+    - 'frequency': how often to rebalance, one of 'monthly', 'quarterly' or
+        'annually'
+    - 'window': number of trailing trading days used to estimate the weights
+
+    Outputs:
+    - positions (numpy.ndarray of ints) into 'index' of the first trading day
+        of each period, skipping any that don't have 'window' days before them
+    """
+    if frequency == 'monthly':
+        period = index.year * 12 + index.month
+    elif frequency == 'quarterly':
+        period = index.year * 4 + (index.month - 1) // 3
+    elif frequency == 'annually':
+        period = index.year
+    else:
+        raise Exception(f'Error! Unknown rebalance frequency "{frequency}", '
+                        'use "monthly", "quarterly" or "annually"')
+    period = np.asarray(period)
+    first_days = np.flatnonzero(np.diff(period) != 0) + 1
+    return first_days[first_days >= window]
+
+
+def get_walk_forward_weights(daily_log_returns, environments, window, frequency,
+                             estimator='sample', halflife=None):
+    """
+    Inputs:
+    - 'daily_log_returns' DataFrame with log returns series for each ticker
+    - 'environments' dict of economic environments and their tickers, e.g.
+        {'RISING_GROWTH': ['VEA', 'VTI', 'EEM'], etc.}
+    - 'window': number of trailing trading days used to estimate the weights
+    - 'frequency': 'monthly', 'quarterly' or 'annually'
+    - 'estimator' and 'halflife': the covariance estimator, see
+        covariance.estimate_covariance(). 'ewma' uses every day before the
+        rebalance date, with the older days decayed away, instead of the window
+
+    Outputs:
+    - 'walk_forward_weights' DataFrame, one row per rebalance date and one
+        column per ticker, holding the final all-weather ticker weights.
+        The weights on each date only use the 'window' days before it, so
+        they can be traded from that date on without look-ahead.
+
+    The ticker covariance matrix is updated incrementally between rebalance
+    dates, each environment is served as a sub-block of it, and every risk
+    parity solve is warm-started from the previous date's weights.
+    """
+    tickers = list(dict.fromkeys(ticker for environment in environments
+                                 for ticker in environments[environment]))
+    columns = {ticker: i for i, ticker in enumerate(tickers)}
+    members = {environment: [columns[ticker] for ticker in environments[environment]]
+               for environment in environments}
+    # the rolling estimates need every ticker's return each day
+    daily_log_returns = daily_log_returns[tickers].dropna()
+    log_returns = daily_log_returns.to_numpy()
+    simple_returns = np.exp(log_returns) - 1
+    positions = get_rebalance_dates(daily_log_returns.index, frequency, window)
+    if len(positions) == 0:
+        raise Exception(f'Error! No {frequency} rebalance date has LOOKBACK_WINDOW = {window} '
+                        f'trading days before it, the returns only have {len(daily_log_returns)}. '
+                        'Use a shorter LOOKBACK_WINDOW or a longer history')
+
+    rolling = RollingCovariance(len(tickers))
+    ewma = EwmaCovariance(len(tickers), halflife) if estimator == 'ewma' else None
+    start, end = 0, 0
+    previous_within = {}
+    previous_between = None
+    rows = []
+    for position in positions:
+        if estimator == 'ewma':
+            cov = ewma.add(log_returns[end:position]).covariance()
+        elif estimator == 'ledoit_wolf':
+            cov = ledoit_wolf_covariance(log_returns[position - window:position])
+        else:
+            # slide the window to the 'window' rows before the rebalance date
+            if position - window >= end:
+                rolling = RollingCovariance(len(tickers))
+                rolling.add(log_returns[position - window:position])
+            else:
+                rolling.add(log_returns[end:position])
+                rolling.drop(log_returns[start:position - window])
+            cov = rolling.covariance()
+        start, end = position - window, position
+
+        environment_log_returns = np.empty((window, len(environments)))
+        for i, environment in enumerate(environments):
+            idx = members[environment]
+            weights, _ = calc_risk_parity_weights(cov[np.ix_(idx, idx)],
+                                                  previous_within.get(environment))
+            previous_within[environment] = weights
+            environment_log_returns[:, i] = \
+                np.log1p(simple_returns[start:end, idx] @ weights)
+        between_cov = estimate_covariance(environment_log_returns, estimator, halflife)
+        previous_between, _ = calc_risk_parity_weights(between_cov, previous_between)
+
+        final_weights = np.zeros(len(tickers))
+        for i, environment in enumerate(environments):
+            np.add.at(final_weights, members[environment],
+                      previous_between[i] * previous_within[environment])
+        rows.append(final_weights)
+
+    return pd.DataFrame(rows, columns=tickers,
+                        index=daily_log_returns.index[positions])
+
+
+def get_walk_forward_portfolio_returns(daily_log_returns, walk_forward_weights):
+    """
+    Inputs:
+    - 'daily_log_returns' DataFrame with log returns series for each ticker
+    - 'walk_forward_weights' DataFrame from get_walk_forward_weights()
+
+    Outputs:
+    - 'portfolio_simple_returns' DataFrame, holding each rebalance date's
+        weights until the next rebalance date, starting at the first one
+    - 'portfolio_cumulative_returns' DataFrame
+    """
+    if len(walk_forward_weights) == 0:
+        raise Exception('Error! There are no walk-forward weights, the history is shorter '
+                        'than LOOKBACK_WINDOW')
+    daily_simple_returns = daily_log_returns[list(walk_forward_weights.columns)].dropna()\
+        .apply(np.exp) - 1
+    daily_simple_returns = \
+        daily_simple_returns.loc[daily_simple_returns.index >= walk_forward_weights.index[0]]
+    w = walk_forward_weights.reindex(daily_simple_returns.index).ffill()
+    portfolio_simple_returns = np.sum(daily_simple_returns.to_numpy() * w.to_numpy(), axis=1)
+    portfolio_simple_returns = \
+        pd.DataFrame({'portfolio_simple_returns': portfolio_simple_returns},
+                     index=daily_simple_returns.index)
+    portfolio_cumulative_returns = (1 + portfolio_simple_returns).cumprod() - 1
+    portfolio_cumulative_returns = portfolio_cumulative_returns. \
+        rename(columns={"portfolio_simple_returns": "returns"})
+    return portfolio_simple_returns, portfolio_cumulative_returns
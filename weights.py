@@ -0,0 +1,268 @@
+import pandas as pd
+import numpy as np
+from covariance import (CovarianceCache, estimate_covariance)
+from utils import (calc_risk_parity_weights)
+
+
+class EnvironmentWeights:
+    """
+    The within- and between-environment weights as arrays: 'within' is an
+    environments x tickers matrix holding each environment's ticker weights
+    (zero for tickers outside it), 'between' the environments' weights, so
+    the final ticker weights are one vector-matrix product. 'members' holds
+    the integer positions of each environment's tickers, in the order they're
+    listed in, so an environment's weights are one slice of its row.
+
+    to_frames() and from_frames() convert to and from the long
+    weights_within_environment / weights_between_environments layout saved
+    as .csv files.
+    """
+
+    def __init__(self, environments):
+        """'environments': dict of environment -> list of its tickers."""
+        self.environments = list(environments)
+        self.tickers = list(dict.fromkeys(ticker for tickers in environments.values()
+                                          for ticker in tickers))
+        columns = {ticker: i for i, ticker in enumerate(self.tickers)}
+        self.members = [np.array([columns[ticker] for ticker in environments[environment]],
+                                 dtype=np.intp)
+                        for environment in self.environments]
+        shape = (len(self.environments), len(self.tickers))
+        self.within = np.zeros(shape)
+        self.within_risk_contributions = np.zeros(shape)
+        self.between = np.zeros(len(self.environments))
+        self.between_risk_contributions = np.zeros(len(self.environments))
+
+    def membership(self):
+        """Boolean environments x tickers matrix, True where a ticker is in an environment."""
+        membership = np.zeros(self.within.shape, dtype=bool)
+        for i, idx in enumerate(self.members):
+            membership[i, idx] = True
+        return membership
+
+    def environment_tickers(self, i):
+        return [self.tickers[j] for j in self.members[i]]
+
+    def set_within(self, i, weights, risk_contributions):
+        self.within[i, self.members[i]] = weights
+        self.within_risk_contributions[i, self.members[i]] = risk_contributions
+
+    def within_weights(self, i):
+        return self.within[i, self.members[i]]
+
+    def final_weights(self):
+        """Each ticker's final weight, in the order of 'tickers'."""
+        return self.between @ self.within
+
+    def final_ticker_weights(self):
+        """'final_ticker_weights' DataFrame, indexed by ticker, like get_final_ticker_weights()."""
+        return pd.DataFrame({'weight': self.final_weights()},
+                            index=pd.Index(self.tickers, name='ticker')).sort_index()
+
+    def to_frames(self):
+        """Returns the 'weights_within_environment' and 'weights_between_environments' DataFrames."""
+        weights_within_environment = pd.DataFrame({
+            'environment': np.repeat(self.environments, [len(idx) for idx in self.members]),
+            'ticker': [self.tickers[j] for idx in self.members for j in idx],
+            'weight': np.concatenate([self.within[i, idx] for i, idx in enumerate(self.members)]),
+            'risk_contribution': np.concatenate([self.within_risk_contributions[i, idx]
+                                                 for i, idx in enumerate(self.members)])},
+            index=np.concatenate([np.arange(len(idx)) for idx in self.members]))
+        weights_between_environments = pd.DataFrame({
+            'environment': self.environments,
+            'weight': self.between,
+            'risk_contribution': self.between_risk_contributions})
+        return weights_within_environment, weights_between_environments
+
+    @classmethod
+    def from_frames(cls, weights_within_environment, weights_between_environments=None):
+        """Builds the arrays from the DataFrames (or .csv files) of to_frames()."""
+        groups = list(weights_within_environment.groupby('environment', sort=False))
+        environment_weights = cls({environment: list(group['ticker'])
+                                   for environment, group in groups})
+        for i, (_, group) in enumerate(groups):
+            environment_weights.set_within(i, group['weight'].to_numpy(),
+                                           group['risk_contribution'].to_numpy())
+        if weights_between_environments is not None:
+            between = weights_between_environments.set_index('environment')\
+                .loc[environment_weights.environments]
+            environment_weights.between = between['weight'].to_numpy()
+            environment_weights.between_risk_contributions = \
+                between['risk_contribution'].to_numpy()
+        return environment_weights
+
+
+def _get_cached_solution(weights_cache, returns, config, universe=None):
+    """Returns the cache key and cached (weights, risk_contributions), or None."""
+    if weights_cache is None:
+        return None, None
+    key = weights_cache.key(returns, config.covariance_estimator, config.ewma_halflife,
+                            universe=universe)
+    return key, weights_cache.get(key)
+
+
+def solve_within_environments(daily_log_returns, config, covariance_cache=None,
+                              weights_cache=None):
+    """
+    Inputs: as get_weights_within_environment()
+
+    Outputs:
+    - EnvironmentWeights of config.environments, with the weights within
+        each environment set
+    """
+    environment_weights = EnvironmentWeights(config.environments)
+    if covariance_cache is None:
+        covariance_cache = CovarianceCache(daily_log_returns)
+    start, end = daily_log_returns.index[0], daily_log_returns.index[-1]
+    universe = None
+    if weights_cache is not None:
+        # the rows of the panel the covariance cache estimates the matrix from
+        universe = covariance_cache.daily_log_returns
+        universe = universe.loc[(universe.index >= start) & (universe.index <= end)]
+    for i in range(len(environment_weights.environments)):
+        tickers = environment_weights.environment_tickers(i)
+        key, solution = _get_cached_solution(weights_cache, daily_log_returns[tickers], config,
+                                             universe)
+        if solution is None:
+            # the environment's block of the covariance matrix (numpy.ndarray) of all the tickers
+            cov = covariance_cache.get(tickers, start, end,
+                                       config.covariance_estimator, config.ewma_halflife)
+            # take cov as input and calculate the capital weight %'s needed to achieve the risk parity across assets, within the environment:
+            solution = calc_risk_parity_weights(cov)
+            if weights_cache is not None:
+                weights_cache.put(key, *solution)
+        environment_weights.set_within(i, *solution)
+    return environment_weights
+
+
+def solve_between_environments(daily_log_returns, environment_weights, config,
+                               checkpoint=True, weights_cache=None):
+    """
+    Inputs: as get_weights_between_environments(), but with the
+    EnvironmentWeights from solve_within_environments()
+
+    Outputs:
+    - the same EnvironmentWeights, with the weights between environments set
+    - if 'checkpoint', saves the weighted simple and log daily returns for
+        each environment sub-portfolio in the store
+    """
+    # need simple returns for combinding into weighted portfolios
+    daily_simple_returns = np.expm1(daily_log_returns[environment_weights.tickers].to_numpy())
+    environment_simple_returns = np.column_stack([
+        daily_simple_returns[:, idx] @ environment_weights.within[i, idx]
+        for i, idx in enumerate(environment_weights.members)])
+    df_merge = pd.DataFrame(environment_simple_returns, index=daily_log_returns.index,
+                            columns=environment_weights.environments)
+    if checkpoint:
+        config.store.write(config.portfolio_name+'weighted-simple-returns-per-environment', df_merge)
+    # convert to log returns per environment:
+    weighted_log_returns = np.log1p(df_merge)
+    if checkpoint:
+        config.store.write(config.portfolio_name+'weighted-log-returns-per-environment',
+                           weighted_log_returns)
+    key, solution = _get_cached_solution(weights_cache, weighted_log_returns, config)
+    if solution is None:
+        # creates a covariance matrix (numpy.ndarray) from the 4 environment ime-series of weighted log returns
+        cov = estimate_covariance(weighted_log_returns.to_numpy(),
+                                  config.covariance_estimator, config.ewma_halflife)
+        # take cov as input and calculate the capital weight %'s needed to achieve the risk parity across assets, within the environment:
+        solution = calc_risk_parity_weights(cov)
+        if weights_cache is not None:
+            weights_cache.put(key, *solution)
+    environment_weights.between, environment_weights.between_risk_contributions = solution
+    return environment_weights
+
+
+def calc_environment_weights(daily_log_returns, config, checkpoint=True,
+                             covariance_cache=None, weights_cache=None):
+    """
+    Both levels of the all-weather weights as EnvironmentWeights, without
+    going through the DataFrames. If 'checkpoint', saves the same files as
+    get_weights_within_environment() and get_weights_between_environments().
+    """
+    environment_weights = solve_within_environments(daily_log_returns, config,
+                                                    covariance_cache, weights_cache)
+    solve_between_environments(daily_log_returns, environment_weights, config,
+                               checkpoint, weights_cache)
+    if checkpoint:
+        weights_within_environment, weights_between_environments = environment_weights.to_frames()
+        weights_within_environment.to_csv(
+            config.data_path+config.portfolio_name+'weights_within_environment.csv', index=False)
+        weights_between_environments.to_csv(
+            config.data_path+config.portfolio_name+'weights_between_environments.csv', index=False)
+    return environment_weights
+
+
+def get_weights_within_environment(daily_log_returns, config, checkpoint=True,
+                                   covariance_cache=None, weights_cache=None):
+    """
+    Inputs:
+    - 'daily_log_returns' dataframe from the fetch stage (saved in the store
+        by get-ticker-time-series.py)
+    - 'config': PortfolioConfig, using its 'environments', 'data_path',
+        'portfolio_name', 'covariance_estimator' and 'ewma_halflife'
+        - 'environments' is a dict of economic environments and their tickers,
+            e.g. {'RISING_GROWTH': ['VEA', 'VTI', 'EEM'], etc.}
+    - 'covariance_cache': optional CovarianceCache of daily_log_returns (or
+        of a panel holding more tickers), to share between calls
+    - 'weights_cache': optional WeightsCache of earlier solutions
+
+    Outputs:
+    - returns 'weights_within_environment' DataFrame
+    - if 'checkpoint', saves weights_within_environment dataframe as a .csv,
+        containing the weights for each ticker WITHIN each environment
+    """
+    environment_weights = solve_within_environments(daily_log_returns, config,
+                                                    covariance_cache, weights_cache)
+    df_merge, _ = environment_weights.to_frames()
+    if checkpoint:
+        df_merge.to_csv(config.data_path+config.portfolio_name+'weights_within_environment.csv',
+                        index=False)
+    return df_merge
+
+
+def get_weights_between_environments(daily_log_returns, weights_within_environment,
+                                     config, checkpoint=True, weights_cache=None):
+    """
+    Inputs:
+    - 'daily_log_returns' dataframe from the fetch stage
+    - 'weights_within_environment' datafame returned by
+        get_weights_within_environment()
+    - 'config': PortfolioConfig, using its 'data_path', 'store' and
+        'portfolio_name'
+    - 'weights_cache': optional WeightsCache of earlier solutions
+
+    Outputs:
+    - returns 'weights_between_environments' DataFrame
+    - if 'checkpoint', saves 3 files:
+        - the weighted simple daily returns for each environment sub-portfoli
+            (in the store)
+        - the weighted log daily returns for each environment sub-portfolio
+            (in the store)
+        - a .csv of weights for each environment, showing the contribution of each
+            environment/sub-portfolio to the final all-weather portfolio
+    """
+    environment_weights = EnvironmentWeights.from_frames(weights_within_environment)
+    solve_between_environments(daily_log_returns, environment_weights, config,
+                               checkpoint, weights_cache)
+    _, weights_between_environments = environment_weights.to_frames()
+    if checkpoint:
+        weights_between_environments.to_csv(config.data_path+config.portfolio_name
+                                            +'weights_between_environments.csv', index=False)
+    return weights_between_environments
+
+
+def get_final_ticker_weights(weights_within_environment, weights_between_environments):
+    """
+    Inputs:
+    - 'weights_within_environment' DataFrame from
+        get_weights_within_environment() function
+    - 'weights_between_environments' DataFrame from
+        get_weights_between_environments() function
+
+    Outputs:
+    - returns 'final_ticker_weights' DataFrame, indexed by ticker, containing
+        the final ticker weights for the all-weather portfolio
+    """
+    return EnvironmentWeights.from_frames(weights_within_environment,
+                                          weights_between_environments).final_ticker_weights()
@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+
+
+class WeightsCache:
+    """
+    On-disk cache of risk parity solutions, so re-running the weights with
+    unchanged returns and settings (or sweep variants sharing environments)
+    skips the covariance estimates and solves. Each solution is stored as
+    <key>.npz, where the key is a hash of everything the solution depends on:
+    the returns window (values, dates and tickers), the covariance estimator
+    and the risk budget. The least recently used solutions are evicted once
+    there are more than 'max_entries', e.g.
+
+        cache = WeightsCache('data/weights-cache/')
+        key = cache.key(daily_log_returns[tickers], 'sample')
+        solution = cache.get(key)
+        if solution is None:
+            solution = calc_risk_parity_weights(cov)
+            cache.put(key, *solution)
+        cache.stats()
+    """
+
+    version = 1  # bump when the solutions change for the same inputs
+
+    def __init__(self, path, max_entries=1000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        if not os.path.exists(path):
+            os.makedirs(path, exist_ok=True)
+
+    def key(self, returns, estimator='sample', halflife=None, risk_budget=None, universe=None):
+        """
+        Inputs:
+        - 'returns': DataFrame of the log returns window the solution is
+            estimated from, with the environment's tickers as columns
+        - 'estimator' and 'halflife': the covariance estimator
+        - 'risk_budget': optional, default equal risk contributions
+        - 'universe': DataFrame the covariance matrix is estimated from, if
+            the solution uses a block of a larger matrix (see
+            CovarianceCache). Ledoit-Wolf shrinkage, and the days dropped for
+            NaNs by 'ewma' and 'ledoit_wolf', depend on every ticker in it, so
+            its returns are part of the key for those estimators.
+
+        Outputs:
+        - hex digest identifying the solution
+        """
+        values = np.ascontiguousarray(returns.to_numpy(dtype=float))
+        if risk_budget is None:
+            risk_budget = np.ones(values.shape[1]) / values.shape[1]
+        digest = hashlib.sha256()
+        if estimator == 'sample':
+            universe = None  # each pair's covariance only depends on its own columns
+        digest.update(json.dumps([self.version, [str(c) for c in returns.columns],
+                                  estimator, halflife,
+                                  None if universe is None else
+                                  [str(c) for c in universe.columns]]).encode())
+        if universe is not None:
+            digest.update(pd.DatetimeIndex(universe.index).asi8.tobytes())
+            digest.update(np.ascontiguousarray(universe.to_numpy(dtype=float)).tobytes())
+        digest.update(pd.DatetimeIndex(returns.index).asi8.tobytes())
+        digest.update(values.tobytes())
+        digest.update(np.ascontiguousarray(risk_budget, dtype=float).tobytes())
+        return digest.hexdigest()
+
+    def file(self, key):
+        return os.path.join(self.path, key + '.npz')
+
+    def get(self, key):
+        """Returns the cached (weights, risk_contributions), or None."""
+        try:
+            with np.load(self.file(key)) as solution:
+                weights, risk_contributions = solution['weights'], solution['risk_contributions']
+            os.utime(self.file(key))  # mark as recently used
+        except (OSError, KeyError, ValueError):
+            # missing, evicted by another process or unreadable
+            self.misses += 1
+            return None
+        self.hits += 1
+        return weights, risk_contributions
+
+    def put(self, key, weights, risk_contributions):
+        # write to a temporary file first, so other processes never read half a file
+        fd, temp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, weights=weights, risk_contributions=risk_contributions)
+        os.replace(temp, self.file(key))
+        self.evict()
+
+    def evict(self):
+        """Removes the least recently used solutions beyond 'max_entries'."""
+        entries = []
+        for entry in os.scandir(self.path):
+            if entry.name.endswith('.npz'):
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except FileNotFoundError:  # evicted by another process
+                    pass
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort()
+        for _, path in entries[:len(entries) - self.max_entries]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        """Returns a dict of the 'hits', 'misses' and 'entries' in the cache."""
+        entries = sum(1 for name in os.listdir(self.path) if name.endswith('.npz'))
+        return {'hits': self.hits, 'misses': self.misses, 'entries': entries}